@@ -1,7 +1,12 @@
-from api.models import SessionKey
+from api.models import SessionKey, TokenGeneration
 from django.contrib import admin
 
 
 @admin.register(SessionKey)
 class SessionKeyAdmin(admin.ModelAdmin):
     list_display = ['user', 'key']
+
+
+@admin.register(TokenGeneration)
+class TokenGenerationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'generation']
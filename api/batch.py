@@ -0,0 +1,50 @@
+from django.http import HttpRequest
+import json
+import re
+
+REFERENCE_REGEX = re.compile(r'^\$(\d+)((?:\.[A-Za-z0-9_]+)*)$')
+
+
+class BatchOperationFailed(Exception):
+    def __init__(self, index, result):
+        super().__init__(f'operation #{index} failed')
+        self.index = index
+        self.result = result
+
+
+def resolve_references(value, results):
+    """
+    Replaces '$<index>.<path>' strings (e.g. '$0.workout_session.id') with values from results of earlier operations.
+    :param value - operation params (or any nested part of them)
+    :param results (list) - results of the operations executed so far
+    """
+    if isinstance(value, dict):
+        return {key: resolve_references(item, results) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [resolve_references(item, results) for item in value]
+    elif isinstance(value, str):
+        match = REFERENCE_REGEX.match(value)
+        if match is None:
+            return value
+        index = int(match.group(1))
+        if index >= len(results):
+            raise ValueError(f'reference {value} points to an operation that has not been executed yet')
+        resolved = results[index]
+        for key in match.group(2).split('.')[1:]:
+            if isinstance(resolved, list) and key.isdigit() and int(key) < len(resolved):
+                resolved = resolved[int(key)]
+            elif isinstance(resolved, dict) and key in resolved:
+                resolved = resolved[key]
+            else:
+                raise ValueError(f'reference {value} cannot be resolved')
+        return resolved
+    return value
+
+
+def make_sub_request(request, params):
+    sub_request = HttpRequest()
+    sub_request.method = 'POST'
+    sub_request.META = request.META
+    sub_request.path = request.path
+    sub_request._body = json.dumps(params).encode('utf8')
+    return sub_request
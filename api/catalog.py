@@ -0,0 +1,154 @@
+from workoutnote_django import models as wn_models
+from django.db.models.signals import post_save, post_delete
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified
+from django.dispatch import receiver
+from django.conf import settings
+from types import MappingProxyType
+import threading
+import time
+import json
+
+VERSION_CHECK_INTERVAL = getattr(settings, 'API_CATALOG_VERSION_CHECK_INTERVAL', 5)  # seconds
+
+_version = None  # (version, time.monotonic() it was read at)
+_encoded_catalogs = {}  # version -> {'exercises': bytes, 'body_parts': bytes}
+_registries = {}  # version -> ExerciseRegistry
+_lock = threading.Lock()
+
+
+class ExerciseRegistry:
+    """
+    Immutable in-memory snapshot of exercises (with body parts & categories) and body parts, indexed by id and name.
+    Shared between requests of a worker, hence must not be modified.
+    """
+
+    def __init__(self, exercises, body_parts):
+        self.exercises = tuple(exercises)
+        self.body_parts = tuple(body_parts)
+        self._exercises_by_id = MappingProxyType({exercise.id: exercise for exercise in self.exercises})
+        self._exercises_by_name = MappingProxyType({exercise.name: exercise for exercise in self.exercises})
+        exercises_by_translated_name = {}
+        for exercise in self.exercises:
+            for language, translated_name in exercise.name_translations.items():
+                exercises_by_translated_name.setdefault(language.upper(), {})[translated_name] = exercise
+        self._exercises_by_translated_name = MappingProxyType({language: MappingProxyType(names) for language, names in exercises_by_translated_name.items()})
+
+    @staticmethod
+    def load():
+        return ExerciseRegistry(
+            exercises=wn_models.Exercise.objects.select_related('body_part', 'category').order_by('id'),
+            body_parts=wn_models.BodyPart.objects.order_by('id'),
+        )
+
+    def get_exercise(self, exercise_id):
+        return self._exercises_by_id.get(exercise_id)
+
+    def get_exercise_by_name(self, name, language=None):
+        """
+        :param name (str) - exercise name (or its translation)
+        :param language (str) - language of the translated name, None to match the original name only
+        """
+        if language is not None and name in self._exercises_by_translated_name.get(language.upper(), {}):
+            return self._exercises_by_translated_name[language.upper()][name]
+        return self._exercises_by_name.get(name)
+
+
+def get_registry():
+    version = get_version()
+    with _lock:
+        registry = _registries.get(version)
+    if registry is None:
+        registry = ExerciseRegistry.load()
+        with _lock:
+            _registries.clear()
+            _registries[version] = registry
+    return registry
+
+
+def get_version():
+    """
+    Catalog version is kept in the database (shared by all workers and management commands), each worker re-reads it at most every VERSION_CHECK_INTERVAL seconds.
+    """
+    global _version
+    with _lock:
+        version = _version
+    if version is not None and time.monotonic() - version[1] < VERSION_CHECK_INTERVAL:
+        return version[0]
+    version = wn_models.CatalogVersion.get_current()
+    with _lock:
+        _version = (version, time.monotonic())
+    return version
+
+
+def bump_version():
+    """
+    Changes the catalog version, to be called in the transaction changing the catalog (other workers see both once it commits).
+    """
+    global _version
+    version = wn_models.CatalogVersion.bump()
+    with _lock:
+        _version = (version, time.monotonic())
+        _encoded_catalogs.clear()
+        _registries.clear()
+
+
+def get_etag(version):
+    return f'"catalog-{version}"'
+
+
+def encode_catalog(registry):
+    exercises_arr = []
+    for exercise in registry.exercises:
+        exercises_arr += [{
+            'id': exercise.id,
+            'name': exercise.name,
+            'name_translations': exercise.name_translations,
+            'body_part_str': exercise.body_part.name,
+            'category_str': exercise.category.name,
+            'icon_str': exercise.icon.name,
+        }]
+    body_parts_arr = []
+    for body_part in registry.body_parts:
+        body_parts_arr += [{
+            'id': body_part.id,
+            'name': body_part.name,
+        }]
+    return {
+        'exercises': json.dumps({'success': True, 'exercises': exercises_arr}, cls=DjangoJSONEncoder).encode('utf8'),
+        'body_parts': json.dumps({'success': True, 'body_parts': body_parts_arr}, cls=DjangoJSONEncoder).encode('utf8'),
+    }
+
+
+def get_encoded(name, version):
+    with _lock:
+        encoded_catalog = _encoded_catalogs.get(version)
+    if encoded_catalog is None:
+        encoded_catalog = encode_catalog(get_registry())
+        with _lock:
+            _encoded_catalogs.clear()
+            _encoded_catalogs[version] = encoded_catalog
+    return encoded_catalog[name]
+
+
+def catalog_response(request, name):
+    """
+    Serves pre-encoded catalog JSON ('exercises' or 'body_parts'), or 304 if client's ETag is still current.
+    """
+    version = get_version()
+    etag = get_etag(version)
+    if etag in [x.strip() for x in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+        res = HttpResponseNotModified()
+    else:
+        res = HttpResponse(get_encoded(name, version), content_type='application/json')
+    res['ETag'] = etag
+    return res
+
+
+# region catalog change signals
+@receiver([post_save, post_delete], sender=wn_models.Exercise)
+@receiver([post_save, post_delete], sender=wn_models.BodyPart)
+@receiver([post_save, post_delete], sender=wn_models.Category)
+def _on_catalog_changed(sender, **kwargs):
+    bump_version()
+# endregion
@@ -0,0 +1,103 @@
+from workoutnote_django import models as wn_models
+from django.db.models import Prefetch, Q, prefetch_related_objects
+import datetime
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def lifts_prefetch():
+    return Prefetch('lift_set', queryset=wn_models.Lift.objects.select_related('exercise').order_by('id'))
+
+
+def serialize_lift(lift):
+    return {
+        'id': lift.id,
+        'timestamp': int(lift.timestamp.timestamp() * 1000),
+        'one_rep_max': lift.one_rep_max,
+        'exercise_id': lift.exercise.id,
+        'exercise_name': lift.exercise.name,
+        'exercise_name_translations': lift.exercise.name_translations,
+        'lift_mass': lift.lift_mass,
+        'repetitions': lift.repetitions,
+    }
+
+
+def serialize_workout_session(workout_session, is_favorite=None):
+    res = {
+        'id': workout_session.id,
+        'title': workout_session.title,
+        'timestamp': int(workout_session.timestamp.timestamp() * 1000),
+        'duration': workout_session.duration,
+    }
+    if is_favorite is not None:
+        res['isFavorite'] = is_favorite
+    res['lifts'] = [serialize_lift(lift) for lift in workout_session.lift_set.all()]
+    return res
+
+
+def load_workouts(user, workout_sessions, with_favorite_flag=True):
+    """
+    Serializes workout sessions with their lifts in a constant number of queries (sessions, lifts+exercises, favorites).
+    :param user - owner of the workout sessions
+    :param workout_sessions (QuerySet or list) - workout sessions to serialize
+    :param with_favorite_flag (bool) - whether to include 'isFavorite' for each session
+    """
+    workout_sessions = list(workout_sessions)
+    prefetch_related_objects(workout_sessions, lifts_prefetch())
+    favorite_ids = None
+    if with_favorite_flag:
+        favorite_ids = set(wn_models.FavoriteWorkout.objects.filter(user=user).values_list('workout_session_id', flat=True))
+    return [
+        serialize_workout_session(workout_session, None if favorite_ids is None else workout_session.id in favorite_ids)
+        for workout_session in workout_sessions
+    ]
+
+
+def load_favorite_workouts(user):
+    workout_sessions = wn_models.WorkoutSession.objects.filter(favoriteworkout__user=user).order_by('favoriteworkout__id')
+    return load_workouts(user, workout_sessions, with_favorite_flag=False)
+
+
+# region keyset pagination
+def encode_cursor(workout_session):
+    return f'{(workout_session.timestamp - EPOCH) // datetime.timedelta(microseconds=1)}_{workout_session.id}'
+
+
+def decode_cursor(cursor):
+    """
+    :param cursor (str) - value of 'nextCursor' returned with a previous page
+    :return (timestamp, id) tuple of the last workout session of the previous page
+    """
+    timestamp_us, workout_session_id = cursor.split('_')
+    return EPOCH + datetime.timedelta(microseconds=int(timestamp_us)), int(workout_session_id)
+
+
+def fetch_workouts_page(workout_sessions, after=None, limit=50):
+    """
+    Fetches next page of workout sessions ordered by (timestamp, id), without OFFSET scans.
+    :param workout_sessions (QuerySet) - filtered (not yet ordered) workout sessions
+    :param after (tuple) - (timestamp, id) of the last workout session of the previous page, None for first page
+    :param limit (int) - page size
+    :return (page, has_more) tuple
+    """
+    workout_sessions = workout_sessions.order_by('timestamp', 'id')
+    if after is not None:
+        timestamp, workout_session_id = after
+        workout_sessions = workout_sessions.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=workout_session_id))
+    page = list(workout_sessions[:limit + 1])
+    return page[:limit], len(page) > limit
+
+
+def iterate_workouts(user, workout_sessions, chunk_size=200):
+    """
+    Yields serialized workout sessions chunk by chunk (constant memory regardless of the history length).
+    """
+    after = None
+    has_more = True
+    while has_more:
+        page, has_more = fetch_workouts_page(workout_sessions, after=after, limit=chunk_size)
+        if len(page) == 0:
+            break
+        yield from load_workouts(user, page)
+        after = (page[-1].timestamp, page[-1].id)
+# endregion
@@ -0,0 +1,357 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management import call_command
+from django.contrib.auth.models import User as django_User
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.test import Client
+from django.db import connection
+from django.utils import timezone
+from workoutnote_django import models as wn_models
+from workoutnote_django import catalog_import
+from workoutnote_django.management.commands.generate_dataset import USERNAME_FORMAT
+from api import urls as api_urls
+from api import tokens
+from datetime import timedelta
+import numpy as np
+import platform
+import json
+import time
+import io
+import os
+
+DEFAULT_BUDGETS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'benchmark_budgets.json')
+PREFIX = 'benchmark'
+
+
+def api_route_names():
+    """
+    :return names of all routes in api/urls.py (e.g. 'fetch_workouts' for '^fetch_workouts/?')
+    """
+    return [pattern.pattern.regex.pattern.lstrip('^').rstrip('?').rstrip('/') for pattern in api_urls.urlpatterns]
+
+
+def seed_dataset(users, sessions_per_user, sets_per_session):
+    """
+    Loads the exercise catalog, generates a synthetic dataset and fills the aggregate tables, like a production database would have them.
+    """
+    wn_models.BodyPart.init_body_parts()
+    wn_models.Category.init_categories()
+    for path in ['static/exercises-kr.csv', 'static/exercises.csv']:
+        catalog_import.import_catalog(catalog_import.read_catalog_csv(path))
+
+    out = io.StringIO()
+    call_command('generate_dataset', users=users, sessions_per_user=sessions_per_user, sets_per_session=sets_per_session, prefix=PREFIX, password=PREFIX, stdout=out)
+    call_command('rebuild_personal_records', stdout=out)
+    call_command('backfill_training_volume', stdout=out)
+    call_command('compute_strength_standards', full=True, stdout=out)
+
+
+class Context:
+    """
+    State shared by the scenarios: the benchmarked user, its session key and a few of its (generated) objects.
+    """
+
+    def __init__(self):
+        self.user = django_User.objects.get(username=USERNAME_FORMAT.format(prefix=PREFIX, index=0))
+        self.session_key = tokens.issue_token(self.user)
+        self.workout_session = wn_models.WorkoutSession.objects.filter(user=self.user).order_by('-timestamp').first()
+        self.lift = wn_models.Lift.objects.filter(workout_session=self.workout_session).order_by('id').first()
+        self.exercise_id = self.lift.exercise_id
+        self.now_ms = int(time.time() * 1000)
+        self.counter = 0
+
+        # objects the read-only scenarios expect to exist
+        wn_models.OneRepMaxResults.objects.create(user=self.user, name='benchmark', gender=wn_models.OneRepMaxResults.Gender.MALE, age=30, height=180, weight=80, shoulder=50, chest=50, back=50, abs=50, legs=50)
+        wn_models.FavoriteExercise.objects.create(user=self.user, exercise_id=self.exercise_id)
+        wn_models.FavoriteWorkout.objects.create(user=self.user, workout_session=self.workout_session)
+        wn_models.Target.objects.create(user=self.user, name='benchmark', start_date=timezone.now(), end_date=timezone.now() + timedelta(days=30))
+
+    def next(self):
+        self.counter += 1
+        return self.counter
+
+    def api(self, **params):
+        return dict(sessionKey=self.session_key, **params)
+
+    def new_workout_session(self):
+        return wn_models.WorkoutSession.objects.create(user=self.user, title='benchmark', local_date=timezone.now().date())
+
+    def new_lift(self):
+        return wn_models.Lift.bulk_insert(self.workout_session, [(wn_models.Exercise.objects.get(id=self.exercise_id), 60, 5)])[0]
+
+    def new_target(self):
+        return wn_models.Target.objects.create(user=self.user, name='benchmark', start_date=timezone.now(), end_date=timezone.now() + timedelta(days=30))
+
+    def new_email(self):
+        return f'{PREFIX}-new-{self.next()}@workoutnote.com'
+
+    def new_verification_code(self):
+        email = self.new_email()
+        wn_models.EmailConfirmationCode.objects.create(email=email, verification_code='123456')
+        return email
+
+
+def api_scenarios(ctx):
+    """
+    :return list of (name, params factory) of api/ endpoints, factories run untimed before every request (e.g. to create the object a remove request deletes)
+    """
+    today = timezone.now().date()
+    return [
+        # auth
+        ('login', lambda: dict(email=ctx.user.username, password=PREFIX)),
+        ('check_username', lambda: dict(email_or_phone=ctx.user.username)),
+        ('send_verification_code', lambda: dict(email=ctx.new_email())),
+        ('verify_register', lambda: dict(name='benchmark', email=ctx.new_verification_code(), password=PREFIX, verification_code='123456')),
+
+        # settings
+        ('fetch_settings', lambda: ctx.api()),
+        ('update_settings', lambda: ctx.api(new_name='benchmark', new_date_of_birth='1990-01-01', new_gender=wn_models.Preferences.Gender.MALE, new_is_profile_shared=True)),
+        ('request_password_reset', lambda: dict(email=ctx.user.username)),
+
+        # exercises & body parts
+        ('fetch_exercises', lambda: {}),
+        ('fetch_body_parts', lambda: {}),
+
+        # workout
+        ('insert_workout', lambda: ctx.api(title='benchmark', duration=3600)),
+        ('fetch_workouts', lambda: ctx.api(fromTimestampMs=ctx.now_ms - 30 * 24 * 3600 * 1000, tillTimestampMs=ctx.now_ms, limit=50)),
+        ('fetch_timeline', lambda: ctx.api(beforeDate=(today + timedelta(days=1)).isoformat())),
+        ('update_workout', lambda: ctx.api(workout_session_id=ctx.workout_session.id, new_title='benchmark', new_duration=3600)),
+        ('remove_workout', lambda: ctx.api(workout_session_id=ctx.new_workout_session().id)),
+
+        # lifts
+        ('insert_lifts', lambda: ctx.api(workout_session_id=ctx.new_workout_session().id, sets=[dict(exercise_id=ctx.exercise_id, lift_mass=60, repetitions=5)] * 5)),
+        ('insert_lift', lambda: ctx.api(workout_session_id=ctx.new_workout_session().id, exercise_id=ctx.exercise_id, lift_mass=60, repetitions=5)),
+        ('update_lift', lambda: ctx.api(workout_session_id=ctx.workout_session.id, lift_id=ctx.lift.id, new_exercise_id=ctx.exercise_id, new_lift_mass=ctx.lift.lift_mass + ctx.next() % 2, new_repetitions=ctx.lift.repetitions)),  # alternates, unchanged lifts skip the aggregates
+        ('remove_lift', lambda: ctx.api(workout_session_id=ctx.workout_session.id, lift_id=ctx.new_lift().id)),
+
+        # personal records, analytics & leaderboards
+        ('fetch_personal_records', lambda: ctx.api()),
+        ('fetch_training_volume', lambda: ctx.api(period='WEEK', since=(today - timedelta(days=365)).isoformat())),
+        ('fetch_leaderboard', lambda: ctx.api(exercise_id=ctx.exercise_id)),
+
+        # favorites
+        ('set_favorite_exercise', lambda: ctx.api(exercise_id=ctx.exercise_id)),
+        ('unset_favorite_exercise', lambda: ctx.api(exercise_id=wn_models.FavoriteExercise.objects.get_or_create(user=ctx.user, exercise_id=ctx.exercise_id)[0].exercise_id)),
+        ('fetch_favorite_exercises', lambda: ctx.api()),
+        ('fetch_workout_days', lambda: ctx.api(timezoneOffsetMinutes=0)),
+        ('set_favorite_workout', lambda: ctx.api(workout_session_id=ctx.workout_session.id)),
+        ('unset_favorite_workout', lambda: ctx.api(workout_session_id=wn_models.FavoriteWorkout.objects.get_or_create(user=ctx.user, workout_session=ctx.workout_session)[0].workout_session_id)),
+        ('fetch_favorite_workouts', lambda: ctx.api()),
+
+        # notes
+        ('fetch_note', lambda: ctx.api(timestamp=ctx.now_ms)),
+        ('set_note', lambda: ctx.api(timestamp=ctx.now_ms, note='benchmark')),
+
+        # one rep max tests, strength standards & calculators
+        ('insert_1rm_result', lambda: ctx.api(name='benchmark', gender=wn_models.OneRepMaxResults.Gender.MALE, age=30, height=180, weight=80, shoulder=50, chest=50, back=50, abs=50, legs=50)),
+        ('fetch_1rm_results', lambda: ctx.api()),
+        ('fetch_strength_levels', lambda: ctx.api()),
+        ('calculate', lambda: ctx.api(lift_masses=[60 + i for i in range(100)], repetitions=[1 + i % 12 for i in range(100)], body_weights=[80] * 100, genders=[wn_models.Preferences.Gender.MALE] * 100)),
+
+        # target
+        ('insert_target', lambda: ctx.api(name='benchmark', start_date_ms=ctx.now_ms, end_date_ms=ctx.now_ms + 30 * 24 * 3600 * 1000)),
+        ('fetch_targets', lambda: ctx.api()),
+        ('toggle_target', lambda: ctx.api(target_id=ctx.new_target().id)),
+        ('remove_target', lambda: ctx.api(target_id=ctx.new_target().id)),
+        ('update_target', lambda: ctx.api(target_id=ctx.new_target().id, name='benchmark', start_date_ms=ctx.now_ms, end_date_ms=ctx.now_ms + 30 * 24 * 3600 * 1000, achieved=True)),
+
+        # sync & batch
+        ('sync', lambda: ctx.api()),
+        ('batch', lambda: ctx.api(operations=[
+            dict(op='insert_workout', params=dict(title='benchmark', duration=3600)),
+            dict(op='insert_lifts', params=dict(workout_session_id='$0.workout_session.id', sets=[dict(exercise_id=ctx.exercise_id, lift_mass=60, repetitions=5)] * 5)),
+        ])),
+    ]
+
+
+def page_scenarios(ctx):
+    """
+    :return list of (name, path factory) of the main (server rendered) pages
+    """
+    return [
+        ('page: index', lambda: '/'),
+        ('page: calendar', lambda: '/calendar/'),
+        ('page: favorite workouts', lambda: '/favorite-workouts/'),
+        ('page: calculators', lambda: '/calculators/'),
+        ('page: settings', lambda: '/settings/'),
+        ('page: report', lambda: '/report/'),
+        ('page: deltoid photo card', lambda: '/deltoid-photo-card/'),
+        ('page: workout photo card', lambda: f'/workout-photo-card/{ctx.session_key}/{ctx.workout_session.id}/en'),
+    ]
+
+
+def measure(request):
+    """
+    Runs the request, counting its SQL queries and reading the whole (possibly streamed) response.
+    :return (response, body, elapsed milliseconds, number of queries)
+    """
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    # (CaptureQueriesContext would miss queries, requests reset the queries log when they start)
+    with connection.execute_wrapper(count_query):
+        started_at = time.perf_counter()
+        response = request()
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+    return response, body, elapsed_ms, len(queries)
+
+
+def check_response(response, body, is_api):
+    """
+    :return None if the response is a successful one, reason otherwise
+    """
+    if response.status_code != 200:
+        return f'status code {response.status_code}'
+    if is_api and not response.streaming:
+        data = json.loads(body)
+        if not data.get('success', False):
+            return data.get('reason', 'success=false')
+    return None
+
+
+def summarize(samples):
+    elapsed_ms = np.array([sample[0] for sample in samples])
+    return {
+        'requests': len(samples),
+        'p50_ms': round(float(np.percentile(elapsed_ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(elapsed_ms, 95)), 2),
+        'max_ms': round(float(elapsed_ms.max()), 2),
+        'queries': max(sample[1] for sample in samples),
+        'bytes': max(sample[2] for sample in samples),
+    }
+
+
+def check_budgets(results, budgets):
+    """
+    :return list of budget violations (str)
+    """
+    violations = []
+    for name, result in results.items():
+        budget = dict(budgets.get('default', {}), **budgets.get('endpoints', {}).get(name, {}))
+        for key, budget_key in [('p95_ms', 'p95_ms'), ('queries', 'max_queries'), ('bytes', 'max_bytes')]:
+            if budget_key in budget and result[key] > budget[budget_key]:
+                violations += [f'{name}: {key} {result[key]} over budget {budget[budget_key]}']
+    return violations
+
+
+def check_regressions(results, baseline, tolerance, slack_ms):
+    """
+    :return list of regressions (str) compared to a previous report
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline['endpoints']:
+            continue
+        previous = baseline['endpoints'][name]
+        if result['p95_ms'] > previous['p95_ms'] * (1 + tolerance) + slack_ms:
+            regressions += [f'{name}: p95 {result["p95_ms"]}ms regressed from {previous["p95_ms"]}ms']
+        if result['queries'] > previous['queries']:
+            regressions += [f'{name}: {result["queries"]} queries regressed from {previous["queries"]}']
+    return regressions
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks all api/ endpoints and the main pages end-to-end over a seeded test database (p50/p95 latency, SQL queries and response bytes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='synthetic users in the seeded dataset')
+        parser.add_argument('--sessions-per-user', type=int, default=100)
+        parser.add_argument('--sets-per-session', type=int, default=15)
+        parser.add_argument('--iterations', type=int, default=20, help='timed requests per endpoint (after one warm up request)')
+        parser.add_argument('--only', nargs='+', help='only benchmark these endpoints (names as in the report)')
+        parser.add_argument('--report', default='benchmark_report.json', help='where the JSON report is written')
+        parser.add_argument('--budgets', default=DEFAULT_BUDGETS_PATH, help='JSON file with default and per endpoint budgets (p95_ms, max_queries, max_bytes)')
+        parser.add_argument('--baseline', help='previous report to compare against, fails on p95 latency or query count regressions')
+        parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative p95 regression over the baseline')
+        parser.add_argument('--slack-ms', type=float, default=5, help='allowed absolute p95 regression over the baseline (absorbs noise of fast endpoints)')
+
+    def handle(self, *args, **options):
+        # a throwaway test database, so seeding and mutating requests never touch real data
+        setup_test_environment()
+        old_database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            started_at = time.time()
+            seed_dataset(users=options['users'], sessions_per_user=options['sessions_per_user'], sets_per_session=options['sets_per_session'])
+            self.stdout.write(f'dataset seeded in {time.time() - started_at:.1f}s ({wn_models.Lift.objects.count()} lifts)')
+            results, failures = self.run_scenarios(options)
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            teardown_test_environment()
+
+        # 1. report
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'users': options['users'],
+                'sessions_per_user': options['sessions_per_user'],
+                'sets_per_session': options['sets_per_session'],
+                'iterations': options['iterations'],
+            },
+            'endpoints': results,
+        }
+        with open(options['report'], 'w') as w:
+            json.dump(report, w, indent=2)
+        self.stdout.write(f'\n{"endpoint":<32}{"p50 ms":>10}{"p95 ms":>10}{"queries":>10}{"bytes":>10}')
+        for name, result in results.items():
+            self.stdout.write(f'{name:<32}{result["p50_ms"]:>10}{result["p95_ms"]:>10}{result["queries"]:>10}{result["bytes"]:>10}')
+        self.stdout.write(f'\nreport written to {options["report"]}')
+
+        # 2. budgets and regressions
+        problems = [f'{name}: failed ({reason})' for name, reason in failures.items()]
+        if options['budgets'] and os.path.exists(options['budgets']):
+            with open(options['budgets'], 'r') as r:
+                problems += check_budgets(results, json.load(r))
+        if options['baseline']:
+            with open(options['baseline'], 'r') as r:
+                problems += check_regressions(results, json.load(r), options['tolerance'], options['slack_ms'])
+        if len(problems) > 0:
+            raise CommandError('\n'.join([f'{len(problems)} problem(s):'] + problems))
+        self.stdout.write(self.style.SUCCESS('all endpoints within budgets'))
+
+    def run_scenarios(self, options):
+        ctx = Context()
+        api_client = Client()
+        page_client = Client()
+        page_client.force_login(ctx.user)
+
+        scenarios = [(name, params, True) for name, params in api_scenarios(ctx)] + [(name, path, False) for name, path in page_scenarios(ctx)]
+        uncovered = sorted(set(api_route_names()) - {name for name, _, is_api in scenarios if is_api})
+        if len(uncovered) > 0:
+            raise CommandError(f'api routes without a benchmark scenario: {",".join(uncovered)}')
+        if options['only']:
+            scenarios = [scenario for scenario in scenarios if scenario[0] in options['only']]
+
+        results, failures = {}, {}
+        for name, factory, is_api in scenarios:
+            if is_api:
+                def request():
+                    return api_client.post(f'/api/{name}/', data=json.dumps(params), content_type='application/json')
+            else:
+                def request():
+                    return page_client.get(path)
+
+            samples = []
+            for iteration in range(options['iterations'] + 1):
+                if is_api:
+                    params = factory()
+                else:
+                    path = factory()
+                response, body, elapsed_ms, queries = measure(request)
+                reason = check_response(response, body, is_api)
+                if reason is not None:
+                    failures[name] = reason
+                    break
+                if iteration > 0:  # the first request warms up caches
+                    samples += [(elapsed_ms, queries, len(body))]
+            if len(samples) > 0:
+                results[name] = summarize(samples)
+            self.stdout.write(f'\r{len(results) + len(failures)}/{len(scenarios)} endpoints', ending='')
+            self.stdout.flush()
+        self.stdout.write('')
+        return results, failures
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from api import sync
+
+
+class Command(BaseCommand):
+    help = 'Removes tombstones older than API_SYNC_TOKEN_MAX_AGE_DAYS (sync tokens that old get a full sync instead), run it daily e.g. from cron'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{sync.purge_tombstones()} tombstones removed')
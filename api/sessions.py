@@ -0,0 +1,156 @@
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User as django_User
+from workoutnote_django import models as wn_models
+from django.dispatch import receiver
+from django.core.cache import caches
+from django.conf import settings
+from cachetools import TTLCache
+from api import models, tokens
+import threading
+import copy
+
+SESSION_CACHE_SIZE = getattr(settings, 'API_SESSION_CACHE_SIZE', 4096)
+SESSION_CACHE_TTL = getattr(settings, 'API_SESSION_CACHE_TTL', 60)
+SESSION_CACHE_ALIAS = getattr(settings, 'API_SESSION_CACHE_ALIAS', None)
+PAGE_TOKEN_SESSION_KEY = 'api_token'
+
+# cached instances never leave the cache: callers get their own copy (views modify and save the users they resolve)
+_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+_keys_by_user_id = {}
+_lock = threading.Lock()
+
+
+def _shared_cache():
+    return caches[SESSION_CACHE_ALIAS] if SESSION_CACHE_ALIAS else None
+
+
+def _shared_cache_key(cache_key):
+    return f'api-session:{cache_key}'
+
+
+def _remember(cache_key, value):
+    user_id = value.user_id if isinstance(value, models.SessionKey) else value.id
+    with _lock:
+        _cache[cache_key] = copy.deepcopy(value)
+        _keys_by_user_id.setdefault(user_id, set()).add(cache_key)
+
+
+def _user_cache_key(user_id):
+    return f'user:{user_id}'
+
+
+def _get_cached(cache_key, fetch):
+    # 1. in-process cache
+    with _lock:
+        value = _cache.get(cache_key)
+    if value is not None:
+        return copy.deepcopy(value)
+
+    # 2. shared (django) cache, if configured
+    shared_cache = _shared_cache()
+    if shared_cache is not None:
+        value = shared_cache.get(_shared_cache_key(cache_key))
+        if value is not None:
+            _remember(cache_key, value)
+            return value
+
+    # 3. single database lookup
+    value = fetch()
+    if value is not None:
+        _remember(cache_key, value)
+        if shared_cache is not None:
+            shared_cache.set(_shared_cache_key(cache_key), value, SESSION_CACHE_TTL)
+    return value
+
+
+def _resolve_signed_token(payload):
+    if payload is None:
+        return None
+    user_id, generation = payload
+    user = _get_cached(_user_cache_key(user_id), lambda: tokens.fetch_user(user_id))
+    if user is None or tokens.get_generation(user) != generation:
+        return None
+    return user
+
+
+def resolve_user(session_key):
+    """
+    Resolves an API sessionKey (signed token or legacy session key) into its user, with preferences already loaded.
+    Revocations reach other processes once their cached entry expires (API_SESSION_CACHE_TTL) unless API_SESSION_CACHE_ALIAS is shared.
+    :param session_key (str) - user's session key, received after authentication
+    :return django user or None if session key is invalid
+    """
+    if not session_key:
+        return None
+
+    if tokens.is_signed_token(session_key):
+        return _resolve_signed_token(tokens.load_token(session_key))
+    else:
+        db_session_key = _get_cached(session_key, lambda: models.SessionKey.objects.select_related('user', 'user__preferences', 'user__token_generation').filter(key=session_key).first())
+        return None if db_session_key is None else db_session_key.user
+
+
+def resolve_password_reset_token(token):
+    """
+    :param token (str) - token of a password reset link
+    :return django user or None if the token is invalid, expired or already used
+    """
+    if not token or not tokens.is_signed_token(token):
+        return None
+    return _resolve_signed_token(tokens.load_password_reset_token(token))
+
+
+def get_page_token(request):
+    """
+    API token for the pages of a logged in user, kept in the django session and reused while it is valid for at least half its lifetime
+    (issuing one per render would cost a token generation query on every page).
+    :param request - django request with an authenticated user
+    :return signed API token
+    """
+    token = request.session.get(PAGE_TOKEN_SESSION_KEY)
+    if token is not None:
+        payload = tokens.load_token(token, max_age=tokens.TOKEN_MAX_AGE // 2 if tokens.TOKEN_MAX_AGE is not None else None)
+        if payload is not None and payload[0] == request.user.id and _resolve_signed_token(payload) is not None:
+            return token
+    token = request.session[PAGE_TOKEN_SESSION_KEY] = tokens.issue_token(request.user)
+    return token
+
+
+def invalidate_user(user_id, extra_session_keys=()):
+    with _lock:
+        cache_keys = _keys_by_user_id.pop(user_id, set()) | set(extra_session_keys) | {_user_cache_key(user_id)}
+        for cache_key in cache_keys:
+            _cache.pop(cache_key, None)
+
+    shared_cache = _shared_cache()
+    if shared_cache is not None:
+        cache_keys |= set(models.SessionKey.objects.filter(user_id=user_id).values_list('key', flat=True))
+        shared_cache.delete_many([_shared_cache_key(cache_key) for cache_key in cache_keys])
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+        _keys_by_user_id.clear()
+
+
+# region cache invalidation
+@receiver([post_save, post_delete], sender=models.SessionKey)
+def _on_session_key_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id, extra_session_keys=[instance.key])
+
+
+@receiver([post_save, post_delete], sender=models.TokenGeneration)
+def _on_token_generation_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=django_User)
+def _on_user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.id)
+
+
+@receiver([post_save, post_delete], sender=wn_models.Preferences)
+def _on_preferences_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+# endregion
@@ -0,0 +1,153 @@
+from workoutnote_django import models as wn_models
+from django.db.models.signals import pre_delete
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone as tz
+from django.contrib.auth.models import User as django_User
+from django.conf import settings
+from api import loaders
+import threading
+import datetime
+
+# rows saved by transactions still in flight at sync time may carry slightly older modified_at values, hence the lag
+SYNC_TOKEN_LAG = datetime.timedelta(seconds=getattr(settings, 'API_SYNC_TOKEN_LAG_SECONDS', 10))
+# tombstones are kept this long, older sync tokens are answered with a full sync
+SYNC_TOKEN_MAX_AGE = datetime.timedelta(days=getattr(settings, 'API_SYNC_TOKEN_MAX_AGE_DAYS', 30))
+SYNCED_MODELS = {
+    'workouts': wn_models.WorkoutSession,
+    'lifts': wn_models.Lift,
+    'favoriteWorkouts': wn_models.FavoriteWorkout,
+    'notes': wn_models.Note,
+    'targets': wn_models.Target,
+    'oneRepMaxResults': wn_models.OneRepMaxResults,
+}
+
+
+def encode_sync_token(dt):
+    return str((dt - loaders.EPOCH) // datetime.timedelta(microseconds=1))
+
+
+def decode_sync_token(sync_token):
+    return loaders.EPOCH + datetime.timedelta(microseconds=int(sync_token))
+
+
+def is_expired(since):
+    return since < tz.now() - SYNC_TOKEN_MAX_AGE
+
+
+def next_sync_token(since):
+    token = tz.now() - SYNC_TOKEN_LAG
+    return token if since is None or token > since else since  # never move backwards
+
+
+def serialize_changes(key, db_object):
+    if key == 'workouts':
+        return {'id': db_object.id, 'title': db_object.title, 'timestamp': int(db_object.timestamp.timestamp() * 1000), 'duration': db_object.duration}
+    elif key == 'lifts':
+        return dict(loaders.serialize_lift(db_object), workout_session_id=db_object.workout_session_id)
+    elif key == 'favoriteWorkouts':
+        return {'id': db_object.id, 'workout_session_id': db_object.workout_session_id}
+    elif key == 'notes':
+        return {'id': db_object.id, 'timestamp': int(db_object.timestamp.timestamp() * 1000), 'note': db_object.note}
+    elif key == 'targets':
+        return {'id': db_object.id, 'timestamp': int(db_object.timestamp.timestamp() * 1000), 'name': db_object.name, 'startDateMs': int(db_object.start_date.timestamp() * 1000), 'endDateMs': int(db_object.end_date.timestamp() * 1000), 'achieved': db_object.achieved}
+    elif key == 'oneRepMaxResults':
+        return {'id': db_object.id, 'timestamp': int(db_object.timestamp.timestamp() * 1000), 'name': db_object.name, 'gender': db_object.gender, 'age': db_object.age, 'height': db_object.height, 'weight': db_object.weight, 'shoulder': db_object.shoulder, 'chest': db_object.chest, 'back': db_object.back, 'abs': db_object.abs, 'legs': db_object.legs}
+
+
+def collect_changes(user, since):
+    """
+    Collects rows of the user changed (or deleted) since the given moment.
+    :param user - owner of the rows
+    :param since (datetime) - moment of the previous sync, None for a full sync
+    :return dict of changed rows (per model) and 'deleted' ids (per model)
+    """
+    changes = {}
+    for key, model in SYNCED_MODELS.items():
+        queryset = model.objects.filter(workout_session__user=user) if model is wn_models.Lift else model.objects.filter(user=user)
+        if model is wn_models.Lift:
+            queryset = queryset.select_related('exercise')
+        if since is not None:
+            queryset = queryset.filter(modified_at__gte=since)
+        changes[key] = [serialize_changes(key, db_object) for db_object in queryset.order_by('id')]
+
+    deleted = {key: [] for key in SYNCED_MODELS}
+    if since is not None:
+        keys_by_model_name = {model.__name__: key for key, model in SYNCED_MODELS.items()}
+        for model_name, object_id in wn_models.Tombstone.objects.filter(user=user, deleted_at__gte=since).values_list('model_name', 'object_id'):
+            deleted[keys_by_model_name[model_name]] += [object_id]
+    changes['deleted'] = deleted
+    return changes
+
+
+# region tombstones
+# tombstones are gathered while django's collector sends pre_delete for every deleted row (cascades included),
+# and bulk inserted once the deleting transaction commits; rows are buffered per savepoint, so a rolled back
+# deletion (or savepoint) drops them together with its on_commit callback
+_local = threading.local()
+
+
+class _PendingTombstones:
+    def __init__(self, key):
+        self.key = key  # (database alias, savepoint ids)
+        self.rows = []  # (model, object id, user id or None for lifts of unknown owner, workout session id)
+
+    def flush(self):
+        if _local.pending.get(self.key) is self:
+            del _local.pending[self.key]
+
+        deleted_user_ids = {object_id for model, object_id, _, _ in self.rows if model is django_User}
+        workout_session_owners = {object_id: user_id for model, object_id, user_id, _ in self.rows if model is wn_models.WorkoutSession}
+        missing_owners = {workout_session_id for model, _, user_id, workout_session_id in self.rows if model is wn_models.Lift and user_id is None and workout_session_id not in workout_session_owners}
+        if len(missing_owners) > 0:  # lifts removed on their own, their workout sessions still exist
+            workout_session_owners.update(wn_models.WorkoutSession.objects.filter(id__in=missing_owners).values_list('id', 'user_id'))
+
+        tombstones = []
+        for model, object_id, user_id, workout_session_id in self.rows:
+            if model is django_User:
+                continue
+            if model is wn_models.Lift and user_id is None:
+                user_id = workout_session_owners.get(workout_session_id)
+            if user_id is not None and user_id not in deleted_user_ids:  # rows deleted along with their user need none
+                tombstones += [wn_models.Tombstone(user_id=user_id, model_name=model.__name__, object_id=object_id)]
+        wn_models.Tombstone.objects.bulk_create(tombstones)
+
+
+def _get_pending(using):
+    # one buffer per savepoint (atomic blocks without one share their enclosing buffer), registered with on_commit inside
+    # that savepoint; savepoint ids repeat across transactions, so a buffer is reused only while its callback is pending
+    connection = transaction.get_connection(using)
+    key = (using, tuple(sid for sid in connection.savepoint_ids if sid is not None))
+    buffers = _local.__dict__.setdefault('pending', {})
+    pending = buffers.get(key)
+    if pending is None or not any(pending.flush in callback for callback in connection.run_on_commit):
+        pending = buffers[key] = _PendingTombstones(key)
+        transaction.on_commit(pending.flush, using=using)
+    return pending
+
+
+def _on_synced_model_deleting(sender, instance, using, **kwargs):
+    if sender is wn_models.Lift:
+        user_id = instance.workout_session.user_id if wn_models.Lift.workout_session.is_cached(instance) and instance.workout_session is not None else None
+        _get_pending(using).rows.append((sender, instance.id, user_id, instance.workout_session_id))
+    else:
+        _get_pending(using).rows.append((sender, instance.id, instance.user_id, None))
+
+
+@receiver(pre_delete, sender=django_User)
+def _on_user_deleting(sender, instance, using, **kwargs):
+    _get_pending(using).rows.append((sender, instance.id, instance.id, None))
+
+
+for _model in SYNCED_MODELS.values():  # connected per model, other models keep django's fast deletes
+    pre_delete.connect(_on_synced_model_deleting, sender=_model, dispatch_uid=f'sync-tombstones-{_model.__name__}')
+
+
+def purge_tombstones():
+    """
+    Removes tombstones no sync token can still ask for (older sync tokens get a full sync instead).
+    :return number of removed tombstones
+    """
+    removed, _ = wn_models.Tombstone.objects.filter(deleted_at__lt=tz.now() - SYNC_TOKEN_MAX_AGE).delete()
+    return removed
+# endregion
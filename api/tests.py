@@ -1,3 +1,498 @@
+from django.contrib.auth.models import User as django_User
 from django.test import TestCase
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.db.models.signals import post_delete, pre_delete
+from workoutnote_django import models as wn_models
+from workoutnote_django import aggregates, catalog_import
+from api import catalog, models as api_models, sessions, sync, tokens
+from api.management.commands import benchmark_api
+from unittest import mock
+from datetime import timedelta
+import warnings
+import json
+import time
+import re
+import io
 
-# Create your tests here.
+
+class ApiTestCase(TestCase):
+    """
+    A user (with preferences and an API token) and a small exercise catalog.
+    """
+
+    def setUp(self):
+        sessions.clear()
+        self.user = django_User.objects.create_user(username='lifter@workoutnote.com', password='password')
+        wn_models.Preferences.objects.create(user=self.user, name='lifter', body_weight=80)
+        self.session_key = tokens.issue_token(self.user)
+        body_part = wn_models.BodyPart.objects.create(name='chest')
+        category = wn_models.Category.objects.create(name='barbell')
+        self.exercises = [wn_models.Exercise.objects.create(name=f'exercise {i}', body_part=body_part, category=category) for i in range(5)]
+
+    def post(self, path, **params):
+        response = self.client.post(path, data=json.dumps(params), content_type='application/json')
+        return json.loads(b''.join(response.streaming_content) if response.streaming else response.content)
+
+    def create_workouts(self, count, lifts_per_workout=3):
+        workout_sessions = []
+        for i in range(count):
+            workout_session = wn_models.WorkoutSession.objects.create(user=self.user, title=f'workout {i}')
+            wn_models.Lift.bulk_insert(workout_session, [(self.exercises[j % len(self.exercises)], 50 + j, 5) for j in range(lifts_per_workout)])
+            workout_sessions += [workout_session]
+        return workout_sessions
+
+
+class TombstoneTest(ApiTestCase):
+    def test_removed_workout_leaves_tombstones_of_its_lifts(self):
+        workout_session = self.create_workouts(1, lifts_per_workout=3)[0]
+        lift_ids = set(wn_models.Lift.objects.filter(workout_session=workout_session).values_list('id', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.post('/api/remove_workout/', sessionKey=self.session_key, workout_session_id=workout_session.id)['success'])
+        tombstones = set(wn_models.Tombstone.objects.filter(user=self.user).values_list('model_name', 'object_id'))
+        self.assertEqual(tombstones, {('WorkoutSession', workout_session.id)} | {('Lift', lift_id) for lift_id in lift_ids})
+
+    def test_tombstones_are_bulk_inserted(self):
+        workout_sessions = self.create_workouts(3, lifts_per_workout=4)
+        with self.assertNumQueries(6), self.captureOnCommitCallbacks(execute=True):  # collect workouts, favorites and lifts, delete workouts and lifts, insert tombstones
+            wn_models.WorkoutSession.objects.filter(id__in=[workout_session.id for workout_session in workout_sessions]).delete()
+        self.assertEqual(wn_models.Tombstone.objects.filter(user=self.user).count(), 3 + 12)
+
+    def test_removed_lift_tombstone(self):
+        workout_session = self.create_workouts(1, lifts_per_workout=2)[0]
+        lift = wn_models.Lift.objects.filter(workout_session=workout_session).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.post('/api/remove_lift/', sessionKey=self.session_key, workout_session_id=workout_session.id, lift_id=lift.id)['success'])
+        self.assertEqual(list(wn_models.Tombstone.objects.filter(user=self.user).values_list('model_name', 'object_id')), [('Lift', lift.id)])
+
+    def test_deleted_user_leaves_no_tombstones(self):
+        self.create_workouts(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(wn_models.Tombstone.objects.count(), 0)
+
+    def test_rolled_back_deletion_leaves_no_tombstones(self):
+        workout_session_id = self.create_workouts(1)[0].id
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    wn_models.WorkoutSession.objects.get(id=workout_session_id).delete()
+                    raise RuntimeError()
+            except RuntimeError:
+                pass
+            wn_models.Lift.objects.filter(workout_session_id=workout_session_id).first().delete()
+        self.assertEqual(wn_models.Tombstone.objects.filter(user=self.user).count(), 1)
+
+    def test_rolled_back_savepoint_drops_only_its_tombstones(self):
+        kept_workout_session, rolled_back_workout_session = self.create_workouts(2, lifts_per_workout=1)
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            wn_models.Lift.objects.filter(workout_session=kept_workout_session).delete()  # the outer transaction already buffers a tombstone
+            try:
+                with transaction.atomic():
+                    wn_models.WorkoutSession.objects.filter(id=rolled_back_workout_session.id).delete()
+                    raise RuntimeError()
+            except RuntimeError:
+                pass
+        self.assertTrue(wn_models.WorkoutSession.objects.filter(id=rolled_back_workout_session.id).exists())
+        self.assertEqual(list(wn_models.Tombstone.objects.filter(user=self.user).values_list('model_name', flat=True)), ['Lift'])
+
+    def test_unsynced_models_keep_fast_deletes(self):
+        for model in [wn_models.Tombstone, wn_models.TrainingVolume]:
+            self.assertFalse(post_delete.has_listeners(model) or pre_delete.has_listeners(model), model.__name__)
+
+    def test_expired_sync_token_gets_a_full_sync(self):
+        self.create_workouts(1)
+        expired_token = sync.encode_sync_token(sync.tz.now() - sync.SYNC_TOKEN_MAX_AGE - sync.datetime.timedelta(days=1))
+        response = self.post('/api/sync/', sessionKey=self.session_key, syncToken=expired_token)
+        self.assertTrue(response['fullSync'])
+        self.assertEqual(len(response['workouts']), 1)
+
+    def test_purge_tombstones(self):
+        self.create_workouts(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            wn_models.WorkoutSession.objects.filter(user=self.user).delete()
+        wn_models.Tombstone.objects.update(deleted_at=sync.tz.now() - sync.SYNC_TOKEN_MAX_AGE - sync.datetime.timedelta(seconds=1))
+        self.assertEqual(sync.purge_tombstones(), 4)
+
+
+class SessionTest(ApiTestCase):
+    def test_resolved_user_is_cached(self):
+        with self.assertNumQueries(1):  # user, preferences and token generation in one query
+            user = sessions.resolve_user(self.session_key)
+            self.assertEqual(user.preferences.name, 'lifter')
+        with self.assertNumQueries(0):
+            self.assertEqual(sessions.resolve_user(self.session_key).id, self.user.id)
+
+    def test_legacy_session_key_is_cached(self):
+        api_models.SessionKey.objects.create(user=self.user, key='legacy-session-key')
+        with self.assertNumQueries(1):
+            self.assertEqual(sessions.resolve_user('legacy-session-key').id, self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(sessions.resolve_user('legacy-session-key').preferences.name, 'lifter')
+
+    def test_resolved_users_are_not_shared(self):
+        user = sessions.resolve_user(self.session_key)
+        user.set_password('changed but not saved')
+        user.preferences.name = 'changed but not saved'
+        other = sessions.resolve_user(self.session_key)
+        self.assertIsNot(other, user)
+        self.assertTrue(other.check_password('password'))
+        self.assertEqual(other.preferences.name, 'lifter')
+
+    def test_cached_user_is_dropped_on_changes(self):
+        sessions.resolve_user(self.session_key)
+        self.assertTrue(self.post('/api/update_settings/', sessionKey=self.session_key, new_name='renamed', new_date_of_birth='2000-01-01', new_gender=wn_models.Preferences.Gender.MALE, new_is_profile_shared=False)['success'])
+        self.assertEqual(sessions.resolve_user(self.session_key).preferences.name, 'renamed')
+        tokens.revoke_tokens(self.user)
+        self.assertIsNone(sessions.resolve_user(self.session_key))
+
+
+class TokenTest(ApiTestCase):
+    def test_tokens_expire(self):
+        self.assertIsNotNone(tokens.TOKEN_MAX_AGE)
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + tokens.TOKEN_MAX_AGE + 1):
+            self.assertIsNone(sessions.resolve_user(self.session_key))
+
+    def test_password_reset_token_is_not_a_session_key(self):
+        reset_token = tokens.issue_password_reset_token(self.user)
+        self.assertIsNone(sessions.resolve_user(reset_token))
+        self.assertIsNone(sessions.resolve_password_reset_token(self.session_key))
+        self.assertEqual(sessions.resolve_password_reset_token(reset_token).id, self.user.id)
+
+    def test_password_reset_token_expires(self):
+        reset_token = tokens.issue_password_reset_token(self.user)
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + tokens.PASSWORD_RESET_TOKEN_MAX_AGE + 1):
+            self.assertIsNone(sessions.resolve_password_reset_token(reset_token))
+
+    def test_password_reset_link_is_single_use(self):
+        reset_token = tokens.issue_password_reset_token(self.user)
+        self.assertEqual(self.client.get('/reset-password/', {'k': reset_token}).status_code, 200)
+        self.client.post('/reset-password/', {'sessionKey': reset_token, 'new_password': 'new password'})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new password'))
+        self.assertIsNone(sessions.resolve_password_reset_token(reset_token))
+        self.assertIsNone(sessions.resolve_user(self.session_key))
+        self.assertEqual(self.client.get('/reset-password/', {'k': reset_token}).status_code, 302)
+
+
+class FetchWorkoutsTest(ApiTestCase):
+    def fetch_workouts(self, **params):
+        return self.post('/api/fetch_workouts/', sessionKey=self.session_key, fromTimestampMs=0, tillTimestampMs=int(time.time() * 1000) + 60_000, **params)
+
+    def test_constant_number_of_queries(self):
+        sessions.resolve_user(self.session_key)  # warm session cache
+        for new_workouts, total_workouts in [(1, 1), (9, 10)]:
+            self.create_workouts(new_workouts, lifts_per_workout=4)
+            with self.assertNumQueries(3):  # workout sessions, lifts with exercises, favorites
+                workouts = self.fetch_workouts()['workouts']
+            self.assertEqual(len(workouts), total_workouts)
+            self.assertTrue(all(len(workout['lifts']) == 4 for workout in workouts))
+
+    def test_constant_number_of_queries_paginated_and_streamed(self):
+        self.create_workouts(10, lifts_per_workout=4)
+        sessions.resolve_user(self.session_key)
+        with self.assertNumQueries(3):
+            response = self.fetch_workouts(limit=5)
+        self.assertEqual(len(response['workouts']), 5)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.fetch_workouts(limit=5, cursor=response['nextCursor'])['workouts']), 5)
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.fetch_workouts(stream='true')['workouts']), 10)
+
+    def test_favorite_workouts_constant_number_of_queries(self):
+        for workout_session in self.create_workouts(6):
+            wn_models.FavoriteWorkout.objects.create(user=self.user, workout_session=workout_session)
+        sessions.resolve_user(self.session_key)
+        with self.assertNumQueries(2):  # workout sessions, lifts with exercises
+            self.assertEqual(len(self.post('/api/fetch_favorite_workouts/', sessionKey=self.session_key)['workouts']), 6)
+
+
+class CatalogTest(ApiTestCase):
+    def test_registry_is_cached(self):
+        catalog.get_registry()
+        with self.assertNumQueries(0):
+            self.assertEqual(len(catalog.get_registry().exercises), 5)
+
+    def test_version_changed_by_another_process_is_picked_up(self):
+        catalog.get_registry()
+        wn_models.Exercise.objects.bulk_create([wn_models.Exercise(name='exercise 5', body_part=self.exercises[0].body_part, category=self.exercises[0].category)])
+        wn_models.CatalogVersion.bump()  # as e.g. the import_exercises command would, this process' caches are untouched
+        self.assertEqual(len(catalog.get_registry().exercises), 5)
+        with mock.patch.object(catalog, 'VERSION_CHECK_INTERVAL', 0):
+            self.assertEqual(len(catalog.get_registry().exercises), 6)
+
+    def test_import_changes_the_version(self):
+        version = wn_models.CatalogVersion.get_current()
+        catalog_import.import_catalog([{'name': 'new exercise', 'body_part': 'chest', 'category': 'barbell', 'translations': {}}])
+        self.assertNotEqual(wn_models.CatalogVersion.get_current(), version)
+        self.assertIsNotNone(catalog.get_registry().get_exercise_by_name('new exercise'))
+
+    def test_etag(self):
+        response = self.client.post('/api/fetch_exercises/')
+        self.assertEqual(self.client.post('/api/fetch_exercises/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.exercises[0].save()
+        self.assertEqual(self.client.post('/api/fetch_exercises/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class LocalDateTest(ApiTestCase):
+    def test_fetch_workout_days_is_read_only(self):
+        self.create_workouts(3)
+        sessions.resolve_user(self.session_key)
+        with self.assertNumQueries(1):
+            response = self.post('/api/fetch_workout_days/', sessionKey=self.session_key, timezoneOffsetMinutes=0)
+        self.assertEqual(len(response['workoutDays']), 1)
+
+    def test_saving_a_workout_reads_the_timezone_offset_only(self):
+        self.user.preferences.timezone_offset_minutes = -9 * 60
+        self.user.preferences.save()
+        user = sessions.resolve_user(self.session_key)
+        with self.assertNumQueries(1):  # insert, preferences are loaded along with the session's user
+            workout_session = wn_models.WorkoutSession.objects.create(user=user, title='cached user')
+        with self.assertNumQueries(2):  # timezone offset, insert
+            wn_models.WorkoutSession.objects.create(user_id=self.user.id, title='user id only')
+        self.assertEqual(workout_session.local_date, wn_models.WorkoutSession.compute_local_date(workout_session.timestamp, -9 * 60))
+
+    def test_backfill_local_dates(self):
+        other_user = django_User.objects.create_user(username='other@workoutnote.com', password='password')
+        wn_models.Preferences.objects.create(user=other_user, timezone_offset_minutes=-9 * 60)
+        no_preferences_user = django_User.objects.create_user(username='new@workoutnote.com', password='password')
+        for user in [self.user, other_user, no_preferences_user]:
+            wn_models.WorkoutSession.objects.create(user=user)
+        wn_models.WorkoutSession.objects.update(local_date=None)
+        self.assertEqual(wn_models.WorkoutSession.backfill_local_dates(), 3)
+        for workout_session in wn_models.WorkoutSession.objects.select_related('user__preferences'):
+            self.assertEqual(workout_session.local_date, wn_models.WorkoutSession.compute_local_date(workout_session.timestamp, wn_models.Preferences.get_timezone_offset_minutes(workout_session.user)))
+
+
+class StrengthLevelsTest(ApiTestCase):
+    def test_best_lifts_are_read_from_personal_records(self):
+        squat = wn_models.Exercise.objects.create(name='스쿼트', body_part=self.exercises[0].body_part, category=self.exercises[0].category)
+        self.user.preferences.date_of_birth = '1990-01-01'
+        self.user.preferences.save()
+        workout_session = wn_models.WorkoutSession.objects.create(user=self.user)
+        wn_models.Lift.bulk_insert(workout_session, [(squat, 100, 5), (squat, 120, 1)])
+        wn_models.Lift.objects.filter(workout_session=workout_session).update(one_rep_max=1000)  # not a personal record
+        response = self.post('/api/fetch_strength_levels/', sessionKey=self.session_key)
+        self.assertTrue(response['success'])
+        self.assertEqual([(level['exercise_name'], level['best_one_rep_max']) for level in response['levels']], [('스쿼트', 123.0)])
+
+
+class LeaderboardTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.exercise = self.exercises[0]
+        for name, lift_mass in [('rival', 120), ('lifter', 100), ('tied', 100)]:
+            user = self.user if name == 'lifter' else django_User.objects.create_user(username=f'{name}@workoutnote.com', password='password')
+            if user != self.user:
+                wn_models.Preferences.objects.create(user=user, name=name, body_weight=80)
+            wn_models.Lift.bulk_insert(wn_models.WorkoutSession.objects.create(user=user), [(self.exercise, lift_mass, 1)])
+
+    def fetch_leaderboard(self, **params):
+        return self.post('/api/fetch_leaderboard/', sessionKey=self.session_key, exercise_id=self.exercise.id, **params)
+
+    def test_ranks_and_viewer(self):
+        response = self.fetch_leaderboard()
+        self.assertTrue(response['success'])
+        self.assertEqual([(entry['rank'], entry['name'], entry['is_me']) for entry in response['leaderboard']], [(1, 'rival', False), (2, 'lifter', True), (2, 'tied', False)])
+        self.assertEqual(response['my_rank'], 2)
+
+    def test_limit(self):
+        response = self.fetch_leaderboard(limit=1)
+        self.assertEqual([entry['name'] for entry in response['leaderboard']], ['rival'])
+        self.assertEqual(response['my_rank'], 2)
+
+    def test_invalid_limit_is_rejected(self):
+        for limit in [0, -1, 'ten', None]:
+            response = self.fetch_leaderboard(limit=limit)
+            self.assertFalse(response['success'], limit)
+            self.assertTrue(response['reason'].startswith('bad params'), limit)
+
+
+class LiftAggregatesTest(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.workout_session = self.create_workouts(1, lifts_per_workout=5)[0]
+        self.lift = wn_models.Lift.objects.filter(workout_session=self.workout_session).order_by('id').first()
+        sessions.resolve_user(self.session_key)
+
+    def assert_aggregates_match_lifts(self):
+        records = {record.exercise_id: (record.best_one_rep_max, record.heaviest_lift_mass, record.best_repetitions) for record in wn_models.PersonalRecord.objects.filter(user=self.user)}
+        computed = {exercise_id: (record.best_one_rep_max, record.heaviest_lift_mass, record.best_repetitions) for exercise_id, record in aggregates._compute_personal_records(self.user.id).items()}
+        self.assertEqual(records, computed)
+        entries = dict(wn_models.LeaderboardEntry.objects.filter(user=self.user).values_list('exercise_id', 'one_rep_max'))
+        self.assertEqual(entries, {exercise_id: best_one_rep_max for exercise_id, (best_one_rep_max, _, _) in records.items()})
+        volume = sum(lift_mass * repetitions for lift_mass, repetitions in wn_models.Lift.objects.filter(workout_session=self.workout_session).values_list('lift_mass', 'repetitions'))
+        self.assertEqual(sum(wn_models.TrainingVolume.objects.filter(user=self.user, period=wn_models.TrainingVolume.Period.DAY).values_list('volume', flat=True)), volume)
+
+    def update_lift(self, exercise, lift_mass, repetitions):
+        return self.post('/api/update_lift/', sessionKey=self.session_key, workout_session_id=self.workout_session.id, lift_id=self.lift.id, new_exercise_id=exercise.id, new_lift_mass=lift_mass, new_repetitions=repetitions)
+
+    def test_insert_lift(self):
+        with self.assertNumQueries(12):
+            response = self.post('/api/insert_lift/', sessionKey=self.session_key, workout_session_id=self.workout_session.id, exercise_id=self.exercises[0].id, lift_mass=200, repetitions=5)
+        self.assertTrue(response['success'])
+        self.assert_aggregates_match_lifts()
+
+    def test_update_lift(self):
+        with self.assertNumQueries(17):  # the record holder moves to another exercise
+            self.assertTrue(self.update_lift(self.exercises[1], 300, 3)['success'])
+        self.assert_aggregates_match_lifts()
+
+    def test_unchanged_lift_update_skips_the_aggregates(self):
+        with self.assertNumQueries(7):  # workout session and lift checks, the update in its transaction
+            self.assertTrue(self.update_lift(self.exercises[0], self.lift.lift_mass, self.lift.repetitions)['success'])
+        self.assert_aggregates_match_lifts()
+
+    def test_remove_lift(self):
+        with self.assertNumQueries(17):
+            response = self.post('/api/remove_lift/', sessionKey=self.session_key, workout_session_id=self.workout_session.id, lift_id=self.lift.id)
+        self.assertTrue(response['success'])
+        self.assert_aggregates_match_lifts()
+
+    def test_personal_record_of_an_exercise_missing_from_the_catalog(self):
+        registry = catalog.ExerciseRegistry(exercises=[exercise for exercise in catalog.get_registry().exercises if exercise != self.exercises[0]], body_parts=[])
+        with mock.patch.object(catalog, 'get_registry', return_value=registry):
+            response = self.post('/api/fetch_personal_records/', sessionKey=self.session_key)
+        self.assertTrue(response['success'])
+        self.assertEqual({record['exercise_id']: record['exercise_name'] for record in response['personal_records']}, {exercise.id: None if exercise == self.exercises[0] else exercise.name for exercise in self.exercises})
+
+    def test_concurrent_first_lift_of_an_exercise(self):
+        exercise = self.exercises[4]
+        wn_models.Lift.objects.filter(exercise=exercise).delete()
+        aggregates.rebuild_personal_records(self.user.id)
+        bulk_create = wn_models.PersonalRecord.objects.bulk_create
+
+        def concurrent_bulk_create(records, **kwargs):
+            # another request inserted the record after this one found it missing
+            wn_models.PersonalRecord.objects.create(user=self.user, exercise=exercise, best_one_rep_max=500, heaviest_lift_mass=10, best_repetitions={'10': 40})
+            return bulk_create(records, **kwargs)
+
+        with mock.patch.object(wn_models.PersonalRecord.objects, 'bulk_create', side_effect=concurrent_bulk_create):
+            wn_models.Lift.bulk_insert(self.workout_session, [(exercise, 100, 5)])
+        record = wn_models.PersonalRecord.objects.get(user=self.user, exercise=exercise)
+        self.assertEqual((record.best_one_rep_max, record.heaviest_lift_mass, record.best_repetitions), (500, 100, {'10': 40, '100': 5}))
+
+
+class QueryPlanTest(TestCase):
+    """
+    Runs EXPLAIN on the main queries of API endpoints over a small seeded dataset and fails if any of them scans a whole table or index.
+    Production runs PostgreSQL, SQLite plans are checked too.
+    """
+    SQLITE_FULL_SCAN_REGEX = re.compile(r'\bSCAN (TABLE )?(?!CONSTANT ROW|SUBQUERY)(?P<table>\w+)')  # with or without USING (COVERING) INDEX, SEARCH uses index constraints
+
+    @classmethod
+    def setUpTestData(cls, users=10, workouts_per_user=20, lifts_per_workout=6):
+        body_part = wn_models.BodyPart.objects.create(name='query-plan-body-part')
+        category = wn_models.Category.objects.create(name='query-plan-category')
+        exercises = [wn_models.Exercise.objects.create(name=f'query-plan-exercise-{i}', body_part=body_part, category=category) for i in range(5)]
+        now = timezone.now()
+        for user_index in range(users):
+            user = django_User.objects.create(username=f'query-plan-user-{user_index}@workoutnote.com')
+            wn_models.Preferences.objects.create(user=user, body_weight=60 + user_index)
+            api_models.SessionKey.objects.create(user=user, key=f'query-plan-session-key-{user_index}')
+            wn_models.WorkoutSession.objects.bulk_create([wn_models.WorkoutSession(user=user, title='w', timestamp=now - timedelta(days=i), local_date=(now - timedelta(days=i)).date()) for i in range(workouts_per_user)])
+            workout_sessions = list(wn_models.WorkoutSession.objects.filter(user=user))
+            for workout_session in workout_sessions:
+                wn_models.Lift.bulk_insert(workout_session, [(exercises[i % len(exercises)], 50 + i, 5) for i in range(lifts_per_workout)])
+            wn_models.FavoriteWorkout.objects.bulk_create([wn_models.FavoriteWorkout(user=user, workout_session=workout_session) for workout_session in workout_sessions[::5]])
+            wn_models.FavoriteExercise.objects.bulk_create([wn_models.FavoriteExercise(user=user, exercise=exercise) for exercise in exercises[:2]])
+        cls.user = django_User.objects.get(username='query-plan-user-0@workoutnote.com')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')  # small tables are seq scanned anyway, report only scans without a usable index
+        elif connection.vendor != 'sqlite':
+            self.skipTest(f'unsupported database vendor: {connection.vendor}')
+
+    def endpoint_queries(self):
+        """
+        :return list of (name, queryset) of the main queries endpoints run for the user
+        """
+        user = self.user
+        workout_session = wn_models.WorkoutSession.objects.filter(user=user).order_by('id').first()
+        exercise_id = wn_models.Lift.objects.filter(workout_session=workout_session).values_list('exercise_id', flat=True).first()
+        since = timezone.now() - timedelta(days=7)
+        workout_sessions = wn_models.WorkoutSession.objects.filter(user=user)
+        return [
+            ('session key (legacy)', api_models.SessionKey.objects.filter(key='0' * 32)),
+            ('fetch_workouts (page)', workout_sessions.order_by('timestamp', 'id').filter(Q(timestamp__gt=workout_session.timestamp) | Q(timestamp=workout_session.timestamp, id__gt=workout_session.id))[:51]),
+            ('fetch_workouts (lifts prefetch)', wn_models.Lift.objects.filter(workout_session_id__in=[workout_session.id]).order_by('id')),
+            ('fetch_workouts (favorite ids)', wn_models.FavoriteWorkout.objects.filter(user=user).values_list('workout_session_id', flat=True)),
+            ('fetch_timeline (days)', workout_sessions.filter(lift__isnull=False).order_by('-local_date').values_list('local_date', flat=True).distinct()[:15]),
+            ('fetch_workout_days', workout_sessions.order_by().values_list('local_date', flat=True).distinct()),
+            ('update/remove_lift (lift check)', wn_models.Lift.objects.filter(id=0, workout_session=workout_session)),
+            ('set_favorite_workout (check)', wn_models.FavoriteWorkout.objects.filter(user=user, workout_session=workout_session)),
+            ('fetch_favorite_workouts', wn_models.WorkoutSession.objects.filter(favoriteworkout__user=user).order_by('favoriteworkout__id')),
+            ('set_favorite_exercise (check)', wn_models.FavoriteExercise.objects.filter(user=user, exercise_id=exercise_id)),
+            ('fetch_favorite_exercises', wn_models.FavoriteExercise.objects.filter(user=user)),
+            ('fetch_note', wn_models.Note.objects.filter(user=user, timestamp=since)),
+            ('fetch_1rm_results', wn_models.OneRepMaxResults.objects.filter(user=user).order_by('-timestamp')),
+            ('fetch_targets', wn_models.Target.objects.filter(user=user).order_by('-timestamp')),
+            ('sync (workouts)', workout_sessions.filter(modified_at__gte=since).order_by('id')),
+            ('sync (lifts)', wn_models.Lift.objects.filter(workout_session__user=user, modified_at__gte=since).order_by('id')),
+            ('sync (tombstones)', wn_models.Tombstone.objects.filter(user=user, deleted_at__gte=since)),
+            ('fetch_strength_levels (best lifts)', wn_models.PersonalRecord.objects.filter(user=user, exercise_id__in=[exercise_id])),
+            ('fetch_strength_levels (standards)', wn_models.StrengthStandard.objects.filter(gender=wn_models.Preferences.Gender.MALE, body_weight_bucket=80, age_range='24-39', exercise_id__in=[exercise_id])),
+            ('fetch_personal_records', wn_models.PersonalRecord.objects.filter(user=user).order_by('exercise_id')),
+            ('fetch_training_volume', wn_models.TrainingVolume.objects.filter(user=user, period=wn_models.TrainingVolume.Period.WEEK, start_date__gte=since.date()).order_by('start_date', 'body_part_id')),
+            ('fetch_leaderboard (top)', wn_models.LeaderboardEntry.objects.filter(exercise_id=exercise_id).order_by('-one_rep_max', 'user_id')[:100]),
+            ('fetch_leaderboard (rank)', wn_models.LeaderboardEntry.objects.filter(exercise_id=exercise_id, one_rep_max__gt=100)),
+        ]
+
+    def get_full_scans(self, queryset):
+        """
+        :return (names of the tables scanned whole or through a whole index, plan)
+        """
+        if connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            return sorted({match.group('table') for match in self.SQLITE_FULL_SCAN_REGEX.finditer(plan)}), plan
+
+        plan = json.loads(queryset.explain(format='json'))
+        full_scans = set()
+        nodes = [node['Plan'] for node in plan]
+        while len(nodes) > 0:
+            node = nodes.pop()
+            if node['Node Type'] == 'Seq Scan' or (node['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in node):
+                full_scans.add(node['Relation Name'])
+            nodes += node.get('Plans', [])
+        return sorted(full_scans), json.dumps(plan, indent=2)
+
+    def test_endpoint_queries_use_indexes(self):
+        for name, queryset in self.endpoint_queries():
+            with self.subTest(name):
+                full_scans, plan = self.get_full_scans(queryset)
+                self.assertEqual(full_scans, [], f'{name} scans whole tables or indexes:\n{plan}')
+
+    def test_full_index_scans_are_detected(self):
+        full_scans, _ = self.get_full_scans(wn_models.Lift.objects.order_by('workout_session_id', 'id'))
+        self.assertEqual(full_scans, ['workoutnote_django_lift'])
+
+
+class BenchmarkTest(TestCase):
+    """
+    Runs every benchmark scenario once over a tiny seeded dataset (what benchmark_api does over its own database).
+    """
+
+    def setUp(self):
+        sessions.clear()
+        benchmark_api.seed_dataset(users=2, sessions_per_user=5, sets_per_session=3)
+
+    def test_scenarios_succeed_within_query_budgets(self):
+        command = benchmark_api.Command(stdout=io.StringIO())
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)  # e.g. naive datetimes
+            results, failures = command.run_scenarios({'iterations': 1, 'only': None})
+        self.assertEqual(failures, {})
+        self.assertEqual(len(results), len(benchmark_api.api_route_names()) + len(benchmark_api.page_scenarios(None)))
+
+        # latencies depend on the machine, query counts don't
+        with open(benchmark_api.DEFAULT_BUDGETS_PATH, 'r') as r:
+            budgets = json.load(r)
+        query_budgets = {
+            'default': {key: value for key, value in budgets['default'].items() if key != 'p95_ms'},
+            'endpoints': {name: {key: value for key, value in budget.items() if key != 'p95_ms'} for name, budget in budgets['endpoints'].items()},
+        }
+        self.assertEqual(benchmark_api.check_budgets(results, query_budgets), [])
+        self.assertEqual(benchmark_api.check_regressions(results, {'endpoints': results}, tolerance=0, slack_ms=0), [])
@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User as django_User
+from django.db.models import F
+from django.conf import settings
+from django.core import signing
+from api import models
+
+TOKEN_SALT = 'api.tokens'
+TOKEN_MAX_AGE = getattr(settings, 'API_TOKEN_MAX_AGE', 30 * 24 * 3600)
+# password reset links carry a token of their own: short-lived, not accepted as an API sessionKey and single use (the reset revokes its generation)
+PASSWORD_RESET_TOKEN_SALT = 'api.tokens.password_reset'
+PASSWORD_RESET_TOKEN_MAX_AGE = getattr(settings, 'API_PASSWORD_RESET_TOKEN_MAX_AGE', 3600)
+
+
+def is_signed_token(session_key):
+    # legacy session keys are md5 hex digests, signed tokens always contain the ':' separator
+    return ':' in session_key
+
+
+def get_generation(user):
+    try:
+        return user.token_generation.generation
+    except models.TokenGeneration.DoesNotExist:
+        return 0
+
+
+def issue_token(user, salt=TOKEN_SALT):
+    """
+    Issues a signed API token for the user (no database writes, no uniqueness checks).
+    Token carries user id, revocation generation and the issue time (added by the signer).
+    """
+    return signing.dumps([user.id, get_generation(user)], salt=salt, compress=False)
+
+
+def issue_password_reset_token(user):
+    return issue_token(user, salt=PASSWORD_RESET_TOKEN_SALT)
+
+
+def load_token(token, salt=TOKEN_SALT, max_age=TOKEN_MAX_AGE):
+    """
+    Verifies token signature and age (unless max_age is None) without touching the database.
+    :return (user_id, generation) or None if the token is invalid
+    """
+    try:
+        user_id, generation = signing.loads(token, salt=salt, max_age=max_age)
+        return int(user_id), int(generation)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+
+
+def load_password_reset_token(token):
+    return load_token(token, salt=PASSWORD_RESET_TOKEN_SALT, max_age=PASSWORD_RESET_TOKEN_MAX_AGE)
+
+
+def fetch_user(user_id):
+    return django_User.objects.select_related('preferences', 'token_generation').filter(id=user_id).first()
+
+
+def revoke_tokens(user):
+    """ Invalidates every token (and legacy session key) issued to the user so far. """
+    token_generation, _ = models.TokenGeneration.objects.get_or_create(user=user)
+    token_generation.generation = F('generation') + 1
+    token_generation.save()
+    token_generation.refresh_from_db()
+    user.token_generation = token_generation
+    models.SessionKey.objects.filter(user=user).delete()
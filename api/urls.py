@@ -20,14 +20,25 @@ urlpatterns = [
     # workout
     re_path('^insert_workout/?', views.handle_insert_workout_api),
     re_path('^fetch_workouts/?', views.handle_fetch_workouts_api),
+    re_path('^fetch_timeline/?', views.handle_fetch_timeline_api),
     re_path('^update_workout/?', views.handle_update_workout_api),
     re_path('^remove_workout/?', views.handle_remove_workout_api),
 
     # lifts
+    re_path('^insert_lifts/?', views.handle_insert_lifts_api),
     re_path('^insert_lift/?', views.handle_insert_lift_api),
     re_path('^update_lift/?', views.handle_update_lift_api),
     re_path('^remove_lift/?', views.handle_remove_lift_api),
 
+    # personal records
+    re_path('^fetch_personal_records/?', views.handle_fetch_personal_records_api),
+
+    # analytics
+    re_path('^fetch_training_volume/?', views.handle_fetch_training_volume_api),
+
+    # leaderboards
+    re_path('^fetch_leaderboard/?', views.handle_fetch_leaderboard_api),
+
     # favorites
     re_path('^set_favorite_exercise/?', views.handle_set_favorite_exercise_api),
     re_path('^unset_favorite_exercise/?', views.handle_unset_favorite_exercise_api),
@@ -49,10 +60,22 @@ urlpatterns = [
     re_path('^insert_1rm_result/?', views.handle_insert_1rm_result_api),
     re_path('^fetch_1rm_results/?', views.handle_fetch_1rm_results_api),
 
+    # strength standards
+    re_path('^fetch_strength_levels/?', views.handle_fetch_strength_levels_api),
+
+    # calculators
+    re_path('^calculate/?', views.handle_calculate_api),
+
     # target
     re_path('^insert_target/?', views.handle_insert_target_api),
     re_path('^fetch_targets/?', views.handle_fetch_targets_api),
     re_path('^toggle_target/?', views.handle_toggle_target_api),
     re_path('^remove_target/?', views.handle_remove_target_api),
     re_path('^update_target/?', views.handle_update_target_api),
+
+    # sync
+    re_path('^sync/?', views.handle_sync_api),
+
+    # batch
+    re_path('^batch/?', views.handle_batch_api),
 ]
@@ -1,20 +1,32 @@
 import datetime
+import copy
 
 from django.views.decorators.http import require_http_methods
-from workoutnote_django import models as wn_models, settings
+from workoutnote_django import models as wn_models, aggregates, settings, timeline
 from django.contrib.auth.models import User as django_User
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import login, authenticate
 from django.core.mail import EmailMessage
 from django.utils import timezone as tz
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
 from utils.tools import Tools, SmsVerifier
-from api import models
+from utils import calculators
+from api import batch, catalog, loaders, sessions, sync, tokens
+import numpy as np
 import random
-import time
 import json
 import re
 
+FETCH_WORKOUTS_MAX_PAGE_SIZE = 200
+FETCH_TIMELINE_MAX_DAYS = 60
+
+
+def datetime_from_ms(timestamp_ms):
+    # aware datetime of a client's epoch milliseconds (naive ones are read in TIME_ZONE and warned about)
+    return tz.datetime.fromtimestamp(int(timestamp_ms) / 1000, tz=tz.utc)
+
 
 # region auth
 @csrf_exempt
@@ -36,15 +48,8 @@ def handle_login_api(request):
     if not user or not user.is_authenticated:
         return JsonResponse(data={'success': False, 'reason': 'authentication failure'})
 
-    # 3. generate session key and login
-    if not models.SessionKey.objects.filter(user=user).exists():
-        session_key = models.SessionKey.generate_key(email=email)
-        while models.SessionKey.objects.filter(key=session_key).exists():
-            time.sleep(0.001)
-            session_key = models.SessionKey.generate_key(email=email)
-        models.SessionKey.objects.create(user=user, key=session_key)
-    else:
-        session_key = models.SessionKey.objects.get(user=user).key
+    # 3. issue session key (signed token) and login
+    session_key = tokens.issue_token(user)
     login(request=request, user=user)
     return JsonResponse(data={'success': True, 'sessionKey': session_key})
 
@@ -163,17 +168,16 @@ def handle_fetch_settings_api(request):
         session_key = received_params['sessionKey']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. fix preferences (if not exists for some reason*)
-    if not wn_models.Preferences.objects.filter(user=user).exists():
+    if not hasattr(user, 'preferences'):
         wn_models.Preferences.objects.create(user=user)
 
     # 4. fetch preferences
-    preferences = wn_models.Preferences.objects.get(user=user)
+    preferences = user.preferences
     return JsonResponse(data={
         'success': True,
         'name': preferences.name,
@@ -181,6 +185,8 @@ def handle_fetch_settings_api(request):
         'gender': preferences.gender,
         'is_profile_shared': preferences.shared_profile,
         'language': preferences.language,
+        'timezone_offset_minutes': preferences.timezone_offset_minutes,
+        'body_weight': preferences.body_weight,
     })
 
 
@@ -188,7 +194,7 @@ def handle_fetch_settings_api(request):
 @require_http_methods(['POST'])
 def handle_update_settings_api(request):
     # 0. expected and received params
-    required_params = ['sessionKey', 'new_name', 'new_date_of_birth', 'new_gender', 'new_is_profile_shared']
+    required_params = ['sessionKey', 'new_name', 'new_date_of_birth', 'new_gender', 'new_is_profile_shared']  # optional: new_timezone_offset_minutes, new_body_weight
     received_params = request.POST if 'sessionKey' in request.POST else json.loads(request.body.decode('utf8'))
 
     # 1. all params check
@@ -200,24 +206,35 @@ def handle_update_settings_api(request):
         new_date_of_birth = received_params['new_date_of_birth']
         new_gender = received_params['new_gender']
         new_is_profile_shared = received_params['new_is_profile_shared']
+        new_timezone_offset_minutes = int(received_params['new_timezone_offset_minutes']) if 'new_timezone_offset_minutes' in received_params else None
+        new_body_weight = float(received_params['new_body_weight']) if received_params.get('new_body_weight') not in (None, '') else None
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. fix preferences (if not exists for some reason*)
-    if not wn_models.Preferences.objects.filter(user=user).exists():
+    if not hasattr(user, 'preferences'):
         wn_models.Preferences.objects.create(user=user)
 
     # 4. update preferences
-    preferences = wn_models.Preferences.objects.get(user=user)
+    preferences = user.preferences
     preferences.name = new_name
     preferences.date_of_birth = new_date_of_birth
     preferences.gender = new_gender
     preferences.shared_profile = new_is_profile_shared
+    if new_body_weight is not None:
+        preferences.body_weight = new_body_weight
+    timezone_changed = new_timezone_offset_minutes is not None and new_timezone_offset_minutes != preferences.timezone_offset_minutes
+    if timezone_changed:
+        preferences.timezone_offset_minutes = new_timezone_offset_minutes
     preferences.save()
+
+    # 5. recompute workout days (and their volume rollups) in the new timezone
+    if timezone_changed:
+        wn_models.WorkoutSession.update_local_dates(user)
+        aggregates.rebuild_training_volume(user.id)
     return JsonResponse(data={'success': True})
 
 
@@ -240,22 +257,15 @@ def handle_send_reset_password_email_api(request):
         if not is_email and not is_phone:
             return JsonResponse(data={'success': False, 'reason': f'bad params, must be valid phone / email'})
 
-    # 2. check user and session_key
+    # 2. check user and issue session_key
     if not django_User.objects.filter(username=username).exists():
         return JsonResponse(data={'success': False, 'reason': 'user does not exist'})
     else:
         user = django_User.objects.get(username=username)
-    if not models.SessionKey.objects.filter(user__username=username).exists():
-        session_key = models.SessionKey.generate_key(email=username)
-        while models.SessionKey.objects.filter(key=session_key).exists():
-            time.sleep(0.001)
-            session_key = models.SessionKey.generate_key(email=username)
-        models.SessionKey.objects.create(user=user, key=session_key)
-    else:
-        session_key = models.SessionKey.objects.get(user=user).key
+    reset_token = tokens.issue_password_reset_token(user)
 
     # 3. generate email confirmation code
-    reset_link = f'https://workoutnote.com/reset-password/?k={session_key}'
+    reset_link = f'https://workoutnote.com/reset-password/?k={reset_token}'
     if is_email:
         email_message = EmailMessage(
             'Workoutnote.com password reset link (do not share this!)',
@@ -280,37 +290,13 @@ def handle_send_reset_password_email_api(request):
 @csrf_exempt
 @require_http_methods(['POST'])
 def handle_fetch_exercises_api(request):
-    exercises = wn_models.Exercise.objects.all()
-    exercises_arr = []
-    for exercise in exercises:
-        exercises_arr += [{
-            'id': exercise.id,
-            'name': exercise.name,
-            'name_translations': exercise.name_translations,
-            'body_part_str': exercise.body_part.name,
-            'category_str': exercise.category.name,
-            'icon_str': exercise.icon.name,
-        }]
-    return JsonResponse(data={
-        'success': True,
-        'exercises': exercises_arr
-    })
+    return catalog.catalog_response(request, 'exercises')
 
 
 @csrf_exempt
 @require_http_methods(['POST'])
 def handle_fetch_body_parts_api(request):
-    body_parts = wn_models.BodyPart.objects.all()
-    body_parts_arr = []
-    for body_part in body_parts:
-        body_parts_arr += [{
-            'id': body_part.id,
-            'name': body_part.name,
-        }]
-    return JsonResponse(data={
-        'success': True,
-        'body_parts': body_parts_arr
-    })
+    return catalog.catalog_response(request, 'body_parts')
 
 
 # endregion
@@ -334,10 +320,9 @@ def handle_insert_workout_api(request):
         timestamp = int(tz.datetime.now().timestamp() * 1000)
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. create workout session
     workout_session = wn_models.WorkoutSession.objects.create(user=user, timestamp=timestamp, title=title, duration=duration)
@@ -355,7 +340,7 @@ def handle_insert_workout_api(request):
 @csrf_exempt
 def handle_fetch_workouts_api(request):
     # 0. expected and received params
-    required_params = ['sessionKey', 'fromTimestampMs', 'tillTimestampMs']
+    required_params = ['sessionKey', 'fromTimestampMs', 'tillTimestampMs']  # optional: limit & cursor (paginated), stream
     received_params = request.POST if 'sessionKey' in request.POST else json.loads(request.body.decode('utf8'))
 
     # 1. all params check
@@ -363,43 +348,83 @@ def handle_fetch_workouts_api(request):
         return JsonResponse(data={'success': False, 'reason': f'bad params, must provide {",".join(required_params)}'})
     else:
         session_key = received_params['sessionKey']
-        date_from_ts = tz.datetime.utcfromtimestamp(int(received_params['fromTimestampMs']) / 1000)
-        date_till_ts = tz.datetime.utcfromtimestamp(int(received_params['tillTimestampMs']) / 1000)
+        date_from_ts = datetime_from_ms(received_params['fromTimestampMs'])
+        date_till_ts = datetime_from_ms(received_params['tillTimestampMs'])
+        stream = str(received_params.get('stream', False)).lower() == 'true'
+        paginated = 'limit' in received_params or 'cursor' in received_params
+        try:
+            limit = min(int(received_params.get('limit', FETCH_WORKOUTS_MAX_PAGE_SIZE)), FETCH_WORKOUTS_MAX_PAGE_SIZE)
+            after = loaders.decode_cursor(received_params['cursor']) if received_params.get('cursor') else None
+        except ValueError:
+            return JsonResponse(data={'success': False, 'reason': 'bad params, invalid limit or cursor value'})
+        if limit < 1:
+            return JsonResponse(data={'success': False, 'reason': 'bad params, limit must be positive'})
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. fetch workouts
-    workout_sessions = []
-    for workout_session in wn_models.WorkoutSession.objects.filter(user=user, timestamp__gte=date_from_ts, timestamp__lt=date_till_ts):
-        lifts = []
-        for lift in wn_models.Lift.objects.filter(workout_session=workout_session):
-            lifts += [{
-                'id': lift.id,
-                'timestamp': int(lift.timestamp.timestamp() * 1000),
-                'one_rep_max': lift.one_rep_max,
-                'exercise_id': lift.exercise.id,
-                'exercise_name': lift.exercise.name,
-                'exercise_name_translations': lift.exercise.name_translations,
-                'lift_mass': lift.lift_mass,
-                'repetitions': lift.repetitions,
-            }]
-        workout_sessions += [
-            {
-                'id': workout_session.id,
-                'title': workout_session.title,
-                'timestamp': int(workout_session.timestamp.timestamp() * 1000),
-                'duration': workout_session.duration,
-                'isFavorite': wn_models.FavoriteWorkout.objects.filter(user=user, workout_session=workout_session).exists(),
-                'lifts': lifts
-            }
-        ]
+    workout_sessions = wn_models.WorkoutSession.objects.filter(user=user, timestamp__gte=date_from_ts, timestamp__lt=date_till_ts)
+    if stream:
+        def stream_workouts():
+            yield '{"success": true, "workouts": ['
+            for index, workout_session in enumerate(loaders.iterate_workouts(user, workout_sessions)):
+                yield (', ' if index > 0 else '') + json.dumps(workout_session, cls=DjangoJSONEncoder)
+            yield ']}'
+
+        return StreamingHttpResponse(stream_workouts(), content_type='application/json')
+    elif paginated:
+        page, has_more = loaders.fetch_workouts_page(workout_sessions, after=after, limit=limit)
+        return JsonResponse(data={
+            'success': True,
+            'workouts': loaders.load_workouts(user, page),
+            'nextCursor': loaders.encode_cursor(page[-1]) if has_more else None,
+        })
+    else:
+        return JsonResponse(data={
+            'success': True,
+            'workouts': loaders.load_workouts(user, workout_sessions),
+        })
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def handle_fetch_timeline_api(request):
+    # 0. expected and received params
+    required_params = ['sessionKey', 'beforeDate']  # beforeDate: YYYY-MM-DD (timeline_before of the rendered page), optional: days, favoritesOnly
+    received_params = request.POST if 'sessionKey' in request.POST else json.loads(request.body.decode('utf8'))
+
+    # 1. all params check
+    if False in [x in received_params for x in required_params]:
+        return JsonResponse(data={'success': False, 'reason': f'bad params, must provide {",".join(required_params)}'})
+    else:
+        session_key = received_params['sessionKey']
+        favorites_only = str(received_params.get('favoritesOnly', False)).lower() == 'true'
+        try:
+            before = datetime.date.fromisoformat(received_params['beforeDate'])
+            days = min(int(received_params.get('days', timeline.TIMELINE_DAYS)), FETCH_TIMELINE_MAX_DAYS)
+        except ValueError:
+            return JsonResponse(data={'success': False, 'reason': 'bad params, invalid beforeDate / days value'})
+
+    # 2. sessionKey check
+    user = sessions.resolve_user(session_key)
+    if user is None:
+        return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
+
+    # 3. fetch older days of the timeline
+    workout_sessions = wn_models.WorkoutSession.objects.filter(user=user)
+    if favorites_only:
+        workout_sessions = workout_sessions.filter(favoriteworkout__user=user)
+    workouts_by_days, next_before = timeline.build_timeline(workout_sessions, days=max(days, 1), before=before)
     return JsonResponse(data={
         'success': True,
-        'workouts': workout_sessions,
+        'days': [{
+            'dayStr': day_str,
+            'workouts': [loaders.serialize_workout_session(workout_session) for workout_session in day_workouts],
+        } for day_str, day_workouts in workouts_by_days.items()],
+        'nextBeforeDate': next_before.isoformat() if next_before is not None else None,
     })
 
 
@@ -419,10 +444,9 @@ def handle_update_workout_api(request):
         new_duration = received_params['new_duration']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. workout_session_id check
     if not wn_models.WorkoutSession.objects.filter(id=workout_session_id, user=user).exists():
@@ -459,10 +483,9 @@ def handle_remove_workout_api(request):
         workout_session_id = received_params['workout_session_id']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. workout_session_id check
     if not wn_models.WorkoutSession.objects.filter(id=workout_session_id, user=user).exists():
@@ -470,8 +493,11 @@ def handle_remove_workout_api(request):
     else:
         workout_session = wn_models.WorkoutSession.objects.get(id=workout_session_id, user=user)
 
-    # 4. remove workout session
-    workout_session.delete()
+    # 4. remove workout session (and its lifts)
+    with transaction.atomic():
+        removed_lifts = list(workout_session.lift_set.all())
+        workout_session.delete()
+        aggregates.lifts_removed(user.id, removed_lifts)
     return JsonResponse(data={
         'success': True,
         'removed_workout_session': {
@@ -491,7 +517,7 @@ def handle_remove_workout_api(request):
 @require_http_methods(['POST'])
 def handle_fetch_workout_days(request):
     # 0. expected and received params
-    required_params = ['sessionKey', 'timezoneOffsetMinutes']
+    required_params = ['sessionKey', 'timezoneOffsetMinutes']  # optional: year & month (limits result to a month window)
     received_params = request.POST if 'sessionKey' in request.POST else json.loads(request.body.decode('utf8'))
 
     # 1. all params check
@@ -500,22 +526,32 @@ def handle_fetch_workout_days(request):
     else:
         session_key = received_params['sessionKey']
         timezone_offset_minutes = int(received_params['timezoneOffsetMinutes'])
+        month_start, month_end = None, None
+        if 'year' in received_params and 'month' in received_params:
+            try:
+                month_start = datetime.date(int(received_params['year']), int(received_params['month']), 1)
+                month_end = (month_start + datetime.timedelta(days=32)).replace(day=1)
+            except ValueError:
+                return JsonResponse(data={'success': False, 'reason': 'bad params, invalid year / month value'})
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
-    # 3. fetch workout days
+    # 3. fetch workout days (distinct local dates, precomputed for user's stored timezone)
     workout_sessions = wn_models.WorkoutSession.objects.filter(user=user)
-    workout_days = set()
-    tss = set()
-    if workout_sessions.exists():
-        for workout_session in workout_sessions:
-            timestamp = workout_session.timestamp - tz.timedelta(minutes=timezone_offset_minutes)
-            workout_days.add(f'{timestamp.year}/{timestamp.month}/{timestamp.day}')
-    return JsonResponse(data={'success': True, 'workoutDays': list(workout_days)})
+    if timezone_offset_minutes == wn_models.Preferences.get_timezone_offset_minutes(user):
+        local_dates = workout_sessions
+        local_date_field = 'local_date'
+    else:
+        local_dates = workout_sessions.annotate(requested_local_date=wn_models.WorkoutSession.local_date_expression(timezone_offset_minutes))
+        local_date_field = 'requested_local_date'
+    if month_start is not None:
+        local_dates = local_dates.filter(**{f'{local_date_field}__gte': month_start, f'{local_date_field}__lt': month_end})
+    local_dates = local_dates.order_by().values_list(local_date_field, flat=True).distinct()
+    workout_days = [f'{local_date.year}/{local_date.month}/{local_date.day}' for local_date in local_dates]
+    return JsonResponse(data={'success': True, 'workoutDays': workout_days})
 
 
 # endregion
@@ -540,10 +576,9 @@ def handle_insert_lift_api(request):
         repetitions = int(received_params['repetitions'])
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. workout_session_id check
     if not wn_models.WorkoutSession.objects.filter(id=workout_session_id, user=user).exists():
@@ -552,20 +587,21 @@ def handle_insert_lift_api(request):
         workout_session = wn_models.WorkoutSession.objects.get(id=workout_session_id, user=user)
 
     # 4. exercise_id check
-    if not wn_models.Exercise.objects.filter(id=exercise_id).exists():
+    exercise = catalog.get_registry().get_exercise(exercise_id)
+    if exercise is None:
         return JsonResponse(data={'success': False, 'reason': f'invalid exerciseId({exercise_id}), please double check the value'})
-    else:
-        exercise = wn_models.Exercise.objects.get(id=exercise_id)
 
     # 5. create lift
-    lift = wn_models.Lift.objects.create(
-        timestamp=int(tz.datetime.now().timestamp() * 1000),
-        workout_session=workout_session,
-        exercise=exercise,
-        lift_mass=lift_mass,
-        repetitions=repetitions,
-        one_rep_max=Tools.calculate_one_rep_max(lift_mass=lift_mass, repetitions=repetitions),
-    )
+    with transaction.atomic():
+        lift = wn_models.Lift.objects.create(
+            timestamp=int(tz.datetime.now().timestamp() * 1000),
+            workout_session=workout_session,
+            exercise=exercise,
+            lift_mass=lift_mass,
+            repetitions=repetitions,
+            one_rep_max=Tools.calculate_one_rep_max(lift_mass=lift_mass, repetitions=repetitions),
+        )
+        aggregates.lifts_inserted(user.id, [lift])
     return JsonResponse(data={
         'success': True,
         'lift': {
@@ -581,6 +617,60 @@ def handle_insert_lift_api(request):
     })
 
 
+@csrf_exempt
+@require_http_methods(['POST'])
+def handle_insert_lifts_api(request):
+    # 0. expected and received params
+    required_params = ['sessionKey', 'workout_session_id', 'sets']  # sets: [{exercise_id, lift_mass, repetitions}, ...]
+    received_params = request.POST if 'sessionKey' in request.POST else json.loads(request.body.decode('utf8'))
+
+    # 1. all params check
+    if False in [x in received_params for x in required_params]:
+        return JsonResponse(data={'success': False, 'reason': f'bad params, must provide {",".join(required_params)}'})
+    else:
+        session_key = received_params['sessionKey']
+        workout_session_id = int(received_params['workout_session_id'])
+        claimed_sets = received_params['sets']
+        if isinstance(claimed_sets, str):
+            claimed_sets = json.loads(claimed_sets)
+        try:
+            claimed_sets = [(int(x['exercise_id']), float(x['lift_mass']), int(x['repetitions'])) for x in claimed_sets]
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse(data={'success': False, 'reason': 'bad params, each set must provide exercise_id,lift_mass,repetitions'})
+
+    # 2. sessionKey check
+    user = sessions.resolve_user(session_key)
+    if user is None:
+        return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
+
+    # 3. workout_session_id check
+    workout_session = wn_models.WorkoutSession.objects.filter(id=workout_session_id, user=user).first()
+    if workout_session is None:
+        return JsonResponse(data={'success': False, 'reason': f'invalid workoutSessionId({workout_session_id}), please double check the value'})
+
+    # 4. exercise_ids check (all at once)
+    exercise_registry = catalog.get_registry()
+    invalid_exercise_ids = sorted({exercise_id for exercise_id, _, _ in claimed_sets if exercise_registry.get_exercise(exercise_id) is None})
+    if len(invalid_exercise_ids) > 0:
+        return JsonResponse(data={'success': False, 'reason': f'invalid exerciseIds({",".join(map(str, invalid_exercise_ids))}), please double check the values'})
+
+    # 5. create lifts
+    lifts = wn_models.Lift.bulk_insert(workout_session=workout_session, sets=[(exercise_registry.get_exercise(exercise_id), lift_mass, repetitions) for exercise_id, lift_mass, repetitions in claimed_sets])
+    return JsonResponse(data={
+        'success': True,
+        'lifts': [{
+            'id': lift.id,
+            'timestamp': int(lift.timestamp.timestamp() * 1000),
+            'exercise_id': lift.exercise.id,
+            'exercise_name': lift.exercise.name,
+            'workout_session_id': lift.workout_session.id,
+            'lift_mass': lift.lift_mass,
+            'repetitions': lift.repetitions,
+            'one_rep_max': lift.one_rep_max,
+        } for lift in lifts]
+    })
+
+
 @csrf_exempt
 @require_http_methods(['POST'])
 def handle_update_lift_api(request):
@@ -600,10 +690,9 @@ def handle_update_lift_api(request):
         new_repetitions = int(received_params['new_repetitions'])
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. workout_session_id check
     if not wn_models.WorkoutSession.objects.filter(id=workout_session_id, user=user).exists():
@@ -615,19 +704,22 @@ def handle_update_lift_api(request):
     if not wn_models.Lift.objects.filter(id=lift_id, workout_session=workout_session).exists():
         return JsonResponse(data={'success': False, 'reason': f'invalid liftId({lift_id}), please double check the value'})
     else:
-        lift = wn_models.Lift.objects.get(id=lift_id, workout_session=workout_session)
+        lift = workout_session.lift_set.get(id=lift_id)  # with its workout session cached, read by the lift hooks
 
     # 5. new_exercise_id check
-    if not wn_models.Exercise.objects.filter(id=new_exercise_id).exists():
+    new_exercise = catalog.get_registry().get_exercise(new_exercise_id)
+    if new_exercise is None:
         return JsonResponse(data={'success': False, 'reason': f'invalid exerciseId({new_exercise_id}), please double check the value'})
-    else:
-        new_exercise = wn_models.Exercise.objects.get(id=new_exercise_id)
 
     # 6. update lift
+    previous_lift = copy.copy(lift)
     lift.exercise = new_exercise
     lift.lift_mass = new_lift_mass
     lift.repetitions = new_repetitions
-    lift.save()
+    lift.one_rep_max = Tools.calculate_one_rep_max(lift_mass=new_lift_mass, repetitions=new_repetitions)
+    with transaction.atomic():
+        lift.save()
+        aggregates.lift_updated(user.id, previous_lift, lift)
     return JsonResponse(data={
         'success': True,
         'lift': {
@@ -659,10 +751,9 @@ def handle_remove_lift_api(request):
         lift_id = int(received_params['lift_id'])
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. workout_session_id check
     if not wn_models.WorkoutSession.objects.filter(id=workout_session_id, user=user).exists():
@@ -674,10 +765,12 @@ def handle_remove_lift_api(request):
     if not wn_models.Lift.objects.filter(id=lift_id, workout_session=workout_session).exists():
         return JsonResponse(data={'success': False, 'reason': f'invalid liftId({lift_id}), please double check the value'})
     else:
-        lift = wn_models.Lift.objects.get(id=lift_id, workout_session=workout_session)
+        lift = workout_session.lift_set.get(id=lift_id)  # with its workout session cached, read by the lift hooks
 
     # 5. remove lift
-    lift.delete()
+    with transaction.atomic():
+        lift.delete()
+        aggregates.lifts_removed(user.id, [lift])
     return JsonResponse(data={
         'success': True,
         'lift': {
@@ -696,6 +789,156 @@ def handle_remove_lift_api(request):
 # endregion
 
 
+# region personal records
+@csrf_exempt
+@require_http_methods(['POST'])
+def handle_fetch_personal_records_api(request):
+    # 0. expected and received params
+    required_params = ['sessionKey']  # optional: exercise_id
+    received_params = request.POST if 'sessionKey' in request.POST else json.loads(request.body.decode('utf8'))
+
+    # 1. all params check
+    if False in [x in received_params for x in required_params]:
+        return JsonResponse(data={'success': False, 'reason': f'bad params, must provide {",".join(required_params)}'})
+    else:
+        session_key = received_params['sessionKey']
+        exercise_id = int(received_params['exercise_id']) if received_params.get('exercise_id') not in (None, '') else None
+
+    # 2. sessionKey check
+    user = sessions.resolve_user(session_key)
+    if user is None:
+        return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
+
+    # 3. fetch personal records
+    personal_records = wn_models.PersonalRecord.objects.filter(user=user)
+    if exercise_id is not None:
+        personal_records = personal_records.filter(exercise_id=exercise_id)
+    exercise_names = {exercise.id: exercise.name for exercise in catalog.get_registry().exercises}
+    return JsonResponse(data={
+        'success': True,
+        'personal_records': [{
+            'exercise_id': personal_record.exercise_id,
+            'exercise_name': exercise_names.get(personal_record.exercise_id),
+            'best_one_rep_max': personal_record.best_one_rep_max,
+            'heaviest_lift_mass': personal_record.heaviest_lift_mass,
+            'best_repetitions': personal_record.best_repetitions,
+            'timestamp': int(personal_record.updated_at.timestamp() * 1000),
+        } for personal_record in personal_records.order_by('exercise_id')]
+    })
+
+
+# endregion
+
+
+# region analytics
+@csrf_exempt
+@require_http_methods(['POST'])
+def handle_fetch_training_volume_api(request):
+    # 0. expected and received params
+    required_params = ['sessionKey', 'period']  # period: DAY / WEEK, optional: since, until (YYYY-MM-DD local dates, inclusive)
+    received_params = request.POST if 'sessionKey' in request.POST else json.loads(request.body.decode('utf8'))
+
+    # 1. all params check
+    if False in [x in received_params for x in required_params]:
+        return JsonResponse(data={'success': False, 'reason': f'bad params, must provide {",".join(required_params)}'})
+    else:
+        session_key = received_params['sessionKey']
+        period = str(received_params['period']).upper()
+        if period not in wn_models.TrainingVolume.Period.ALL:
+            return JsonResponse(data={'success': False, 'reason': f'bad params, period must be one of {",".join(wn_models.TrainingVolume.Period.ALL)}'})
+        try:
+            since = datetime.date.fromisoformat(received_params['since']) if received_params.get('since') else None
+            until = datetime.date.fromisoformat(received_params['until']) if received_params.get('until') else None
+        except ValueError:
+            return JsonResponse(data={'success': False, 'reason': 'bad params, since / until must be YYYY-MM-DD dates'})
+
+    # 2. sessionKey check
+    user = sessions.resolve_user(session_key)
+    if user is None:
+        return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
+
+    # 3. fetch rollups (weeks are matched by their monday)
+    training_volumes = wn_models.TrainingVolume.objects.filter(user=user, period=period)
+    if since is not None:
+        training_volumes = training_volumes.filter(start_date__gte=wn_models.TrainingVolume.get_start_dates(since)[period])
+    if until is not None:
+        training_volumes = training_volumes.filter(start_date__lte=until)
+    body_part_names = {body_part.id: body_part.name for body_part in catalog.get_registry().body_parts}
+    return JsonResponse(data={
+        'success': True,
+        'period': period,
+        'volumes': [{
+            'start_date': start_date.isoformat(),
+            'body_part_id': body_part_id,
+            'body_part_name': body_part_names.get(body_part_id),
+            'volume': volume,
+            'sets': set_count,
+        } for start_date, body_part_id, volume, set_count in training_volumes.order_by('start_date', 'body_part_id').values_list('start_date', 'body_part_id', 'volume', 'set_count')]
+    })
+
+
+# endregion
+
+
+# region leaderboards
+LEADERBOARD_MAX_SIZE = 100
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def handle_fetch_leaderboard_api(request):
+    # 0. expected and received params
+    required_params = ['sessionKey', 'exercise_id']  # optional: gender, body_weight_class (both for a class board), limit
+    received_params = request.POST if 'sessionKey' in request.POST else json.loads(request.body.decode('utf8'))
+
+    # 1. all params check
+    if False in [x in received_params for x in required_params]:
+        return JsonResponse(data={'success': False, 'reason': f'bad params, must provide {",".join(required_params)}'})
+    else:
+        session_key = received_params['sessionKey']
+        exercise_id = int(received_params['exercise_id'])
+        gender = received_params.get('gender') or None
+        body_weight_class = received_params.get('body_weight_class') or None
+        try:
+            limit = min(int(received_params.get('limit', LEADERBOARD_MAX_SIZE)), LEADERBOARD_MAX_SIZE)
+        except (TypeError, ValueError):
+            return JsonResponse(data={'success': False, 'reason': 'bad params, invalid limit value'})
+        if limit < 1:
+            return JsonResponse(data={'success': False, 'reason': 'bad params, limit must be positive'})
+        elif (gender is None) != (body_weight_class is None):
+            return JsonResponse(data={'success': False, 'reason': 'bad params, gender and body_weight_class must be provided together'})
+        elif gender is not None and gender not in wn_models.Preferences.Gender.ALL:
+            return JsonResponse(data={'success': False, 'reason': f'bad params, gender must be one of {",".join(wn_models.Preferences.Gender.ALL)}'})
+
+    # 2. sessionKey check
+    user = sessions.resolve_user(session_key)
+    if user is None:
+        return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
+
+    # 3. exercise_id check
+    if catalog.get_registry().get_exercise(exercise_id) is None:
+        return JsonResponse(data={'success': False, 'reason': f'invalid exerciseId({exercise_id}), please double check the value'})
+
+    # 4. top entries (bounded read in index order)
+    board = wn_models.LeaderboardEntry.objects.filter(exercise_id=exercise_id)
+    if gender is not None:
+        board = board.filter(gender=gender, body_weight_class=str(body_weight_class))
+    top_entries = board.order_by('-one_rep_max', 'user_id').values_list('user_id', 'user__preferences__name', 'one_rep_max')[:limit]
+
+    # 5. viewer's rank (number of better scores + 1)
+    my_entry = board.filter(user=user).values_list('one_rep_max', flat=True).first()
+    my_rank = None if my_entry is None else board.filter(one_rep_max__gt=my_entry).count() + 1
+
+    leaderboard = []
+    for index, (user_id, name, one_rep_max) in enumerate(top_entries):
+        rank = index + 1 if index == 0 or one_rep_max != leaderboard[-1]['one_rep_max'] else leaderboard[-1]['rank']
+        leaderboard += [{'rank': rank, 'name': name, 'one_rep_max': one_rep_max, 'is_me': user_id == user.id}]
+    return JsonResponse(data={'success': True, 'leaderboard': leaderboard, 'my_rank': my_rank, 'my_one_rep_max': my_entry})
+
+
+# endregion
+
+
 # region favorites
 
 @csrf_exempt
@@ -713,16 +956,14 @@ def handle_set_favorite_exercise_api(request):
         exercise_id = int(received_params['exercise_id'])
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. exercise_id check
-    if not wn_models.Exercise.objects.filter(id=exercise_id).exists():
+    exercise = catalog.get_registry().get_exercise(exercise_id)
+    if exercise is None:
         return JsonResponse(data={'success': False, 'reason': f'invalid exerciseId({exercise_id}), please double check the value'})
-    else:
-        exercise = wn_models.Exercise.objects.get(id=exercise_id)
 
     # 4. set exercise as favorite
     if not wn_models.FavoriteExercise.objects.filter(user=user, exercise=exercise).exists():
@@ -745,16 +986,14 @@ def handle_unset_favorite_exercise_api(request):
         exercise_id = int(received_params['exercise_id'])
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. exercise_id check
-    if not wn_models.Exercise.objects.filter(id=exercise_id).exists():
+    exercise = catalog.get_registry().get_exercise(exercise_id)
+    if exercise is None:
         return JsonResponse(data={'success': False, 'reason': f'invalid exerciseId({exercise_id}), please double check the value'})
-    else:
-        exercise = wn_models.Exercise.objects.get(id=exercise_id)
 
     # 4. set exercise as favorite
     if wn_models.FavoriteExercise.objects.filter(user=user, exercise=exercise).exists():
@@ -776,21 +1015,24 @@ def handle_fetch_favorite_exercises_api(request):
         session_key = received_params['sessionKey']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. fetch favorite exercises
+    exercise_registry = catalog.get_registry()
     exercises_arr = []
-    for favorite_exercise in wn_models.FavoriteExercise.objects.filter(user=user):
+    for exercise_id in wn_models.FavoriteExercise.objects.filter(user=user).values_list('exercise_id', flat=True):
+        exercise = exercise_registry.get_exercise(exercise_id)
+        if exercise is None:
+            continue
         exercises_arr += [{
-            'id': favorite_exercise.exercise.id,
-            'name': favorite_exercise.exercise.name,
-            'name_translations': favorite_exercise.exercise.name_translations,
-            'body_part_str': favorite_exercise.exercise.body_part.name,
-            'category_str': favorite_exercise.exercise.category.name,
-            'icon_str': favorite_exercise.exercise.icon.name,
+            'id': exercise.id,
+            'name': exercise.name,
+            'name_translations': exercise.name_translations,
+            'body_part_str': exercise.body_part.name,
+            'category_str': exercise.category.name,
+            'icon_str': exercise.icon.name,
         }]
     return JsonResponse(data={
         'success': True,
@@ -813,10 +1055,9 @@ def handle_set_favorite_workout_api(request):
         workout_session_id = int(received_params['workout_session_id'])
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. workout_session_id check
     if not wn_models.WorkoutSession.objects.filter(id=workout_session_id, user=user).exists():
@@ -845,10 +1086,9 @@ def handle_unset_favorite_workout_api(request):
         workout_session_id = int(received_params['workout_session_id'])
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. workout_session_id check
     if not wn_models.WorkoutSession.objects.filter(id=workout_session_id, user=user).exists():
@@ -876,33 +1116,12 @@ def handle_fetch_favorite_workouts_api(request):
         session_key = received_params['sessionKey']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. fetch favorite workouts
-    workout_sessions_arr = []
-    for favorite_workout in wn_models.FavoriteWorkout.objects.filter(user=user):
-        lifts_arr = []
-        for lift in wn_models.Lift.objects.filter(workout_session=favorite_workout.workout_session):
-            lifts_arr += [{
-                'id': lift.id,
-                'timestamp': int(lift.timestamp.timestamp() * 1000),
-                'one_rep_max': lift.one_rep_max,
-                'exercise_id': lift.exercise.id,
-                'exercise_name': lift.exercise.name,
-                'exercise_name_translations': lift.exercise.name_translations,
-                'lift_mass': lift.lift_mass,
-                'repetitions': lift.repetitions,
-            }]
-        workout_sessions_arr += [{
-            'id': favorite_workout.workout_session.id,
-            'title': favorite_workout.workout_session.title,
-            'timestamp': int(favorite_workout.workout_session.timestamp.timestamp() * 1000),
-            'duration': favorite_workout.workout_session.duration,
-            'lifts': lifts_arr
-        }]
+    workout_sessions_arr = loaders.load_favorite_workouts(user)
     return JsonResponse(data={
         'success': True,
         'workouts': workout_sessions_arr
@@ -927,13 +1146,12 @@ def handle_fetch_note_api(request):
         session_key = received_params['sessionKey']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. fetch note
-    dt = tz.datetime.fromtimestamp(int(received_params['timestamp']) / 1000)
+    dt = datetime_from_ms(received_params['timestamp'])
     if wn_models.Note.objects.filter(user=user, timestamp=dt).exists():
         return JsonResponse(data={
             'success': True,
@@ -960,13 +1178,12 @@ def handle_set_note_api(request):
         session_key = received_params['sessionKey']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. set note
-    dt = tz.datetime.fromtimestamp(int(received_params['timestamp']) / 1000)
+    dt = datetime_from_ms(received_params['timestamp'])
     if wn_models.Note.objects.filter(user=user, timestamp=dt).exists():
         note = wn_models.Note.objects.get(user=user, timestamp=dt)
         note.note = received_params['note']
@@ -1006,10 +1223,9 @@ def handle_insert_1rm_result_api(request):
         print(shoulder, chest, back, _abs, legs)
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. insert 1rm result
     wn_models.OneRepMaxResults.objects.create(user=user, name=name, gender=gender, age=age, height=height, weight=weight, shoulder=shoulder, chest=chest, back=back, abs=_abs, legs=legs)
@@ -1030,10 +1246,9 @@ def handle_fetch_1rm_results_api(request):
         session_key = received_params['sessionKey']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. fetch 1rm results
     name, gender, age, height, weight = '', '', -1, -1, -1
@@ -1054,6 +1269,119 @@ def handle_fetch_1rm_results_api(request):
 # endregion
 
 
+# region strength standards
+@csrf_exempt
+@require_http_methods(['POST'])
+def handle_fetch_strength_levels_api(request):
+    # 0. expected and received params
+    required_params = ['sessionKey']
+    received_params = request.POST if 'sessionKey' in request.POST else json.loads(request.body.decode('utf8'))
+
+    # 1. all params check
+    if False in [x in received_params for x in required_params]:
+        return JsonResponse(data={'success': False, 'reason': f'bad params, must provide {",".join(required_params)}'})
+    else:
+        session_key = received_params['sessionKey']
+
+    # 2. sessionKey check
+    user = sessions.resolve_user(session_key)
+    if user is None:
+        return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
+
+    # 3. user's cohort
+    if not hasattr(user, 'preferences'):
+        wn_models.Preferences.objects.create(user=user)
+    preferences = user.preferences
+    cohort = wn_models.StrengthStandard.get_cohort(preferences.gender, preferences.body_weight, preferences.date_of_birth)
+    if cohort is None:
+        return JsonResponse(data={'success': False, 'reason': 'body weight and date of birth (within supported age ranges) must be set in settings'})
+    gender, body_weight_bucket, age_range = cohort
+
+    # 4. precomputed standards (unique key lookup) and user's best lifts
+    registry = catalog.get_registry()
+    exercises = [registry.get_exercise_by_name(name) for name in Tools.POWERLIFTING_EXERCISE_NAMES]
+    exercise_ids = list(dict.fromkeys(exercise.id for exercise in exercises if exercise is not None))
+    standards = {standard.exercise_id: standard for standard in wn_models.StrengthStandard.objects.filter(gender=gender, body_weight_bucket=body_weight_bucket, age_range=age_range, exercise_id__in=exercise_ids)}
+    best_one_rep_maxes = dict(wn_models.PersonalRecord.objects.filter(user=user, exercise_id__in=exercise_ids).values_list('exercise_id', 'best_one_rep_max'))
+
+    # 5. levels
+    levels = []
+    for exercise_id in exercise_ids:
+        standard = standards.get(exercise_id)
+        best_one_rep_max = best_one_rep_maxes.get(exercise_id)
+        levels += [{
+            'exercise_id': exercise_id,
+            'exercise_name': registry.get_exercise(exercise_id).name,
+            'best_one_rep_max': best_one_rep_max,
+            'level': None if standard is None or best_one_rep_max is None else Tools.get_string_level(standard.get_boundaries(), best_one_rep_max),
+            'boundaries': None if standard is None else standard.get_boundaries(),
+            'sample_size': 0 if standard is None else standard.sample_size,
+        }]
+    return JsonResponse(data={'success': True, 'gender': gender, 'body_weight_bucket': body_weight_bucket, 'age_range': age_range, 'levels': levels})
+
+
+# endregion
+
+
+# region calculators
+CALCULATE_MAX_ITEMS = 10000
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def handle_calculate_api(request):
+    # 0. expected and received params
+    required_params = ['sessionKey', 'lift_masses', 'repetitions']  # optional: body_weights, genders (for wilks scores and body weight ratios)
+    received_params = request.POST if 'sessionKey' in request.POST else json.loads(request.body.decode('utf8'))
+
+    # 1. all params check
+    if False in [x in received_params for x in required_params]:
+        return JsonResponse(data={'success': False, 'reason': f'bad params, must provide {",".join(required_params)}'})
+    else:
+        session_key = received_params['sessionKey']
+        lift_masses = received_params['lift_masses']
+        repetitions = received_params['repetitions']
+        body_weights = received_params.get('body_weights')
+        genders = received_params.get('genders')
+        arrays = [lift_masses, repetitions] + ([body_weights] if body_weights is not None else []) + ([genders] if genders is not None else [])
+        if False in [isinstance(x, list) and len(x) == len(lift_masses) for x in arrays]:
+            return JsonResponse(data={'success': False, 'reason': 'bad params, lift_masses, repetitions, body_weights and genders must be arrays of the same length'})
+        elif len(lift_masses) > CALCULATE_MAX_ITEMS:
+            return JsonResponse(data={'success': False, 'reason': f'bad params, at most {CALCULATE_MAX_ITEMS} items per request'})
+        elif genders is not None and False in [gender in wn_models.Preferences.Gender.ALL for gender in genders]:
+            return JsonResponse(data={'success': False, 'reason': f'bad params, genders must be one of {",".join(wn_models.Preferences.Gender.ALL)}'})
+        elif (body_weights is None) != (genders is None):
+            return JsonResponse(data={'success': False, 'reason': 'bad params, body_weights and genders must be provided together'})
+        try:
+            lift_masses = np.asarray(lift_masses, dtype=np.float64)
+            repetitions = np.asarray(repetitions, dtype=np.float64)
+            body_weights = None if body_weights is None else np.asarray(body_weights, dtype=np.float64)
+        except (TypeError, ValueError):
+            return JsonResponse(data={'success': False, 'reason': 'bad params, lift_masses, repetitions and body_weights must be numbers'})
+        if body_weights is not None and not (body_weights > 0).all():
+            return JsonResponse(data={'success': False, 'reason': 'bad params, body_weights must be positive'})
+
+    # 2. sessionKey check
+    user = sessions.resolve_user(session_key)
+    if user is None:
+        return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
+
+    # 3. calculate (all items at once)
+    one_rep_maxes = calculators.calculate_one_rep_maxes(lift_masses, repetitions)
+    result = {
+        'success': True,
+        'one_rep_maxes': one_rep_maxes.tolist(),
+        'rep_tables': calculators.calculate_rep_tables(one_rep_maxes).tolist(),  # masses for 1..30 repetitions
+    }
+    if body_weights is not None:
+        result['wilks_scores'] = calculators.calculate_wilks_scores(genders, body_weights, one_rep_maxes).tolist()
+        result['body_weight_ratios'] = calculators.calculate_body_weight_ratios(one_rep_maxes, body_weights).tolist()
+    return JsonResponse(data=result)
+
+
+# endregion
+
+
 # region targets
 @csrf_exempt
 @require_http_methods(['POST'])
@@ -1068,14 +1396,13 @@ def handle_insert_target_api(request):
     else:
         session_key = received_params['sessionKey']
         name = received_params['name']
-        start_time = datetime.datetime.fromtimestamp(int(received_params['start_date_ms']) / 1000)
-        end_time = datetime.datetime.fromtimestamp(int(received_params['end_date_ms']) / 1000)
+        start_time = datetime_from_ms(received_params['start_date_ms'])
+        end_time = datetime_from_ms(received_params['end_date_ms'])
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. insert 1rm result
     wn_models.Target.objects.create(user=user, name=name, start_date=start_time, end_date=end_time)
@@ -1096,10 +1423,9 @@ def handle_fetch_targets_api(request):
         session_key = received_params['sessionKey']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. fetch targets
     targets = []
@@ -1124,10 +1450,9 @@ def handle_toggle_target_api(request):
         target_id = received_params['target_id']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. target id check
     if not wn_models.Target.objects.filter(id=target_id, user=user).exists():
@@ -1156,10 +1481,9 @@ def handle_remove_target_api(request):
         target_id = received_params['target_id']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. target id check
     if not wn_models.Target.objects.filter(id=target_id, user=user).exists():
@@ -1186,15 +1510,14 @@ def handle_update_target_api(request):
         session_key = received_params['sessionKey']
         target_id = int(received_params['target_id'])
         name = received_params['name']
-        start_time = datetime.datetime.fromtimestamp(int(received_params['start_date_ms']) / 1000)
-        end_time = datetime.datetime.fromtimestamp(int(received_params['end_date_ms']) / 1000)
+        start_time = datetime_from_ms(received_params['start_date_ms'])
+        end_time = datetime_from_ms(received_params['end_date_ms'])
         achieved = received_params['achieved']
 
     # 2. sessionKey check
-    if not models.SessionKey.objects.filter(key=session_key).exists():
+    user = sessions.resolve_user(session_key)
+    if user is None:
         return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
-    else:
-        user = models.SessionKey.objects.get(key=session_key).user
 
     # 3. target_id check
     if not wn_models.Target.objects.filter(user=user, id=target_id).exists():
@@ -1210,3 +1533,116 @@ def handle_update_target_api(request):
     target.save()
     return JsonResponse(data={'success': True})
 # endregion
+
+
+# region sync
+@csrf_exempt
+@require_http_methods(['POST'])
+def handle_sync_api(request):
+    # 0. expected and received params
+    required_params = ['sessionKey']  # optional: syncToken (returned by the previous sync, omit for a full sync)
+    received_params = request.POST if 'sessionKey' in request.POST else json.loads(request.body.decode('utf8'))
+
+    # 1. all params check
+    if False in [x in received_params for x in required_params]:
+        return JsonResponse(data={'success': False, 'reason': f'bad params, must provide {",".join(required_params)}'})
+    else:
+        session_key = received_params['sessionKey']
+        try:
+            since = sync.decode_sync_token(received_params['syncToken']) if received_params.get('syncToken') else None
+        except ValueError:
+            return JsonResponse(data={'success': False, 'reason': 'bad params, invalid syncToken value'})
+
+    # 2. sessionKey check
+    user = sessions.resolve_user(session_key)
+    if user is None:
+        return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
+
+    # 3. collect changes since the previous sync (too old sync tokens get a full sync, their tombstones may be purged already)
+    if since is not None and sync.is_expired(since):
+        since = None
+    sync_token = sync.next_sync_token(since)
+    changes = sync.collect_changes(user, since)
+    return JsonResponse(data=dict(changes, success=True, fullSync=since is None, syncToken=sync.encode_sync_token(sync_token)))
+
+
+# endregion
+
+
+# region batch
+BATCH_OPERATIONS = {
+    'update_settings': handle_update_settings_api,
+
+    'insert_workout': handle_insert_workout_api,
+    'update_workout': handle_update_workout_api,
+    'remove_workout': handle_remove_workout_api,
+
+    'insert_lift': handle_insert_lift_api,
+    'insert_lifts': handle_insert_lifts_api,
+    'update_lift': handle_update_lift_api,
+    'remove_lift': handle_remove_lift_api,
+
+    'set_favorite_exercise': handle_set_favorite_exercise_api,
+    'unset_favorite_exercise': handle_unset_favorite_exercise_api,
+    'set_favorite_workout': handle_set_favorite_workout_api,
+    'unset_favorite_workout': handle_unset_favorite_workout_api,
+
+    'set_note': handle_set_note_api,
+
+    'insert_1rm_result': handle_insert_1rm_result_api,
+
+    'insert_target': handle_insert_target_api,
+    'toggle_target': handle_toggle_target_api,
+    'remove_target': handle_remove_target_api,
+    'update_target': handle_update_target_api,
+}
+BATCH_MAX_OPERATIONS = 500
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+def handle_batch_api(request):
+    # 0. expected and received params
+    required_params = ['sessionKey', 'operations']  # operations: [{op, params}, ...], params may reference earlier results e.g. "$0.workout_session.id"
+    received_params = json.loads(request.body.decode('utf8'))
+
+    # 1. all params check
+    if False in [x in received_params for x in required_params]:
+        return JsonResponse(data={'success': False, 'reason': f'bad params, must provide {",".join(required_params)}'})
+    else:
+        session_key = received_params['sessionKey']
+        operations = received_params['operations']
+        if not isinstance(operations, list) or len(operations) > BATCH_MAX_OPERATIONS:
+            return JsonResponse(data={'success': False, 'reason': f'bad params, operations must be a list of at most {BATCH_MAX_OPERATIONS} items'})
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS or not isinstance(operation.get('params', {}), dict):
+                return JsonResponse(data={'success': False, 'reason': f'bad params, invalid operation #{index}, supported ops are {",".join(BATCH_OPERATIONS)}'})
+
+    # 2. sessionKey check (once, operations re-use the cached session)
+    user = sessions.resolve_user(session_key)
+    if user is None:
+        return JsonResponse(data={'success': False, 'reason': 'double check sessionKey value'})
+
+    # 3. execute operations in a single transaction
+    results = []
+    try:
+        with transaction.atomic():
+            for index, operation in enumerate(operations):
+                try:
+                    params = batch.resolve_references(operation.get('params', {}), results)
+                    params['sessionKey'] = session_key
+                    result = json.loads(BATCH_OPERATIONS[operation['op']](batch.make_sub_request(request, params)).content)
+                except (ValueError, KeyError, TypeError) as e:
+                    result = {'success': False, 'reason': str(e)}
+                results += [result]
+                if not result.get('success', False):
+                    raise batch.BatchOperationFailed(index=index, result=result)
+    except batch.BatchOperationFailed as e:
+        return JsonResponse(data={
+            'success': False,
+            'reason': f'operation #{e.index} ({operations[e.index]["op"]}) failed, all operations were rolled back',
+            'failedOperation': e.index,
+            'results': results,
+        })
+    return JsonResponse(data={'success': True, 'results': results})
+# endregion
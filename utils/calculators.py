@@ -0,0 +1,42 @@
+from utils.tools import Tools
+import numpy as np
+
+# Wilks coefficient = W * 500 / (a + bx + cx² + dx³ + ex⁴ + fx⁵), rows in GENDERS order
+GENDERS = ['MALE', 'FEMALE']  # Preferences.Gender.ALL
+WILKS_COEFFICIENTS = np.array([Tools.WILKS_COEFFICIENTS[gender] for gender in GENDERS])
+WILKS_POWERS = np.arange(WILKS_COEFFICIENTS.shape[1])
+ONE_REP_MAX_PERCENTAGES = np.array(Tools.ONE_REP_MAX_PERCENTAGES, dtype=np.float64)  # index i -> (i + 1) repetitions
+
+
+def calculate_one_rep_maxes(lift_masses, repetitions):
+    """
+    Vectorized Tools.calculate_one_rep_max.
+    :param lift_masses (array-like of float) - lifted masses
+    :param repetitions (array-like of int) - repetitions of each lift
+    """
+    lift_masses = np.asarray(lift_masses, dtype=np.float64)
+    return np.round(lift_masses + lift_masses * np.asarray(repetitions, dtype=np.float64) * 0.025, 2)
+
+
+def calculate_wilks_scores(genders, body_weights, lift_masses):
+    """
+    Vectorized Tools.calculate_wilks_score.
+    :param genders (array-like of str) - Preferences.Gender values
+    :param body_weights (array-like of float) - body weights of the lifters
+    :param lift_masses (array-like of float) - maximum weights lifted
+    """
+    coefficients = WILKS_COEFFICIENTS[[GENDERS.index(gender) for gender in genders]]
+    denominators = (coefficients * np.power.outer(np.asarray(body_weights, dtype=np.float64), WILKS_POWERS)).sum(axis=1)
+    return np.round(np.asarray(lift_masses, dtype=np.float64) * 500 / denominators, 2)
+
+
+def calculate_body_weight_ratios(lift_masses, body_weights):
+    return np.asarray(lift_masses, dtype=np.float64) / np.asarray(body_weights, dtype=np.float64)
+
+
+def calculate_rep_tables(one_rep_maxes):
+    """
+    :param one_rep_maxes (array-like of float) - one rep maxes
+    :return matrix of masses to lift for 1..len(ONE_REP_MAX_PERCENTAGES) repetitions (one row per one rep max)
+    """
+    return np.round(np.multiply.outer(np.asarray(one_rep_maxes, dtype=np.float64), ONE_REP_MAX_PERCENTAGES) / 100, 2)
@@ -0,0 +1,64 @@
+from utils.tools import Levels
+import numpy as np
+
+LEVEL_NAMES = [Levels.BEGINNER, Levels.NOVICE, Levels.INTERMEDIATE, Levels.ADVANCED, Levels.ELITE]
+LEVEL_LIMITS = np.array([Levels.LIMITS[level] for level in LEVEL_NAMES])
+
+
+class Cohort:
+    """
+    Sorted, compact (float64 numpy array) set of lift masses of one cohort (e.g. one bodyweight),
+    answers Tools' ranking questions for many values at once with binary search.
+    """
+
+    def __init__(self, lift_masses, is_sorted=False):
+        """
+        :param lift_masses (iterable of float) - lift masses of the cohort
+        :param is_sorted (bool) - skip sorting if lift_masses are already in ascending order
+        """
+        values = np.fromiter(lift_masses, dtype=np.float64) if not isinstance(lift_masses, np.ndarray) else lift_masses.astype(np.float64, copy=False)
+        self.values = values if is_sorted else np.sort(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def insert(self, lift_masses):
+        lift_masses = np.atleast_1d(np.asarray(lift_masses, dtype=np.float64))
+        self.values = np.insert(self.values, np.searchsorted(self.values, lift_masses), lift_masses)
+
+    def get_levels_in_percentage(self, lift_masses):
+        """
+        Batch version of Tools.get_level_in_percentage.
+        :param lift_masses (array-like of float) - values to rank within the cohort
+        :return numpy array of percentages of cohort values strictly below each value
+        """
+        return np.searchsorted(self.values, np.asarray(lift_masses, dtype=np.float64), side='left') / len(self.values) * 100
+
+    def get_level_boundaries(self):
+        """
+        Same as Tools.get_level_boundaries_for_bodyweight.
+        :return dict level -> lift mass at the level's lower limit
+        """
+        boundaries = self.values[(LEVEL_LIMITS * len(self.values)).astype(np.int64)]
+        return dict(zip(LEVEL_NAMES, boundaries.tolist()))
+
+    def get_string_levels(self, lift_masses):
+        """
+        Batch version of Tools.get_string_level over this cohort's boundaries.
+        :param lift_masses (array-like of float) - values to classify
+        :return list of level names
+        """
+        boundaries = self.values[(LEVEL_LIMITS * len(self.values)).astype(np.int64)]
+        return get_string_levels(boundaries, lift_masses)
+
+
+def get_string_levels(boundaries, lift_masses):
+    """
+    :param boundaries (dict or array-like) - level boundaries, as returned by get_level_boundaries (or in LEVEL_NAMES order)
+    :param lift_masses (array-like of float) - values to classify
+    :return list of level names (highest level whose boundary is exceeded, Beginner by default)
+    """
+    if isinstance(boundaries, dict):
+        boundaries = [boundaries[level] for level in LEVEL_NAMES]
+    exceeded = np.searchsorted(np.asarray(boundaries, dtype=np.float64), np.asarray(lift_masses, dtype=np.float64), side='left')
+    return [LEVEL_NAMES[index] for index in np.maximum(exceeded - 1, 0).tolist()]
@@ -1,10 +1,8 @@
-from django.contrib.auth.models import User as django_User
 from telesign.messaging import MessagingClient
 from datetime import date, timedelta
+from bisect import bisect_left
 from typing import Tuple
 from math import pow
-import random
-import math
 
 
 class Levels:
@@ -39,8 +37,15 @@ class Tools:
         '70-79': (70, 79),
         '80-89': (80, 89)
     }
-    POWERLIFTING_EXERCISE_NAMES = ['Bench Press', 'Deadlift', 'Squat']
+    POWERLIFTING_EXERCISE_NAMES = [
+        'Bench Press', 'Deadlift', 'Squat',  # static/exercises.csv
+        '벤치 프레스', '데드리프트', '스쿼트',  # static/exercises-kr.csv (default catalog)
+    ]
     ONE_REP_MAX_REPS = [1, 2, 4, 6, 8, 10, 12, 16, 20, 24, 30]
+    WILKS_COEFFICIENTS = {  # by Preferences.Gender
+        'MALE': [-216.0475144, 16.2606339, -0.002388645, -0.00113732, 7.01863E-06, -1.291E-08],
+        'FEMALE': [594.31747775582, -27.23842536447, 0.82112226871, -0.00930733913, 4.731582E-05, -9.054E-08]
+    }
     ONE_REP_MAX_PERCENTAGES = [
         100, 97, 94, 92, 89, 86, 83, 81, 78, 75, 73, 71, 70, 68, 67, 65, 64, 63, 61, 60, 59, 58, 57, 56, 55, 54, 53, 52, 51, 50
     ]
@@ -52,11 +57,8 @@ class Tools:
 
     @staticmethod
     def get_level_in_percentage(sorted_lifts_for_body_weight: list, total_lift_mass: float) -> float:
-        list_copy = sorted_lifts_for_body_weight[:]
-        data_length = len(list_copy)
-        list_copy.append(total_lift_mass)
-        list_copy.sort()
-        return (list_copy.index(total_lift_mass)) / data_length * 100
+        # number of values below total_lift_mass, i.e. its position if it was inserted into the sorted list
+        return bisect_left(sorted_lifts_for_body_weight, total_lift_mass) / len(sorted_lifts_for_body_weight) * 100
 
     @staticmethod
     def get_level_boundaries_for_bodyweight(sorted_lifts_for_body_weight: list) -> dict:
@@ -92,13 +94,7 @@ class Tools:
         x - body weight
         letters denote coefficients from coeff  array
         '''
-        coeff = []
-        from workoutnote_django.models import Preferences
-        if gender == Preferences.Gender.MALE:
-            coeff = [-216.0475144, 16.2606339, -0.002388645, -0.00113732, 7.01863E-06, -1.291E-08]
-        elif gender == Preferences.Gender.FEMALE:
-            coeff = [594.31747775582, -27.23842536447, 0.82112226871, -0.00930733913, 4.731582E-05, -9.054E-08]
-
+        coeff = Tools.WILKS_COEFFICIENTS[gender]
         denominator = 0
         for i in range(0, 6):
             denominator += coeff[i] * pow(body_weight, i)
@@ -124,89 +120,6 @@ class Tools:
         end_date = (today - timedelta(days=365 * age_range[0])).replace(month=1, day=1)
         return (start_date, end_date)
 
-    @staticmethod
-    def generate_dummy_data():
-        print('working on dummy data')
-        from workoutnote_django.models import Exercise, Preferences, Lift, WorkoutSession
-        from django.utils import timezone
-        exercises = Exercise.objects.all()
-        # create dummy accounts
-        for weight in range(50, 141):
-            username = f'male_{weight}kg@workoutnote.com'
-            if django_User.objects.filter(username=username).exists():
-                user = django_User.objects.get(username=username)
-                update_timestamps = True
-            else:
-                user = django_User.objects.create_user(username=username, email=username, password=username)
-                user.save()
-                Preferences.objects.create(user=user, gender=Preferences.Gender.MALE).save()
-                update_timestamps = False
-            print(f'\rWorking on dummy data of {username}')
-            # generate dummy lifts for the user
-            timestamp = (timezone.localtime(timezone.now()) - timedelta(days=len(exercises))).replace(hour=0, minute=0, microsecond=0)
-            for exercise in exercises:
-                if update_timestamps:
-                    lifts = Lift.objects.filter(user=user, exercise=exercise)
-                    for lift in lifts:
-                        lift.timestamp = timestamp
-                        lift.save()
-                else:
-                    number_of_sets = random.randint(10, 14)
-                    db_workout = WorkoutSession.objects.create(user=user)
-                    db_workout.save()
-                    for _ in range(number_of_sets):
-                        number_of_reps = random.randint(2, 7)
-                        lift_mass = random.randint(math.floor(weight * .5), math.ceil(weight * 1.8))
-                        lift = Lift.objects.create(
-                            workout_session=db_workout,
-                            exercise=exercise,
-                            lift_mass=lift_mass,
-                            repetitions=number_of_reps,
-                            one_rep_max=Tools.calculate_one_rep_max(lift_mass, number_of_reps)
-                        )
-                        lift.timestamp = timestamp
-                        lift.save()
-                timestamp += timedelta(days=1)
-                print(f'\r{exercise}', end='', flush=True)
-
-        for weight in range(40, 121):
-            username = f'female_{weight}kg@workoutnote.com'
-            if django_User.objects.filter(username=username).exists():
-                user = django_User.objects.get(username=username)
-                update_timestamps = True
-            else:
-                user = django_User.objects.create_user(username=username, email=username, password=username)
-                user.save()
-                Preferences.objects.create(user=user, gender=Preferences.Gender.FEMALE).save()
-                update_timestamps = False
-            print(f'\rWorking on dummy data of {username}')
-            # generate dummy lifts for the user
-            timestamp = (timezone.localtime(timezone.now()) - timedelta(days=len(exercises))).replace(hour=0, minute=0, microsecond=0)
-            for exercise in exercises:
-                if update_timestamps:
-                    lifts = Lift.objects.filter(user=user, exercise=exercise)
-                    for lift in lifts:
-                        lift.timestamp = timestamp
-                        lift.save()
-                else:
-                    number_of_sets = random.randint(10, 14)
-                    db_workout = WorkoutSession.objects.create(user=user)
-                    db_workout.save()
-                    for _ in range(number_of_sets):
-                        number_of_reps = random.randint(2, 7)
-                        lift_mass = random.randint(math.floor(weight * .5), math.ceil(weight * 1.8))
-                        lift = Lift.objects.create(
-                            exercise=exercise,
-                            workout_session=db_workout,
-                            lift_mass=lift_mass,
-                            repetitions=number_of_reps,
-                            one_rep_max=Tools.calculate_one_rep_max(lift_mass, number_of_reps)
-                        )
-                        lift.timestamp = timestamp
-                        lift.save()
-                timestamp += timedelta(days=1)
-                print(f'\r{exercise}', end='', flush=True)
-
     @staticmethod
     def date2str(_date, readable=False):
         if readable:
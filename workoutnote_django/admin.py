@@ -9,6 +9,11 @@ from workoutnote_django.models import FavoriteExercise
 from workoutnote_django.models import FavoriteWorkout
 from workoutnote_django.models import OneRepMaxResults
 from workoutnote_django.models import Target
+from workoutnote_django.models import Tombstone
+from workoutnote_django.models import StrengthStandard
+from workoutnote_django.models import PersonalRecord
+from workoutnote_django.models import TrainingVolume
+from workoutnote_django.models import LeaderboardEntry
 from django.contrib import admin
 
 
@@ -34,7 +39,7 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Preferences)
 class PreferencesAdmin(admin.ModelAdmin):
-    list_display = ['user', 'name', 'gender', 'date_of_birth', 'shared_profile']
+    list_display = ['user', 'name', 'gender', 'date_of_birth', 'body_weight', 'shared_profile']
 
 
 @admin.register(WorkoutSession)
@@ -65,3 +70,28 @@ class OneRepMaxResultsAdmin(admin.ModelAdmin):
 @admin.register(Target)
 class TargetAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'timestamp', 'name', 'start_date', 'end_date', 'achieved']
+
+
+@admin.register(Tombstone)
+class TombstoneAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'model_name', 'object_id', 'deleted_at']
+
+
+@admin.register(StrengthStandard)
+class StrengthStandardAdmin(admin.ModelAdmin):
+    list_display = ['id', 'exercise', 'gender', 'body_weight_bucket', 'age_range', 'sample_size', 'beginner', 'novice', 'intermediate', 'advanced', 'elite', 'computed_at']
+
+
+@admin.register(PersonalRecord)
+class PersonalRecordAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'exercise', 'best_one_rep_max', 'heaviest_lift_mass', 'updated_at']
+
+
+@admin.register(TrainingVolume)
+class TrainingVolumeAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'period', 'start_date', 'body_part', 'volume', 'set_count']
+
+
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'exercise', 'gender', 'body_weight_class', 'one_rep_max']
@@ -0,0 +1,332 @@
+from django.db.models.signals import post_save
+from django.db.models import Case, F, FloatField, IntegerField, Max, Value, When
+from django.dispatch import receiver
+from django.db import transaction
+from django.utils import timezone
+from workoutnote_django import models
+from api import catalog
+
+UPDATE_BATCH_SIZE = 100  # rollup rows updated by one statement (5 parameters each, under SQLite's default limit of 999)
+
+
+# region personal records
+def _merge_into_record(record, one_rep_max, lift_mass, best_repetitions):
+    """
+    Raises the record to include the given bests.
+    :return True if the record changed
+    """
+    changed = one_rep_max > record.best_one_rep_max or lift_mass > record.heaviest_lift_mass
+    record.best_one_rep_max = max(record.best_one_rep_max, one_rep_max)
+    record.heaviest_lift_mass = max(record.heaviest_lift_mass, lift_mass)
+    for mass_key, repetitions in best_repetitions.items():
+        if repetitions > record.best_repetitions.get(mass_key, 0):
+            record.best_repetitions[mass_key] = repetitions
+            changed = True
+    return changed
+
+
+def _compute_personal_records(user_id, exercise_ids=None):
+    """
+    Computes personal records from the user's lifts in one grouped query.
+    :param exercise_ids (iterable) - exercises to compute for (None for all)
+    :return dict of exercise_id -> unsaved PersonalRecord (exercises without lifts are missing)
+    """
+    lifts = models.Lift.objects.filter(workout_session__user_id=user_id, exercise__isnull=False)
+    if exercise_ids is not None:
+        lifts = lifts.filter(exercise_id__in=exercise_ids)
+    records = {}
+    for exercise_id, lift_mass, one_rep_max, repetitions in lifts.values('exercise_id', 'lift_mass').annotate(best_one_rep_max=Max('one_rep_max'), repetitions=Max('repetitions')).order_by().values_list('exercise_id', 'lift_mass', 'best_one_rep_max', 'repetitions'):
+        record = records.get(exercise_id)
+        if record is None:
+            record = records[exercise_id] = models.PersonalRecord(user_id=user_id, exercise_id=exercise_id, best_one_rep_max=one_rep_max, heaviest_lift_mass=lift_mass, best_repetitions={})
+        _merge_into_record(record, one_rep_max, lift_mass, {models.PersonalRecord.mass_key(lift_mass): repetitions})
+    return records
+
+
+def _update_personal_records(user_id, removed_lifts, inserted_lifts):
+    """
+    Applies removed and inserted (already saved) lifts to the user's personal records.
+    :return dict of exercise_id -> new best one rep max (None if the record was removed) of records whose best one rep max changed
+    """
+    exercise_ids = {lift.exercise_id for lift in removed_lifts + inserted_lifts}
+    records = {record.exercise_id: record for record in models.PersonalRecord.objects.select_for_update().filter(user_id=user_id, exercise_id__in=exercise_ids)}
+    previous_bests = {exercise_id: record.best_one_rep_max for exercise_id, record in records.items()}
+
+    # only removed lifts that were (part of) a record make it stale, stale records are recomputed from the remaining (and inserted) lifts
+    stale_exercise_ids = set()
+    for lift in removed_lifts:
+        record = records.get(lift.exercise_id)
+        if record is None or lift.one_rep_max >= record.best_one_rep_max or lift.lift_mass >= record.heaviest_lift_mass or lift.repetitions >= record.best_repetitions.get(models.PersonalRecord.mass_key(lift.lift_mass), 0):
+            stale_exercise_ids.add(lift.exercise_id)
+    changed = set()
+    removed_ids = []
+    if len(stale_exercise_ids) > 0:
+        computed = _compute_personal_records(user_id, stale_exercise_ids)
+        for exercise_id in stale_exercise_ids:
+            record, computed_record = records.get(exercise_id), computed.get(exercise_id)
+            if computed_record is None:
+                if record is not None:
+                    removed_ids += [record.id]
+                    del records[exercise_id]
+            elif record is None or (record.best_one_rep_max, record.heaviest_lift_mass, record.best_repetitions) != (computed_record.best_one_rep_max, computed_record.heaviest_lift_mass, computed_record.best_repetitions):
+                if record is not None:
+                    computed_record.id = record.id
+                records[exercise_id] = computed_record
+                changed.add(exercise_id)
+
+    for lift in inserted_lifts:
+        if lift.exercise_id in stale_exercise_ids:
+            continue
+        record = records.get(lift.exercise_id)
+        if record is None:
+            record = records[lift.exercise_id] = models.PersonalRecord(user_id=user_id, exercise_id=lift.exercise_id, best_one_rep_max=lift.one_rep_max, heaviest_lift_mass=lift.lift_mass, best_repetitions={})
+        if _merge_into_record(record, lift.one_rep_max, lift.lift_mass, {models.PersonalRecord.mass_key(lift.lift_mass): lift.repetitions}) or record.id is None:
+            changed.add(lift.exercise_id)
+
+    # missing rows can't be locked: a concurrent first lift of the same exercise may insert the same row,
+    # conflicting inserts are skipped (ON CONFLICT DO NOTHING) and merged into the row that won
+    new_records = [records[exercise_id] for exercise_id in changed if records[exercise_id].id is None]
+    if len(new_records) > 0:
+        models.PersonalRecord.objects.bulk_create(new_records, ignore_conflicts=True)
+        for record in models.PersonalRecord.objects.select_for_update().filter(user_id=user_id, exercise_id__in=[new_record.exercise_id for new_record in new_records]):
+            new_record = records[record.exercise_id]
+            if not _merge_into_record(record, new_record.best_one_rep_max, new_record.heaviest_lift_mass, new_record.best_repetitions):
+                changed.discard(record.exercise_id)  # inserted as is
+            records[record.exercise_id] = record
+    if len(removed_ids) > 0:
+        models.PersonalRecord.objects.filter(id__in=removed_ids).delete()
+    updated_records = [records[exercise_id] for exercise_id in changed]
+    if len(updated_records) > 0:
+        updated_at = timezone.now()  # bulk updates skip auto_now
+        for record in updated_records:
+            record.updated_at = updated_at
+        models.PersonalRecord.objects.bulk_update(updated_records, ['best_one_rep_max', 'heaviest_lift_mass', 'best_repetitions', 'updated_at'])
+
+    bests = {exercise_id: None for exercise_id in previous_bests if exercise_id not in records}
+    bests.update({exercise_id: record.best_one_rep_max for exercise_id, record in records.items() if record.best_one_rep_max != previous_bests.get(exercise_id)})
+    return bests
+
+
+def rebuild_personal_records(user_id):
+    with transaction.atomic():
+        models.PersonalRecord.objects.filter(user_id=user_id).delete()
+        models.PersonalRecord.objects.bulk_create(_compute_personal_records(user_id).values())
+        sync_leaderboard_entries(user_id)
+# endregion
+
+# region training volume
+def _local_date(workout_session):
+    if workout_session.local_date is None:
+        return models.WorkoutSession.compute_local_date(workout_session.timestamp, models.Preferences.get_timezone_offset_minutes(workout_session.user))
+    return workout_session.local_date
+
+
+def _add_training_volume_deltas(deltas, rows, sign):
+    for user_id, local_date, body_part_id, lift_mass, repetitions in rows:
+        for period, start_date in models.TrainingVolume.get_start_dates(local_date).items():
+            delta = deltas.setdefault((user_id, period, start_date, body_part_id), [0.0, 0])
+            delta[0] += sign * lift_mass * repetitions
+            delta[1] += sign
+
+
+def apply_training_volume(rows, sign=1):
+    """
+    Adds (or subtracts) lifts to the daily and weekly volume rollups.
+    :param rows (iterable) - (user_id, local_date, body_part_id, lift_mass, repetitions) of each lift
+    :param sign (int) - 1 for added lifts, -1 for removed lifts
+    """
+    deltas = {}  # (user_id, period, start_date, body_part_id) -> [volume, set_count]
+    _add_training_volume_deltas(deltas, rows, sign)
+    _apply_training_volume_deltas(deltas)
+
+
+def _apply_training_volume_deltas(deltas):
+    deltas = {key: delta for key, delta in deltas.items() if delta != [0, 0]}  # e.g. a lift updated within the same day and body part, with the same volume
+    if len(deltas) == 0:
+        return
+
+    with transaction.atomic(savepoint=False):
+        # bounding range instead of one OR-ed condition per key (too deep an expression for large backfill chunks)
+        start_dates = [start_date for _, _, start_date, _ in deltas]
+        candidates = models.TrainingVolume.objects.select_for_update().filter(user_id__in={user_id for user_id, _, _, _ in deltas}, start_date__range=(min(start_dates), max(start_dates)))
+        existing_ids = {tuple(key): row_id for row_id, *key in candidates.values_list('id', 'user_id', 'period', 'start_date', 'body_part_id') if tuple(key) in deltas}
+
+        # missing rows are inserted empty (a concurrent request may insert the same row, ON CONFLICT DO NOTHING keeps one) and then updated like the others
+        missing = [key for key, (_, set_count) in deltas.items() if key not in existing_ids and set_count > 0]
+        if len(missing) > 0:
+            models.TrainingVolume.objects.bulk_create([models.TrainingVolume(user_id=user_id, period=period, start_date=start_date, body_part_id=body_part_id) for user_id, period, start_date, body_part_id in missing], ignore_conflicts=True)
+            missing_start_dates = [start_date for _, _, start_date, _ in missing]
+            candidates = candidates.filter(start_date__range=(min(missing_start_dates), max(missing_start_dates)))
+            existing_ids.update({tuple(key): row_id for row_id, *key in candidates.values_list('id', 'user_id', 'period', 'start_date', 'body_part_id') if tuple(key) in deltas and tuple(key) not in existing_ids})
+
+        # one UPDATE per batch of rows, increments keep concurrent updates of the same rows additive
+        updates = [(existing_ids[key], volume, set_count) for key, (volume, set_count) in deltas.items() if key in existing_ids]
+        for i in range(0, len(updates), UPDATE_BATCH_SIZE):
+            batch = updates[i:i + UPDATE_BATCH_SIZE]
+            models.TrainingVolume.objects.filter(id__in=[row_id for row_id, _, _ in batch]).update(
+                volume=F('volume') + Case(*[When(id=row_id, then=Value(volume)) for row_id, volume, _ in batch], output_field=FloatField()),
+                set_count=F('set_count') + Case(*[When(id=row_id, then=Value(set_count)) for row_id, _, set_count in batch], output_field=IntegerField()),
+            )
+        emptied_ids = [row_id for row_id, _, set_count in updates if set_count < 0]
+        if len(emptied_ids) > 0:
+            models.TrainingVolume.objects.filter(id__in=emptied_ids, set_count__lte=0).delete()
+
+
+def _training_volume_rows(user_id, lifts):
+    exercise_registry = catalog.get_registry()
+    for lift in lifts:
+        exercise = exercise_registry.get_exercise(lift.exercise_id)
+        yield user_id, _local_date(lift.workout_session), None if exercise is None else exercise.body_part_id, lift.lift_mass, lift.repetitions
+
+
+def backfill_training_volume(lifts, chunk_size=5000):
+    """
+    Adds existing lifts to the rollups, reading them in primary key ordered chunks.
+    :param lifts (QuerySet) - lifts to add (rollups of their users are expected to be empty)
+    :param chunk_size (int) - number of lifts read and applied at once
+    :return number of lifts processed
+    """
+    processed = 0
+    last_id = 0
+    while True:
+        chunk = list(lifts.filter(id__gt=last_id).order_by('id').values_list(
+            'id', 'workout_session__user_id', 'workout_session__local_date', 'exercise__body_part_id', 'lift_mass', 'repetitions'
+        )[:chunk_size])
+        if len(chunk) == 0:
+            return processed
+        apply_training_volume([row[1:] for row in chunk])
+        processed += len(chunk)
+        last_id = chunk[-1][0]
+
+
+def replace_training_volume(rollups, lifts, chunk_size=5000):
+    """
+    Replaces rollups by ones computed from the lifts in a single transaction, readers see the previous rollups until it commits.
+    Lifts inserted once the previous rollups are deleted (above the high-water mark) are left to the lift hooks, which wait on the rows locked by the rebuild.
+    :param rollups (QuerySet) - rollups to replace
+    :param lifts (QuerySet) - lifts rolled up into them
+    :return number of lifts processed
+    """
+    with transaction.atomic():
+        rollups.delete()
+        high_water_mark = models.Lift.objects.aggregate(id=Max('id'))['id'] or 0
+        return backfill_training_volume(lifts.filter(id__lte=high_water_mark), chunk_size=chunk_size)
+
+
+def rebuild_training_volume(user_id):
+    """
+    Recomputes the user's rollups from scratch (e.g. after local dates of workouts changed with the timezone, see WorkoutSession.update_local_dates).
+    """
+    replace_training_volume(models.TrainingVolume.objects.filter(user_id=user_id), models.Lift.objects.filter(workout_session__user_id=user_id, exercise__isnull=False))
+# endregion
+
+
+# region leaderboards
+def sync_leaderboard_entries(user_id, preferences=None):
+    """
+    Mirrors all personal records of the user into leaderboard entries if the user's profile is shared (removes them otherwise).
+    :param user_id (int) - user whose entries are synced
+    :param preferences (Preferences) - the user's preferences if already loaded
+    """
+    entries = models.LeaderboardEntry.objects.filter(user_id=user_id)
+    if preferences is None:
+        preferences = models.Preferences.objects.filter(user_id=user_id).first()
+    if preferences is None or not preferences.shared_profile:
+        entries.delete()
+        return
+
+    body_weight_class = models.LeaderboardEntry.get_body_weight_class(preferences.gender, preferences.body_weight)
+    best_one_rep_maxes = dict(models.PersonalRecord.objects.filter(user_id=user_id).values_list('exercise_id', 'best_one_rep_max'))
+    with transaction.atomic():
+        entries.exclude(exercise_id__in=best_one_rep_maxes.keys()).delete()
+        existing = {entry.exercise_id: entry for entry in entries.select_for_update()}
+        missing = []
+        for exercise_id, best_one_rep_max in best_one_rep_maxes.items():
+            entry = existing.get(exercise_id)
+            if entry is None:
+                missing += [models.LeaderboardEntry(user_id=user_id, exercise_id=exercise_id, gender=preferences.gender, body_weight_class=body_weight_class, one_rep_max=best_one_rep_max)]
+            elif (entry.one_rep_max, entry.gender, entry.body_weight_class) != (best_one_rep_max, preferences.gender, body_weight_class):
+                entry.one_rep_max, entry.gender, entry.body_weight_class = best_one_rep_max, preferences.gender, body_weight_class
+                entry.save()
+        models.LeaderboardEntry.objects.bulk_create(missing)
+
+
+def _sync_leaderboard_bests(user_id, best_one_rep_maxes):
+    """
+    Mirrors changed best one rep maxes into the leaderboard entries of a shared profile (entries of private profiles are removed when the profile stops being shared).
+    :param best_one_rep_maxes (dict) - exercise_id -> new best one rep max (None if the personal record was removed)
+    """
+    if len(best_one_rep_maxes) == 0:
+        return
+    preferences = models.Preferences.objects.filter(user_id=user_id).values_list('shared_profile', 'gender', 'body_weight').first()
+    if preferences is None or not preferences[0]:
+        return
+    _, gender, body_weight = preferences
+    body_weight_class = models.LeaderboardEntry.get_body_weight_class(gender, body_weight)
+    existing = {entry.exercise_id: entry for entry in models.LeaderboardEntry.objects.select_for_update().filter(user_id=user_id, exercise_id__in=best_one_rep_maxes.keys())}
+    removed_ids, changed, missing = [], [], []
+    for exercise_id, best_one_rep_max in best_one_rep_maxes.items():
+        entry = existing.get(exercise_id)
+        if best_one_rep_max is None:
+            if entry is not None:
+                removed_ids += [entry.id]
+        elif entry is None:
+            missing += [models.LeaderboardEntry(user_id=user_id, exercise_id=exercise_id, gender=gender, body_weight_class=body_weight_class, one_rep_max=best_one_rep_max)]
+        elif (entry.one_rep_max, entry.gender, entry.body_weight_class) != (best_one_rep_max, gender, body_weight_class):
+            entry.one_rep_max, entry.gender, entry.body_weight_class = best_one_rep_max, gender, body_weight_class
+            changed += [entry]
+    if len(removed_ids) > 0:
+        models.LeaderboardEntry.objects.filter(id__in=removed_ids).delete()
+    if len(changed) > 0:
+        models.LeaderboardEntry.objects.bulk_update(changed, ['one_rep_max', 'gender', 'body_weight_class'])
+    models.LeaderboardEntry.objects.bulk_create(missing)
+
+
+@receiver(post_save, sender=models.Preferences)
+def _on_preferences_saved(sender, instance, **kwargs):
+    # sharing, gender or body weight may have changed
+    sync_leaderboard_entries(instance.user_id, preferences=instance)
+# endregion
+
+
+# region lift write hooks (called by every path that inserts, updates or removes lifts)
+def _lifts_changed(user_id, removed_lifts, inserted_lifts):
+    removed_lifts = [lift for lift in removed_lifts if lift.exercise_id is not None]
+    inserted_lifts = [lift for lift in inserted_lifts if lift.exercise_id is not None]
+    if len(removed_lifts) + len(inserted_lifts) == 0:
+        return
+    with transaction.atomic(savepoint=False):
+        best_one_rep_maxes = _update_personal_records(user_id, removed_lifts, inserted_lifts)
+        deltas = {}
+        _add_training_volume_deltas(deltas, _training_volume_rows(user_id, removed_lifts), -1)
+        _add_training_volume_deltas(deltas, _training_volume_rows(user_id, inserted_lifts), 1)
+        _apply_training_volume_deltas(deltas)
+        _sync_leaderboard_bests(user_id, best_one_rep_maxes)
+
+
+def lifts_inserted(user_id, lifts):
+    """
+    :param user_id (int) - owner of the lifts' workout session
+    :param lifts (list) - just inserted lifts
+    """
+    _lifts_changed(user_id, [], lifts)
+
+
+def lift_updated(user_id, previous_lift, lift):
+    """
+    :param user_id (int) - owner of the lift's workout session
+    :param previous_lift (Lift) - copy of the lift made before the update
+    :param lift (Lift) - updated (already saved) lift
+    """
+    if (previous_lift.workout_session_id, previous_lift.exercise_id, previous_lift.lift_mass, previous_lift.repetitions) == (lift.workout_session_id, lift.exercise_id, lift.lift_mass, lift.repetitions):
+        return
+    _lifts_changed(user_id, [previous_lift], [lift])
+
+
+def lifts_removed(user_id, lifts):
+    """
+    :param user_id (int) - owner of the lifts' workout session
+    :param lifts (list) - lifts that have just been deleted
+    """
+    _lifts_changed(user_id, lifts, [])
+# endregion
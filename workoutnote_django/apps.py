@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class WorkoutnoteDjangoConfig(AppConfig):
+    name = 'workoutnote_django'
+
+    def ready(self):
+        from workoutnote_django import aggregates, percentiles, standards  # noqa: F401 (registers leaderboard, percentile index & strength cohort maintenance signals)
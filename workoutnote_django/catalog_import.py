@@ -0,0 +1,94 @@
+from django.db import transaction
+from workoutnote_django import models
+from api import catalog
+import csv
+
+DEFAULT_CATEGORY_NAME = '무슨'  # files without a category column (e.g. static/exercises-kr.csv)
+TRANSLATION_COLUMN_PREFIX = 'name_'  # e.g. name_en column -> name_translations['EN']
+
+
+class CatalogImportResult:
+    def __init__(self):
+        self.created_body_parts = []
+        self.created_categories = []
+        self.created_exercises = []
+        self.updated_exercises = []
+        self.unchanged_exercises = 0
+        self.exercises_not_in_file = []
+
+    def __str__(self):
+        return (
+            f'body parts: {len(self.created_body_parts)} created, '
+            f'categories: {len(self.created_categories)} created, '
+            f'exercises: {len(self.created_exercises)} created, {len(self.updated_exercises)} updated, {self.unchanged_exercises} unchanged, '
+            f'{len(self.exercises_not_in_file)} not in the file (kept)'
+        )
+
+
+def read_catalog_csv(path):
+    """
+    Reads an exercise catalog file, with columns: exercise, body part, optional category, optional name_<language> translations (other columns e.g. icon are ignored).
+    :return list of dicts with name, body_part, category and translations keys
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as r:
+        reader = csv.reader(r)
+        header = [column.strip().lower() for column in next(reader)]
+        rows = []
+        for values in reader:
+            if len(values) == 0 or not values[0].strip():
+                continue
+            row = dict(zip(header, [value.strip() for value in values]))
+            rows += [{
+                'name': row['exercise'],
+                'body_part': row['body part'],
+                'category': row.get('category') or DEFAULT_CATEGORY_NAME,
+                'translations': {column[len(TRANSLATION_COLUMN_PREFIX):].upper(): value for column, value in row.items() if column.startswith(TRANSLATION_COLUMN_PREFIX) and value},
+            }]
+        return rows
+
+
+def import_catalog(rows, dry_run=False):
+    """
+    Brings the exercise catalog in line with the rows with bulk inserts / updates in one transaction.
+    Nothing is deleted (deleting exercises, body parts or categories would cascade into users' lifts and favorites).
+    :param rows (list) - as returned by read_catalog_csv
+    :param dry_run (bool) - compute the changes without applying them
+    :return CatalogImportResult
+    """
+    result = CatalogImportResult()
+    with transaction.atomic():
+        # 1. body parts & categories (preloaded, missing ones created at once)
+        body_parts = {body_part.name: body_part for body_part in models.BodyPart.objects.all()}
+        categories = {category.name: category for category in models.Category.objects.all()}
+        result.created_body_parts = [models.BodyPart(name=name) for name in dict.fromkeys(row['body_part'] for row in rows) if name not in body_parts]
+        result.created_categories = [models.Category(name=name) for name in dict.fromkeys(row['category'] for row in rows) if name not in categories]
+        if not dry_run and (result.created_body_parts or result.created_categories):
+            models.BodyPart.objects.bulk_create(result.created_body_parts)
+            models.Category.objects.bulk_create(result.created_categories)
+            body_parts = {body_part.name: body_part for body_part in models.BodyPart.objects.all()}
+            categories = {category.name: category for category in models.Category.objects.all()}
+
+        # 2. diff exercises by name
+        exercises = {exercise.name: exercise for exercise in models.Exercise.objects.all()}
+        for row in {row['name']: row for row in rows}.values():  # last row wins for duplicated names
+            body_part, category = body_parts.get(row['body_part']), categories.get(row['category'])
+            exercise = exercises.get(row['name'])
+            if exercise is None:
+                result.created_exercises += [models.Exercise(name=row['name'], body_part=body_part, category=category, name_translations=row['translations'])]
+                continue
+            name_translations = {**exercise.name_translations, **row['translations']}
+            if (exercise.body_part_id, exercise.category_id, exercise.name_translations) != (getattr(body_part, 'id', None), getattr(category, 'id', None), name_translations):
+                exercise.body_part, exercise.category, exercise.name_translations = body_part, category, name_translations
+                result.updated_exercises += [exercise]
+            else:
+                result.unchanged_exercises += 1
+        file_names = {row['name'] for row in rows}
+        result.exercises_not_in_file = [exercise for name, exercise in exercises.items() if name not in file_names]
+
+        # 3. apply
+        if not dry_run:
+            models.Exercise.objects.bulk_create(result.created_exercises)
+            models.Exercise.objects.bulk_update(result.updated_exercises, ['body_part', 'category', 'name_translations'])
+            if result.created_body_parts or result.created_categories or result.created_exercises or result.updated_exercises:
+                catalog.bump_version()  # bulk operations send no signals
+    return result
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from workoutnote_django import models
+
+
+class Command(BaseCommand):
+    help = 'Fills in local dates of workout sessions saved before they were stored (run once after deploying, pages and the API only read them)'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{models.WorkoutSession.backfill_local_dates()} workout sessions updated')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from workoutnote_django import aggregates, models
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds daily / weekly training volume rollups (per body part) from existing lifts, in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-ids', type=int, nargs='+', help='only rebuild these users\' rollups')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='number of lifts read and applied at once')
+
+    def handle(self, *args, **options):
+        rollups = models.TrainingVolume.objects.all()
+        lifts = models.Lift.objects.filter(exercise__isnull=False, workout_session__isnull=False)
+        if options['user_ids']:
+            rollups = rollups.filter(user_id__in=options['user_ids'])
+            lifts = lifts.filter(workout_session__user_id__in=options['user_ids'])
+
+        # 1. local dates of workouts saved before they were stored
+        models.WorkoutSession.backfill_local_dates()
+
+        # 2. rebuild (in one transaction)
+        processed = aggregates.replace_training_volume(rollups, lifts, chunk_size=options['chunk_size'])
+        self.stdout.write(f'{processed} lifts rolled up into {rollups.count()} training volume rows')
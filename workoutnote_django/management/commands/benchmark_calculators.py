@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from workoutnote_django.models import Preferences
+from utils.tools import Tools
+from utils import calculators
+from math import pow
+import numpy as np
+import timeit
+
+
+def legacy_calculate_wilks_score(gender, body_weight, lift_mass):
+    # previous Tools.calculate_wilks_score (import and coefficient list on every call), kept as the benchmark reference
+    coeff = []
+    from workoutnote_django.models import Preferences
+    if gender == Preferences.Gender.MALE:
+        coeff = [-216.0475144, 16.2606339, -0.002388645, -0.00113732, 7.01863E-06, -1.291E-08]
+    elif gender == Preferences.Gender.FEMALE:
+        coeff = [594.31747775582, -27.23842536447, 0.82112226871, -0.00930733913, 4.731582E-05, -9.054E-08]
+    denominator = 0
+    for i in range(0, 6):
+        denominator += coeff[i] * pow(body_weight, i)
+    return round(lift_mass * 500 / denominator, 2)
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks scalar (Tools) vs vectorized (utils.calculators) 1RM, Wilks, body weight ratio and rep table calculations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000, 10000], help='number of items per call')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        self.stdout.write(f'{"items":>7} {"scalar (us/item)":>17} {"vectorized (us/item)":>21} {"speedup":>8}')
+        for size in options['sizes']:
+            lift_masses = rng.integers(20, 250, size=size).astype(np.float64)
+            repetitions = rng.integers(1, 31, size=size)
+            body_weights = rng.uniform(45, 140, size=size)
+            genders = rng.choice(Preferences.Gender.ALL, size=size).tolist()
+            items = list(zip(lift_masses.tolist(), repetitions.tolist(), body_weights.tolist(), genders))
+
+            def scalar():
+                results = []
+                for lift_mass, reps, body_weight, gender in items:
+                    one_rep_max = Tools.calculate_one_rep_max(lift_mass, reps)
+                    results += [(
+                        one_rep_max,
+                        legacy_calculate_wilks_score(gender, body_weight, one_rep_max),
+                        Tools.calculate_body_weight_ratio(one_rep_max, body_weight),
+                        [round(one_rep_max * percentage / 100, 2) for percentage in Tools.ONE_REP_MAX_PERCENTAGES],
+                    )]
+                return results
+
+            def vectorized():
+                one_rep_maxes = calculators.calculate_one_rep_maxes(lift_masses, repetitions)
+                return (
+                    one_rep_maxes,
+                    calculators.calculate_wilks_scores(genders, body_weights, one_rep_maxes),
+                    calculators.calculate_body_weight_ratios(one_rep_maxes, body_weights),
+                    calculators.calculate_rep_tables(one_rep_maxes),
+                )
+
+            # same answers before timing anything (1RMs up to the last digit, numpy and python round halves differently)
+            expected = scalar()
+            expected_one_rep_maxes = np.array([x[0] for x in expected])
+            assert np.allclose(expected_one_rep_maxes, vectorized()[0], atol=0.011)
+            assert np.allclose([x[1] for x in expected], calculators.calculate_wilks_scores(genders, body_weights, expected_one_rep_maxes))
+            assert np.allclose([Tools.calculate_wilks_score(*x) for x in zip(genders, body_weights.tolist(), expected_one_rep_maxes.tolist())], calculators.calculate_wilks_scores(genders, body_weights, expected_one_rep_maxes))
+            assert np.allclose([x[2] for x in expected], calculators.calculate_body_weight_ratios(expected_one_rep_maxes, body_weights))
+            assert np.allclose([x[3] for x in expected], calculators.calculate_rep_tables(expected_one_rep_maxes), atol=0.011)
+
+            scalar_time = self._measure(scalar) / size
+            vectorized_time = self._measure(vectorized) / size
+            self.stdout.write(f'{size:>7} {scalar_time * 1e6:>17.3f} {vectorized_time * 1e6:>21.3f} {scalar_time / vectorized_time:>7.1f}x')
+
+    @staticmethod
+    def _measure(func):
+        loops, _ = timeit.Timer(func).autorange()
+        return min(timeit.repeat(func, number=loops, repeat=3)) / loops
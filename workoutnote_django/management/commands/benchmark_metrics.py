@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.test import RequestFactory
+from django.http import HttpResponse
+from django.urls import resolve
+from django.db import connection
+from workoutnote_django import metrics
+import threading
+import timeit
+
+
+class Command(BaseCommand):
+    help = 'Measures the overhead of the metrics middleware: per request, per SQL query, under concurrent recording and per /metrics export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=5, help='SQL queries run by the benchmarked view')
+        parser.add_argument('--threads', type=int, default=8, help='threads recording concurrently')
+        parser.add_argument('--views', type=int, default=50, help='distinct views in the exported metrics')
+
+    def handle(self, *args, **options):
+        # throwaway test database, the queries need a connection but no tables
+        setup_test_environment()
+        old_database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self._benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            teardown_test_environment()
+            metrics.reset()
+
+    def _benchmark(self, options):
+        metrics.reset()
+        request = RequestFactory().post('/api/fetch_settings/')
+        request.resolver_match = resolve('/api/fetch_settings/')
+
+        def view(_request):
+            with connection.cursor() as cursor:
+                for _ in range(options['queries']):
+                    cursor.execute('SELECT 1')
+            return HttpResponse(b'{"success": true}')
+
+        middleware = metrics.MetricsMiddleware(view)
+        bare = self._time(lambda: view(request))
+        measured = self._time(lambda: middleware(request))
+        no_queries = metrics.MetricsMiddleware(lambda _request: HttpResponse(b'{"success": true}'))
+        bare_no_queries = self._time(lambda: HttpResponse(b'{"success": true}'))
+        measured_no_queries = self._time(lambda: no_queries(request))
+
+        self.stdout.write(f'{"measurement":<44}{"us":>10}')
+        self.stdout.write(f'{"view (" + str(options["queries"]) + " queries), bare":<44}{bare * 1e6:>10.2f}')
+        self.stdout.write(f'{"view (" + str(options["queries"]) + " queries), with middleware":<44}{measured * 1e6:>10.2f}')
+        self.stdout.write(f'{"overhead per request (no queries)":<44}{(measured_no_queries - bare_no_queries) * 1e6:>10.2f}')
+        if options['queries'] > 0:
+            per_query = ((measured - bare) - (measured_no_queries - bare_no_queries)) / options['queries']
+            self.stdout.write(f'{"overhead per query":<44}{per_query * 1e6:>10.2f}')
+
+        # concurrent recording, threads only contend for the GIL (each records into its own shard)
+        records_per_thread = 20_000
+
+        def record():
+            for _ in range(records_per_thread):
+                metrics.record('benchmark', 0.01, 3, 0.001, 1000)
+
+        threads = [threading.Thread(target=record) for _ in range(options['threads'])]
+        started_at = timeit.default_timer()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = timeit.default_timer() - started_at
+        self.stdout.write(f'{"record, " + str(options["threads"]) + " threads (per record)":<44}{elapsed / (records_per_thread * options["threads"]) * 1e6:>10.2f}')
+        assert sum(metrics.snapshot()['benchmark'].latency.counts) == records_per_thread * options['threads'], 'lost records'
+
+        for i in range(options['views']):
+            metrics.record(f'view-{i}', 0.01, 3, 0.001, 1000)
+        export = self._time(metrics.export)
+        self.stdout.write(f'{"export of " + str(options["views"]) + " views":<44}{export * 1e6:>10.2f}')
+
+    @staticmethod
+    def _time(func):
+        loops, _ = timeit.Timer(func).autorange()
+        return min(timeit.repeat(func, number=loops, repeat=5)) / loops
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from utils.tools import Tools
+from utils import ranking
+import numpy as np
+import timeit
+
+
+def legacy_get_level_in_percentage(sorted_lifts_for_body_weight, total_lift_mass):
+    # previous Tools.get_level_in_percentage, kept as the benchmark reference
+    list_copy = sorted_lifts_for_body_weight[:]
+    data_length = len(list_copy)
+    list_copy.append(total_lift_mass)
+    list_copy.sort()
+    return (list_copy.index(total_lift_mass)) / data_length * 100
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmarks strength ranking (percentage, boundaries, string levels): legacy list sort vs bisect vs numpy cohort'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 10_000_000], help='cohort sizes')
+        parser.add_argument('--queries', type=int, default=1000, help='number of values ranked per measurement')
+        parser.add_argument('--legacy-queries', type=int, default=5, help='number of values ranked with the legacy implementation (it re-sorts per call)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        self.stdout.write(f'{"size":>10} {"method":<34} {"per value (us)":>16}')
+        for size in options['sizes']:
+            sorted_values = np.sort(rng.normal(loc=150, scale=40, size=size))
+            sorted_list = sorted_values.tolist()
+            queries = rng.normal(loc=150, scale=40, size=options['queries'])
+            query_list = queries.tolist()
+            legacy_queries = query_list[:options['legacy_queries']]
+            cohort = ranking.Cohort(sorted_values, is_sorted=True)
+
+            # same answers before timing anything
+            expected = [legacy_get_level_in_percentage(sorted_list, value) for value in legacy_queries]
+            assert np.allclose(expected, [Tools.get_level_in_percentage(sorted_list, value) for value in legacy_queries])
+            assert np.allclose(expected, cohort.get_levels_in_percentage(legacy_queries))
+            boundaries = Tools.get_level_boundaries_for_bodyweight(sorted_list)
+            assert boundaries == cohort.get_level_boundaries()
+            assert [Tools.get_string_level(boundaries, value) for value in query_list] == cohort.get_string_levels(queries)
+
+            self._report(size, 'percentage: legacy copy+sort+index', lambda: [legacy_get_level_in_percentage(sorted_list, value) for value in legacy_queries], len(legacy_queries))
+            self._report(size, 'percentage: Tools (bisect)', lambda: [Tools.get_level_in_percentage(sorted_list, value) for value in query_list], len(query_list))
+            self._report(size, 'percentage: Cohort (batched)', lambda: cohort.get_levels_in_percentage(queries), len(query_list))
+            self._report(size, 'boundaries: Tools', lambda: Tools.get_level_boundaries_for_bodyweight(sorted_list), 1)
+            self._report(size, 'boundaries: Cohort', lambda: cohort.get_level_boundaries(), 1)
+            self._report(size, 'string level: Tools', lambda: [Tools.get_string_level(boundaries, value) for value in query_list], len(query_list))
+            self._report(size, 'string level: Cohort (batched)', lambda: cohort.get_string_levels(queries), len(query_list))
+
+    def _report(self, size, method, func, number_of_values):
+        loops, _ = timeit.Timer(func).autorange()
+        best = min(timeit.repeat(func, number=loops, repeat=3)) / loops
+        self.stdout.write(f'{size:>10} {method:<34} {best / number_of_values * 1e6:>16.3f}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+from workoutnote_django import models, standards
+
+
+class Command(BaseCommand):
+    help = 'Computes Beginner..Elite strength standards per powerlifting exercise, gender, body weight bucket and age range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='recompute all cohorts (default: only cohorts whose lifters changed since the last run)')
+
+    def handle(self, *args, **options):
+        started_at = timezone.now()
+        last_computed_at = None if options['full'] else models.StrengthStandard.objects.aggregate(last=Max('computed_at'))['last']
+        written = standards.compute_standards(changed_since=last_computed_at)
+        mode = 'full' if last_computed_at is None else f'incremental since {last_computed_at.isoformat()}'
+        self.stdout.write(f'{written} strength standards written ({mode}) in {(timezone.now() - started_at).total_seconds():.1f}s')
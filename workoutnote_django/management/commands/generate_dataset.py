@@ -0,0 +1,164 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User as django_User
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.utils import timezone
+from workoutnote_django import models
+from utils.tools import Tools
+from contextlib import contextmanager
+from datetime import date, timedelta
+import multiprocessing
+import random
+import time
+
+USERNAME_FORMAT = '{prefix}_{index}@workoutnote.com'
+
+
+@contextmanager
+def explicit_timestamps():
+    # bulk_create would overwrite generated timestamps with now() otherwise
+    fields = [models.WorkoutSession._meta.get_field('timestamp'), models.Lift._meta.get_field('timestamp')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def generate_users_chunk(options, exercise_ids, password_hash, user_indices):
+    """
+    Generates users (with preferences, workout sessions and lifts) of the given indices in one transaction.
+    Every user has its own random generator seeded by (seed, index), so the dataset is the same regardless of chunking and processes.
+    :return number of lifts created
+    """
+    usernames = {index: USERNAME_FORMAT.format(prefix=options['prefix'], index=index) for index in user_indices}
+    existing_usernames = set(django_User.objects.filter(username__in=usernames.values()).values_list('username', flat=True))
+    user_indices = [index for index in user_indices if usernames[index] not in existing_usernames]
+    if len(user_indices) == 0:
+        return 0
+
+    now = timezone.now().replace(microsecond=0)
+    rngs = {index: random.Random(options['seed'] * 1_000_000_007 + index) for index in user_indices}
+    lifts_count = 0
+    with transaction.atomic(), explicit_timestamps():
+        # 1. users and preferences
+        django_User.objects.bulk_create([django_User(username=usernames[index], email=usernames[index], password=password_hash) for index in user_indices])
+        user_ids = dict(django_User.objects.filter(username__in=[usernames[index] for index in user_indices]).values_list('username', 'id'))
+        preferences = []
+        for index in user_indices:
+            rng = rngs[index]
+            gender = rng.choice(models.Preferences.Gender.ALL)
+            preferences += [models.Preferences(
+                user_id=user_ids[usernames[index]],
+                name=f'{options["prefix"]} {index}',
+                gender=gender,
+                date_of_birth=date(rng.randint(1950, 2006), rng.randint(1, 12), rng.randint(1, 28)),
+                body_weight=round(rng.gauss(82 if gender == models.Preferences.Gender.MALE else 64, 12), 1),
+                shared_profile=rng.random() < 0.8,
+            )]
+        models.Preferences.objects.bulk_create(preferences)
+
+        # 2. workout sessions (one per day at most, going back from today)
+        workout_sessions = []
+        for index, user_preferences in zip(user_indices, preferences):
+            rng = rngs[index]
+            days_ago = sorted(rng.sample(range(options['sessions_per_user'] * 2), options['sessions_per_user']))
+            for day in days_ago:
+                timestamp = now - timedelta(days=day, seconds=rng.randint(0, 12 * 3600))
+                workout_sessions += [models.WorkoutSession(
+                    user_id=user_preferences.user_id,
+                    title=f'workout {day}',
+                    duration=rng.randint(20, 120) * 60,
+                    timestamp=timestamp,
+                    local_date=models.WorkoutSession.compute_local_date(timestamp, user_preferences.timezone_offset_minutes),
+                )]
+        models.WorkoutSession.objects.bulk_create(workout_sessions, batch_size=options['chunk_size'])
+        workout_session_ids = {(user_id, timestamp): workout_session_id for workout_session_id, user_id, timestamp in models.WorkoutSession.objects.filter(user_id__in=user_ids.values()).values_list('id', 'user_id', 'timestamp')}
+
+        # 3. lifts, written in chunks
+        workout_sessions_by_user_id = {}
+        for workout_session in workout_sessions:
+            workout_sessions_by_user_id.setdefault(workout_session.user_id, []).append(workout_session)
+        lifts = []
+        for index, user_preferences in zip(user_indices, preferences):
+            rng = rngs[index]
+            for workout_session in workout_sessions_by_user_id.get(user_preferences.user_id, []):
+                workout_session_id = workout_session_ids[(workout_session.user_id, workout_session.timestamp)]
+                for set_index in range(options['sets_per_session']):
+                    repetitions = rng.randint(1, 12)
+                    lift_mass = round(user_preferences.body_weight * rng.uniform(0.3, 1.8) / 2.5) * 2.5
+                    lifts += [models.Lift(
+                        workout_session_id=workout_session_id,
+                        exercise_id=rng.choice(exercise_ids),
+                        lift_mass=lift_mass,
+                        repetitions=repetitions,
+                        one_rep_max=Tools.calculate_one_rep_max(lift_mass=lift_mass, repetitions=repetitions),
+                        timestamp=workout_session.timestamp + timedelta(minutes=set_index * 3),
+                    )]
+                if len(lifts) >= options['chunk_size']:
+                    models.Lift.objects.bulk_create(lifts, batch_size=options['chunk_size'])
+                    lifts_count += len(lifts)
+                    lifts = []
+        models.Lift.objects.bulk_create(lifts, batch_size=options['chunk_size'])
+        lifts_count += len(lifts)
+    return lifts_count
+
+
+def _init_worker():
+    # forked workers must not share the parent's database connections
+    connections.close_all()
+
+
+def _generate_users_chunk_in_worker(args):
+    return generate_users_chunk(*args)
+
+
+class Command(BaseCommand):
+    help = 'Generates a deterministic (seeded) synthetic dataset of users, workout sessions and lifts with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--sessions-per-user', type=int, default=100)
+        parser.add_argument('--sets-per-session', type=int, default=15)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--first-user-index', type=int, default=0, help='to extend a previously generated dataset')
+        parser.add_argument('--users-per-transaction', type=int, default=50)
+        parser.add_argument('--chunk-size', type=int, default=10000, help='rows per bulk insert')
+        parser.add_argument('--processes', type=int, default=1, help='parallel worker processes (mostly useful with PostgreSQL, SQLite serializes writes)')
+        parser.add_argument('--prefix', default='synthetic', help='username prefix of generated users')
+        parser.add_argument('--password', default='synthetic', help='password of all generated users')
+
+    def handle(self, *args, **options):
+        if options['processes'] > 1 and connections['default'].vendor == 'sqlite':
+            raise CommandError('SQLite allows a single writer, use --processes 1')
+        exercise_ids = list(models.Exercise.objects.order_by('id').values_list('id', flat=True))
+        if len(exercise_ids) == 0:
+            raise CommandError('no exercises in the database, load the exercise catalog first')
+
+        password_hash = make_password(options['password'])  # hashed once, hashing per user would dominate the run time
+        user_indices = list(range(options['first_user_index'], options['first_user_index'] + options['users']))
+        chunks = [user_indices[i:i + options['users_per_transaction']] for i in range(0, len(user_indices), options['users_per_transaction'])]
+        tasks = [(options, exercise_ids, password_hash, chunk) for chunk in chunks]
+
+        started_at = time.time()
+        lifts_count = 0
+        if options['processes'] > 1:
+            connections.close_all()
+            with multiprocessing.Pool(processes=options['processes'], initializer=_init_worker) as pool:
+                for chunk_index, chunk_lifts_count in enumerate(pool.imap_unordered(_generate_users_chunk_in_worker, tasks)):
+                    lifts_count += chunk_lifts_count
+                    self._report_progress(chunk_index + 1, len(chunks), lifts_count, started_at)
+        else:
+            for chunk_index, task in enumerate(tasks):
+                lifts_count += generate_users_chunk(*task)
+                self._report_progress(chunk_index + 1, len(chunks), lifts_count, started_at)
+
+        self.stdout.write(f'\n{lifts_count} lifts generated in {time.time() - started_at:.1f}s')
+        self.stdout.write('run rebuild_personal_records, backfill_training_volume and compute_strength_standards --full to fill the aggregate tables')
+
+    def _report_progress(self, done, total, lifts_count, started_at):
+        elapsed = time.time() - started_at
+        self.stdout.write(f'\r{done}/{total} chunks, {lifts_count} lifts, {lifts_count / max(elapsed, 1e-9):.0f} lifts/s', ending='')
+        self.stdout.flush()
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from workoutnote_django import catalog_import
+
+
+class Command(BaseCommand):
+    help = 'Imports (diffs and bulk applies) an exercise catalog csv file, without deleting anything'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='static/exercises-kr.csv', help='csv file with exercise, body part, [category], [name_<language>...] columns')
+        parser.add_argument('--dry-run', action='store_true', help='only report the changes')
+
+    def handle(self, *args, **options):
+        result = catalog_import.import_catalog(catalog_import.read_catalog_csv(options['path']), dry_run=options['dry_run'])
+        self.stdout.write(f'{"(dry run) " if options["dry_run"] else ""}{result}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User as django_User
+from workoutnote_django import aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recomputes personal records (and leaderboard entries) of all (or given) users from their lifts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-ids', type=int, nargs='+', help='only rebuild these users\' records')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or django_User.objects.values_list('id', flat=True).order_by('id').iterator()
+        count = 0
+        for user_id in user_ids:
+            aggregates.rebuild_personal_records(user_id)
+            count += 1
+        self.stdout.write(f'personal records rebuilt for {count} users')
@@ -0,0 +1,215 @@
+from django.db import connection
+from django.conf import settings
+import bisect
+import hmac
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+RESPONSE_SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)  # bytes
+UNRESOLVED_VIEW = '<unresolved>'
+SCRAPE_TOKEN = getattr(settings, 'METRICS_SCRAPE_TOKEN', None)
+
+
+class Histogram:
+    """
+    Prometheus style histogram, counts are kept per bucket (made cumulative when exported), the last one is +Inf.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+
+
+class ViewStats:
+    """
+    Metrics of one view (in one shard).
+    """
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.response_size = Histogram(RESPONSE_SIZE_BUCKETS)
+        self.sql_seconds = 0.0
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.queries.merge(other.queries)
+        self.response_size.merge(other.response_size)
+        self.sql_seconds += other.sql_seconds
+
+
+# region aggregation
+# every thread records into its own shard (only that thread ever writes it), so recording takes no lock,
+# the lock is only taken when a thread creates its shard and when shards are merged for an export.
+# shards of threads that exited are folded into the retired stats by the next merge, so thread churn doesn't grow the list.
+# metrics are per process, each worker process exports its own.
+_local = threading.local()
+_shards = []  # (thread, shard) of threads that were alive at the last merge
+_retired = {}  # view -> ViewStats of exited threads' shards
+_shards_lock = threading.Lock()
+
+
+def _get_shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append((threading.current_thread(), shard))
+    return shard
+
+
+def record(view, latency_seconds, queries, sql_seconds, response_size):
+    shard = _get_shard()
+    stats = shard.get(view)
+    if stats is None:
+        stats = shard[view] = ViewStats()
+    stats.latency.observe(latency_seconds)
+    stats.queries.observe(queries)
+    stats.response_size.observe(response_size)
+    stats.sql_seconds += sql_seconds
+
+
+def snapshot():
+    """
+    :return dict of view -> ViewStats merged over all threads' shards (a concurrent request may be half recorded, which the next scrape catches up with)
+    """
+    merged = {}
+    with _shards_lock:
+        live_shards = []
+        for thread, shard in _shards:
+            if thread.is_alive():
+                live_shards += [(thread, shard)]
+            else:  # no more writes to it
+                for view, stats in shard.items():
+                    _retired.setdefault(view, ViewStats()).merge(stats)
+        _shards[:] = live_shards
+        for view, stats in _retired.items():
+            merged.setdefault(view, ViewStats()).merge(stats)
+    for _, shard in live_shards:
+        for view, stats in list(shard.items()):
+            merged.setdefault(view, ViewStats()).merge(stats)
+    return merged
+
+
+def reset():
+    with _shards_lock:
+        _retired.clear()
+        _shards[:] = [(thread, shard) for thread, shard in _shards if thread.is_alive()]
+        for _, shard in _shards:
+            shard.clear()
+# endregion
+
+
+# region prometheus text format
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(number):
+    return repr(float(number)) if isinstance(number, float) else str(number)
+
+
+def _histogram_lines(name, view, histogram):
+    lines = []
+    cumulative = 0
+    for bucket, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+        cumulative += count
+        lines += [f'{name}_bucket{{view="{view}",le="{bucket}"}} {cumulative}']
+    lines += [f'{name}_sum{{view="{view}"}} {_format_number(histogram.sum)}', f'{name}_count{{view="{view}"}} {cumulative}']
+    return lines
+
+
+def export():
+    """
+    :return all metrics in Prometheus text exposition format (version 0.0.4)
+    """
+    stats_by_view = sorted(snapshot().items())
+    lines = []
+    for name, kind, description, get_histogram in [
+        ('workoutnote_request_duration_seconds', 'histogram', 'Request latency by view.', lambda stats: stats.latency),
+        ('workoutnote_request_sql_queries', 'histogram', 'SQL queries per request by view.', lambda stats: stats.queries),
+        ('workoutnote_response_size_bytes', 'histogram', 'Response body size by view.', lambda stats: stats.response_size),
+    ]:
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        for view, stats in stats_by_view:
+            lines += _histogram_lines(name, _escape(view), get_histogram(stats))
+    lines += ['# HELP workoutnote_request_sql_duration_seconds_total Time spent in SQL queries by view.', '# TYPE workoutnote_request_sql_duration_seconds_total counter']
+    for view, stats in stats_by_view:
+        lines += [f'workoutnote_request_sql_duration_seconds_total{{view="{_escape(view)}"}} {_format_number(stats.sql_seconds)}']
+    return '\n'.join(lines) + '\n'
+# endregion
+
+
+class _Observation:
+    """
+    One request's measurements, also installed as the database execute wrapper that times its queries.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started_at
+            self.queries += 1
+
+    def finish(self, view, response_size):
+        record(view, time.perf_counter() - self.started_at, self.queries, self.sql_seconds, response_size)
+
+
+class MetricsMiddleware:
+    """
+    Records latency, SQL queries (count and time) and response size of every request under its resolved view.
+    Streamed responses are recorded once their content is consumed, including the queries run while streaming.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        observation = _Observation()
+        with connection.execute_wrapper(observation):
+            response = self.get_response(request)
+        view = request.resolver_match.view_name if request.resolver_match is not None else UNRESOLVED_VIEW
+        if response.streaming:
+            response.streaming_content = self._stream(response.streaming_content, observation, view)
+        else:
+            observation.finish(view, len(response.content))
+        return response
+
+    @staticmethod
+    def _stream(content, observation, view):
+        response_size = 0
+        try:
+            with connection.execute_wrapper(observation):
+                for chunk in content:
+                    response_size += len(chunk)
+                    yield chunk
+        finally:
+            observation.finish(view, response_size)
+
+
+def is_scrape_allowed(request):
+    """
+    Metrics are for staff (admin session) or a scraper presenting the configured METRICS_SCRAPE_TOKEN as a bearer token.
+    """
+    if request.user.is_active and request.user.is_staff:
+        return True
+    return SCRAPE_TOKEN is not None and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {SCRAPE_TOKEN}')
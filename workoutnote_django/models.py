@@ -1,7 +1,11 @@
 from django.contrib.auth.models import User as django_User
-from utils.tools import Tools
-from django.db import models
+from utils.tools import Tools, Levels
+from django.db.models.functions import TruncDate
+from django.db.models import F, ExpressionWrapper, Q
+from django.db import models, transaction
+from datetime import datetime, timedelta, timezone as dt_timezone
 from django.utils import timezone
+import uuid
 
 
 def empty_json():
@@ -33,6 +37,22 @@ class Preferences(models.Model):
     date_of_birth = models.DateField(default=None, null=True)
     shared_profile = models.BooleanField(default=True)
     language = models.CharField(max_length=2, default=Language.ENGLISH, choices=Language.CHOICES)
+    timezone_offset_minutes = models.IntegerField(default=0)  # same convention as JS Date.getTimezoneOffset() i.e. UTC - local time
+    body_weight = models.FloatField(default=None, null=True)
+    modified_at = models.DateTimeField(auto_now=True, db_index=True)  # picked up by incremental strength standards refreshes
+
+    @staticmethod
+    def get_timezone_offset_minutes(user):
+        try:
+            return user.preferences.timezone_offset_minutes
+        except Preferences.DoesNotExist:
+            return 0
+
+    @staticmethod
+    def get_timezone_offset_minutes_by_user_id(user_id):
+        # reads the offset alone, without loading the user and its preferences
+        timezone_offset_minutes = Preferences.objects.filter(user_id=user_id).values_list('timezone_offset_minutes', flat=True).first()
+        return 0 if timezone_offset_minutes is None else timezone_offset_minutes
 
     def gender_str(self):
         return self.gender.__str__()
@@ -63,9 +83,9 @@ class BodyPart(models.Model):
 
     @staticmethod
     def init_body_parts():
-        BodyPart.objects.all().delete()
-        for body_part in ['등', '이두근', '가슴', '핵심', '숲', '다리', '어깨', '삼두근', '전체']:
-            BodyPart.objects.create(name=body_part)
+        # only missing ones are created, deleting body parts would cascade into exercises and lifts
+        existing_names = set(BodyPart.objects.values_list('name', flat=True))
+        BodyPart.objects.bulk_create([BodyPart(name=body_part) for body_part in ['등', '이두근', '가슴', '핵심', '숲', '다리', '어깨', '삼두근', '전체'] if body_part not in existing_names])
 
     def __str__(self):
         return f'{self.name}'
@@ -83,9 +103,9 @@ class Category(models.Model):
 
     @staticmethod
     def init_categories():
-        Category.objects.all().delete()
-        for category in ['무슨', '바벨', '체중', '굵은', '밧줄', '아령', '기계', '올림픽', '대회의']:
-            Category.objects.create(name=category)
+        # only missing ones are created, deleting categories would cascade into exercises and lifts
+        existing_names = set(Category.objects.values_list('name', flat=True))
+        Category.objects.bulk_create([Category(name=category) for category in ['무슨', '바벨', '체중', '굵은', '밧줄', '아령', '기계', '올림픽', '대회의'] if category not in existing_names])
 
     def __str__(self):
         return f'{self.name}'
@@ -100,17 +120,9 @@ class Exercise(models.Model):
     category = models.ForeignKey(to=Category, null=True, on_delete=models.CASCADE)
 
     @staticmethod
-    def init_from_csv():
-        Exercise.objects.all().delete()
-        with open('static/exercises-kr.csv', 'r', encoding='utf-8') as r:
-            for line in r.readlines()[1:]:
-                exercise_name, body_part_str = line[:-1].split(',')
-                if BodyPart.objects.filter(name=body_part_str).exists() and Category.objects.filter(name='무슨'):
-                    Exercise.objects.create(
-                        name=exercise_name,
-                        body_part=BodyPart.objects.get(name=body_part_str),
-                        category=Category.objects.get(name='무슨')
-                    )
+    def init_from_csv(path='static/exercises-kr.csv'):
+        from workoutnote_django import catalog_import
+        return catalog_import.import_catalog(catalog_import.read_catalog_csv(path))
 
     def __str__(self):
         return f'{self.name} ({self.body_part}, {self.category})'
@@ -123,10 +135,29 @@ class Exercise(models.Model):
             return self.name
 
 
+class CatalogVersion(models.Model):
+    """ Single row, changed along with the exercise catalog (in the same transaction); workers key their catalog caches by it. """
+    version = models.CharField(max_length=32)
+
+    @staticmethod
+    def get_current():
+        catalog_version, _ = CatalogVersion.objects.get_or_create(id=1, defaults={'version': uuid.uuid4().hex[:16]})
+        return catalog_version.version
+
+    @staticmethod
+    def bump():
+        version = uuid.uuid4().hex[:16]
+        CatalogVersion.objects.update_or_create(id=1, defaults={'version': version})
+        return version
+
+
 class FavoriteExercise(models.Model):
     user = models.ForeignKey(to=django_User, on_delete=models.CASCADE)
     exercise = models.ForeignKey(to='Exercise', on_delete=models.CASCADE)
 
+    class Meta:
+        unique_together = ('user', 'exercise',)
+
 
 class WorkoutSession(models.Model):
     id = models.AutoField(primary_key=True)
@@ -134,6 +165,56 @@ class WorkoutSession(models.Model):
     user = models.ForeignKey(to=django_User, on_delete=models.CASCADE)
     title = models.CharField(max_length=512, default='[unnamed workout]')
     duration = models.IntegerField(default=0)
+    modified_at = models.DateTimeField(auto_now=True, db_index=True)
+    local_date = models.DateField(default=None, null=True)  # day of timestamp in user's timezone (Preferences.timezone_offset_minutes)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'local_date']),
+            models.Index(fields=['user', 'timestamp', 'id']),  # (keyset) pagination in timestamp order
+        ]
+
+    @staticmethod
+    def local_date_expression(timezone_offset_minutes):
+        """
+        Database-side equivalent of WorkoutSession.compute_local_date() for annotations and bulk updates.
+        """
+        local_timestamp = ExpressionWrapper(F('timestamp') - timedelta(minutes=timezone_offset_minutes), output_field=models.DateTimeField())
+        return TruncDate(local_timestamp, tzinfo=dt_timezone.utc)
+
+    @staticmethod
+    def compute_local_date(timestamp, timezone_offset_minutes):
+        return (timestamp.astimezone(dt_timezone.utc) - timedelta(minutes=timezone_offset_minutes)).date()
+
+    @staticmethod
+    def update_local_dates(user, only_missing=False):
+        workout_sessions = WorkoutSession.objects.filter(user=user)
+        if only_missing:
+            workout_sessions = workout_sessions.filter(local_date__isnull=True)
+        workout_sessions.update(local_date=WorkoutSession.local_date_expression(Preferences.get_timezone_offset_minutes(user)))
+
+    @staticmethod
+    def backfill_local_dates():
+        """
+        One-off fill of local dates missing on workout sessions saved before they were stored (one update per timezone offset in use).
+        :return number of updated workout sessions
+        """
+        missing = WorkoutSession.objects.filter(local_date__isnull=True)
+        updated = missing.filter(user__preferences__isnull=True).update(local_date=WorkoutSession.local_date_expression(0))
+        timezone_offsets = Preferences.objects.filter(user__workoutsession__local_date__isnull=True).order_by().values_list('timezone_offset_minutes', flat=True).distinct()
+        for timezone_offset_minutes in list(timezone_offsets):
+            updated += missing.filter(user__preferences__timezone_offset_minutes=timezone_offset_minutes).update(local_date=WorkoutSession.local_date_expression(timezone_offset_minutes))
+        return updated
+
+    def save(self, *args, **kwargs):
+        if self.local_date is None:
+            timestamp = self.timestamp if self.id is not None and isinstance(self.timestamp, datetime) else timezone.now()  # auto_now_add sets timestamp later on
+            if WorkoutSession.user.is_cached(self) and django_User.preferences.is_cached(self.user):  # e.g. users resolved from an API sessionKey
+                timezone_offset_minutes = Preferences.get_timezone_offset_minutes(self.user)
+            else:
+                timezone_offset_minutes = Preferences.get_timezone_offset_minutes_by_user_id(self.user_id)
+            self.local_date = WorkoutSession.compute_local_date(timestamp, timezone_offset_minutes)
+        super().save(*args, **kwargs)
 
     def get_duration_str(self):
         seconds = self.duration % 60
@@ -144,6 +225,9 @@ class WorkoutSession(models.Model):
     def get_day_str(self):
         return timezone.localtime(self.timestamp).strftime('%Y.%m.%d. %a').upper()
 
+    def get_local_day_str(self):
+        return self.local_date.strftime('%Y.%m.%d. %a').upper()
+
     def __str__(self):
         return f'{self.user.username}, {self.timestamp}, {self.title}, {self.duration}'
 
@@ -151,6 +235,10 @@ class WorkoutSession(models.Model):
 class FavoriteWorkout(models.Model):
     user = models.ForeignKey(to=django_User, on_delete=models.CASCADE)
     workout_session = models.ForeignKey(to='WorkoutSession', on_delete=models.CASCADE)
+    modified_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'workout_session',)
 
 
 class Lift(models.Model):
@@ -161,12 +249,40 @@ class Lift(models.Model):
     lift_mass = models.FloatField()
     repetitions = models.IntegerField()
     one_rep_max = models.FloatField(default=None)
+    modified_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['workout_session', 'id'])]  # lifts of workout sessions in insertion order
+
+    @staticmethod
+    def bulk_insert(workout_session, sets):
+        """
+        Inserts all sets of a workout session with a single (bulk) insert.
+        :param workout_session (WorkoutSession) - workout session the lifts belong to
+        :param sets (list) - list of (exercise, lift_mass, repetitions) tuples with already validated exercises
+        """
+        with transaction.atomic():
+            lifts = Lift.objects.bulk_create([Lift(
+                workout_session=workout_session,
+                exercise=exercise,
+                lift_mass=lift_mass,
+                repetitions=repetitions,
+                one_rep_max=Tools.calculate_one_rep_max(lift_mass=lift_mass, repetitions=repetitions),
+            ) for exercise, lift_mass, repetitions in sets])
+            if len(lifts) > 0 and lifts[0].id is None:  # backend can't return ids from bulk inserts (e.g. sqlite)
+                lift_ids = Lift.objects.filter(workout_session=workout_session).order_by('-id').values_list('id', flat=True)[:len(lifts)]
+                for lift, lift_id in zip(lifts, reversed(list(lift_ids))):
+                    lift.id = lift_id
+            from workoutnote_django import aggregates
+            aggregates.lifts_inserted(workout_session.user_id, lifts)
+        return lifts
 
 
 class Note(models.Model):
     user = models.ForeignKey(to=django_User, on_delete=models.CASCADE)
     timestamp = models.DateTimeField()
     note = models.CharField(max_length=2048)
+    modified_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('user', 'timestamp',)
@@ -194,6 +310,7 @@ class OneRepMaxResults(models.Model):
     back = models.FloatField()
     abs = models.FloatField()
     legs = models.FloatField()
+    modified_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('user', 'timestamp',)
@@ -206,3 +323,154 @@ class Target(models.Model):
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
     achieved = models.BooleanField(default=True)
+    modified_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'timestamp'])]
+
+
+class Tombstone(models.Model):
+    user = models.ForeignKey(to=django_User, on_delete=models.CASCADE)
+    model_name = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'deleted_at'])]
+
+
+class StrengthStandard(models.Model):
+    BODY_WEIGHT_BUCKET_SIZE = 5  # kg
+
+    exercise = models.ForeignKey(to=Exercise, on_delete=models.CASCADE)
+    gender = models.CharField(max_length=24, choices=Preferences.Gender.CHOICES)
+    body_weight_bucket = models.IntegerField()  # lower bound (kg) of the bucket
+    age_range = models.CharField(max_length=8)  # key of Tools.AGE_RANGES
+    sample_size = models.IntegerField()
+    beginner = models.FloatField()
+    novice = models.FloatField()
+    intermediate = models.FloatField()
+    advanced = models.FloatField()
+    elite = models.FloatField()
+    computed_at = models.DateTimeField(default=timezone.now)  # start of the computation, lifts changed after it are picked up by the next refresh
+
+    class Meta:
+        unique_together = ('gender', 'body_weight_bucket', 'age_range', 'exercise',)
+
+    @staticmethod
+    def get_cohort(gender, body_weight, date_of_birth, today=None):
+        """
+        :param gender (str) - Preferences.Gender value
+        :param body_weight (float) - body weight in kg
+        :param date_of_birth (date) - date of birth
+        :param today (date) - day the age is computed at, defaults to today
+        :return (gender, body_weight_bucket, age_range) or None if the lifter doesn't fit any cohort
+        """
+        if body_weight is None or date_of_birth is None:
+            return None
+        today = today or timezone.now().date()
+        age = today.year - date_of_birth.year - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
+        age_range = Tools.get_age_range(age)
+        if age_range is None:
+            return None
+        body_weight_bucket = int(body_weight // StrengthStandard.BODY_WEIGHT_BUCKET_SIZE) * StrengthStandard.BODY_WEIGHT_BUCKET_SIZE
+        return gender, body_weight_bucket, f'{age_range[0]}-{age_range[1]}'
+
+    def get_boundaries(self):
+        return {
+            Levels.BEGINNER: self.beginner,
+            Levels.NOVICE: self.novice,
+            Levels.INTERMEDIATE: self.intermediate,
+            Levels.ADVANCED: self.advanced,
+            Levels.ELITE: self.elite,
+        }
+
+
+class StaleStrengthCohort(models.Model):
+    # cohort a lifter left (changed gender, body weight or date of birth, or was deleted), recomputed by the next incremental refresh
+    gender = models.CharField(max_length=24, choices=Preferences.Gender.CHOICES)
+    body_weight_bucket = models.IntegerField()
+    age_range = models.CharField(max_length=8)
+    marked_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+
+class PersonalRecord(models.Model):
+    user = models.ForeignKey(to=django_User, on_delete=models.CASCADE)
+    exercise = models.ForeignKey(to=Exercise, on_delete=models.CASCADE)
+    best_one_rep_max = models.FloatField()
+    heaviest_lift_mass = models.FloatField()
+    best_repetitions = models.JSONField(default=empty_json)  # lift mass (str) -> most repetitions lifted with it
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'exercise',)
+
+    @staticmethod
+    def mass_key(lift_mass):
+        return f'{lift_mass:g}'
+
+
+class TrainingVolume(models.Model):
+    class Period:
+        DAY = "DAY"
+        WEEK = "WEEK"  # ISO week, starting on Monday
+        ALL = [DAY, WEEK]
+        CHOICES = (
+            (DAY, 'Day'),
+            (WEEK, 'Week')
+        )
+
+    user = models.ForeignKey(to=django_User, on_delete=models.CASCADE)
+    period = models.CharField(max_length=8, choices=Period.CHOICES)
+    start_date = models.DateField()  # local day (WorkoutSession.local_date) or monday of the ISO week
+    body_part = models.ForeignKey(to=BodyPart, null=True, on_delete=models.CASCADE)
+    volume = models.FloatField(default=0)  # sum of lift_mass * repetitions
+    set_count = models.IntegerField(default=0)
+
+    class Meta:
+        # NULL body parts are distinct in a unique index, rows without a body part get their own
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'start_date', 'body_part'], condition=Q(body_part__isnull=False), name='unique_training_volume'),
+            models.UniqueConstraint(fields=['user', 'period', 'start_date'], condition=Q(body_part__isnull=True), name='unique_training_volume_without_body_part'),
+        ]
+        indexes = [models.Index(fields=['user', 'period', 'start_date'])]  # rollups of a period range, the partial unique indexes can't serve it
+
+    @staticmethod
+    def get_start_dates(local_date):
+        """
+        :return dict period -> start date of the period containing local_date
+        """
+        return {
+            TrainingVolume.Period.DAY: local_date,
+            TrainingVolume.Period.WEEK: local_date - timedelta(days=local_date.weekday()),
+        }
+
+
+class LeaderboardEntry(models.Model):
+    # upper limits (kg) of IPF body weight classes, heavier lifters are in the '<last limit>+' class
+    BODY_WEIGHT_CLASSES = {
+        Preferences.Gender.MALE: [59, 66, 74, 83, 93, 105, 120],
+        Preferences.Gender.FEMALE: [47, 52, 57, 63, 69, 76, 84],
+    }
+
+    user = models.ForeignKey(to=django_User, on_delete=models.CASCADE)
+    exercise = models.ForeignKey(to=Exercise, on_delete=models.CASCADE)
+    gender = models.CharField(max_length=24, choices=Preferences.Gender.CHOICES)
+    body_weight_class = models.CharField(max_length=8, default=None, null=True)
+    one_rep_max = models.FloatField()  # PersonalRecord.best_one_rep_max of a user with a shared profile
+
+    class Meta:
+        unique_together = ('user', 'exercise',)
+        indexes = [  # cover top-N reads and count-below ranks of both board kinds
+            models.Index(fields=['exercise', '-one_rep_max', 'user']),
+            models.Index(fields=['exercise', 'gender', 'body_weight_class', '-one_rep_max', 'user']),
+        ]
+
+    @staticmethod
+    def get_body_weight_class(gender, body_weight):
+        if body_weight is None or gender not in LeaderboardEntry.BODY_WEIGHT_CLASSES:
+            return None
+        for limit in LeaderboardEntry.BODY_WEIGHT_CLASSES[gender]:
+            if body_weight <= limit:
+                return str(limit)
+        return f'{LeaderboardEntry.BODY_WEIGHT_CLASSES[gender][-1]}+'
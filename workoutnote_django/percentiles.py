@@ -0,0 +1,127 @@
+from django.db.models.signals import post_save, post_delete
+from workoutnote_django import models
+from django.dispatch import receiver
+from django.db import transaction
+from django.conf import settings
+import numpy as np
+import threading
+import time
+
+BODY_PARTS = ['shoulder', 'chest', 'back', 'abs', 'legs']
+REBUILD_INTERVAL_SECONDS = getattr(settings, 'PERCENTILE_INDEX_REBUILD_INTERVAL_SECONDS', 300)
+MAX_PENDING = 1024  # buffered new results before the index is rebuilt early
+
+
+class PercentileIndex:
+    """
+    Sorted arrays of all OneRepMaxResults scores (one per body part), answers percentile queries with binary search.
+    Sorted arrays are never modified: results created after the load are buffered (unsorted, counted linearly) until the next rebuild.
+    """
+
+    def __init__(self, values_by_body_part, max_id=0):
+        self.values_by_body_part = {body_part: np.sort(np.asarray(values, dtype=np.float64)) for body_part, values in values_by_body_part.items()}
+        self.max_id = max_id  # results up to this id are in the sorted arrays
+        self.pending_by_body_part = {body_part: [] for body_part in self.values_by_body_part}
+        self.built_at = time.monotonic()
+
+    @staticmethod
+    def load():
+        rows = np.array(list(models.OneRepMaxResults.objects.values_list('id', *BODY_PARTS)), dtype=np.float64).reshape(-1, len(BODY_PARTS) + 1)
+        return PercentileIndex({body_part: rows[:, i + 1] for i, body_part in enumerate(BODY_PARTS)}, max_id=int(rows[:, 0].max()) if len(rows) > 0 else 0)
+
+    def is_expired(self):
+        return time.monotonic() - self.built_at > REBUILD_INTERVAL_SECONDS or len(self.pending_by_body_part[BODY_PARTS[0]]) >= MAX_PENDING
+
+    def insert(self, result):
+        # under _lock, readers copy the (short) buffers under it
+        if result.id <= self.max_id:
+            return
+        for body_part, pending in self.pending_by_body_part.items():
+            pending.append(float(getattr(result, body_part)))
+
+    def get_ratio(self, body_part, value, pending=()):
+        """
+        :param pending (list) - copy of the body part's buffered scores
+        :return ratio of scores less than or equal to the value (0.0 if there are no scores)
+        """
+        values = self.values_by_body_part[body_part]
+        if len(values) + len(pending) == 0:
+            return 0.0
+        return (np.searchsorted(values, value, side='right') + sum(1 for pending_value in pending if pending_value <= value)) / (len(values) + len(pending))
+
+
+# the index is swapped in once built (outside _lock, which only guards _index and the buffers), readers keep using the expired one meanwhile
+_index = None
+_lock = threading.Lock()
+_rebuild_lock = threading.Lock()
+_generation = 0  # bumped by invalidate(), an index loaded before is thrown away
+_created_while_rebuilding = None  # results created during a rebuild, the loaded index may not include them
+
+
+def get_index():
+    global _index, _created_while_rebuilding
+    index = _index
+    if index is not None and not index.is_expired():
+        return index
+    if not _rebuild_lock.acquire(blocking=index is None):  # only a cold start waits for the rebuild
+        return index
+    try:
+        with _lock:
+            index = _index
+            if index is not None and not index.is_expired():  # rebuilt while waiting
+                return index
+            generation = _generation
+            _created_while_rebuilding = []
+        new_index = PercentileIndex.load()
+        with _lock:
+            for result in _created_while_rebuilding:
+                new_index.insert(result)
+            _created_while_rebuilding = None
+            if _generation == generation:
+                _index = new_index
+        return new_index
+    finally:
+        _rebuild_lock.release()
+
+
+def get_ratios(result):
+    """
+    :param result (OneRepMaxResults) - result to rank among all results
+    :return dict body_part -> ratio of all scores less than or equal to result's score
+    """
+    index = get_index()
+    with _lock:
+        pending_by_body_part = {body_part: list(pending) for body_part, pending in index.pending_by_body_part.items()}
+    return {body_part: index.get_ratio(body_part, getattr(result, body_part), pending_by_body_part[body_part]) for body_part in BODY_PARTS}
+
+
+def invalidate():
+    global _index, _generation
+    with _lock:
+        _index = None
+        _generation += 1
+
+
+# region index maintenance
+# applied once the saving transaction commits: a rolled back result never reaches the buffers, and a rebuild
+# triggered by an invalidation loads the committed rows
+def _on_result_committed(result):
+    with _lock:
+        if _index is not None:
+            _index.insert(result)
+        if _created_while_rebuilding is not None:
+            _created_while_rebuilding.append(result)
+
+
+@receiver(post_save, sender=models.OneRepMaxResults)
+def _on_result_saved(sender, instance, created, using, **kwargs):
+    if created:
+        transaction.on_commit(lambda: _on_result_committed(instance), using=using)
+    else:
+        transaction.on_commit(invalidate, using=using)  # score of an existing result changed
+
+
+@receiver(post_delete, sender=models.OneRepMaxResults)
+def _on_result_deleted(sender, instance, using, **kwargs):
+    transaction.on_commit(invalidate, using=using)
+# endregion
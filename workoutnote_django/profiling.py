@@ -0,0 +1,255 @@
+from django.conf import settings
+from collections import Counter
+from io import StringIO
+import threading
+import cProfile
+import logging
+import pstats
+import random
+import json
+import time
+import sys
+import os
+import re
+
+SAMPLE_RATE = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+HEADER = getattr(settings, 'PROFILING_HEADER', 'X-Profile')
+STACK_SAMPLER_INTERVAL = getattr(settings, 'PROFILING_STACK_SAMPLER_INTERVAL', None)
+DIRECTORY = getattr(settings, 'PROFILING_DIRECTORY', os.path.join(settings.BASE_DIR, 'profiles'))
+MAX_PROFILES = getattr(settings, 'PROFILING_MAX_PROFILES', 200)
+
+PROFILE_ID_REGEX = re.compile(r'^[0-9]+-[0-9]+$')
+MAX_STACK_DEPTH = 128
+
+# one profiled request at a time per process (cProfile is per thread, but profiling concurrent requests would only add overhead)
+_profiling_lock = threading.Lock()
+_pruning_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(filename, line_number, function_name):
+    return f'{function_name} ({os.path.basename(filename)}:{line_number})'
+
+
+class StackSampler(threading.Thread):
+    """
+    Wall-clock sampler: snapshots the stack of one thread every interval (also while it waits on the database or the network, unlike cProfile).
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()  # collapsed stack -> number of samples
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack += [_frame_label(frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name)]
+                frame = frame.f_back
+            if len(stack) > 0:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+# region profile storage (ring buffer of the latest MAX_PROFILES profiles)
+def _path(profile_id, extension):
+    return os.path.join(DIRECTORY, f'{profile_id}.{extension}')
+
+
+def save_profile(profiler, sampler, metadata):
+    """
+    Writes a profile (pstats dump, collapsed wall-clock stacks if sampled and metadata), the oldest profiles over the limit are dropped in the background.
+    :return id of the saved profile
+    """
+    os.makedirs(DIRECTORY, exist_ok=True)
+    profile_id = f'{time.time_ns()}-{os.getpid()}'
+    try:
+        profiler.dump_stats(_path(profile_id, 'prof'))
+        if sampler is not None:
+            with open(_path(profile_id, 'stacks'), 'w') as w:
+                w.writelines(f'{stack} {count}\n' for stack, count in sampler.stacks.items())
+        with open(_path(profile_id, 'json'), 'w') as w:  # written last, a profile is listed once its metadata exists
+            json.dump(dict(metadata, id=profile_id, has_stacks=sampler is not None), w)
+    except OSError:
+        remove_profile(profile_id)
+        raise
+    threading.Thread(target=prune_profiles, daemon=True).start()
+    return profile_id
+
+
+def prune_profiles():
+    """
+    Removes the oldest profiles over MAX_PROFILES (one pruning at a time, profiles saved meanwhile are left to the next one).
+    """
+    if not _pruning_lock.acquire(blocking=False):
+        return
+    try:
+        for old_profile_id in get_profile_ids()[MAX_PROFILES:]:
+            remove_profile(old_profile_id)
+    except OSError:
+        logger.exception('pruning profiles failed')
+    finally:
+        _pruning_lock.release()
+
+
+def get_profile_ids():
+    """
+    :return ids of stored profiles, newest first
+    """
+    if not os.path.isdir(DIRECTORY):
+        return []
+    profile_ids = [filename[:-len('.json')] for filename in os.listdir(DIRECTORY) if filename.endswith('.json')]
+    return sorted([profile_id for profile_id in profile_ids if PROFILE_ID_REGEX.match(profile_id)], key=lambda profile_id: int(profile_id.split('-')[0]), reverse=True)
+
+
+def get_metadata(profile_id):
+    """
+    :return metadata of the profile or None if there is no such profile
+    """
+    if not PROFILE_ID_REGEX.match(profile_id):
+        return None
+    try:
+        with open(_path(profile_id, 'json'), 'r') as r:
+            return json.load(r)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def get_pstats_path(profile_id):
+    return _path(profile_id, 'prof')
+
+
+def remove_profile(profile_id):
+    for extension in ['json', 'prof', 'stacks']:
+        try:
+            os.remove(_path(profile_id, extension))
+        except FileNotFoundError:
+            pass
+# endregion
+
+
+# region output formats
+def get_text_report(profile_id, limit=60):
+    """
+    :return human readable pstats report, sorted by cumulative time
+    """
+    out = StringIO()
+    pstats.Stats(get_pstats_path(profile_id), stream=out).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return out.getvalue()
+
+
+def get_collapsed_stacks(profile_id):
+    """
+    Collapsed stacks ("frame;frame;frame count" lines), input of flamegraph.pl / speedscope.
+    Wall-clock samples when the stack sampler was on, otherwise approximated from cProfile's caller -> callee times (in microseconds).
+    """
+    metadata = get_metadata(profile_id)
+    if metadata is not None and metadata.get('has_stacks'):
+        with open(_path(profile_id, 'stacks'), 'r') as r:
+            return r.read()
+    return ''.join(f'{stack} {count}\n' for stack, count in _collapse_pstats(pstats.Stats(get_pstats_path(profile_id)).stats).items())
+
+
+def _collapse_pstats(stats):
+    # stats: function -> (primitive calls, calls, own time, cumulative time, callers: caller -> (.., .., own time, cumulative time))
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, caller_stats in callers.items():
+            callees.setdefault(caller, []).append((function, caller_stats[3]))
+    if len(stats) == 0:
+        return Counter()
+
+    # the profiled entry point may have callers (e.g. django's exception handling wrapper is re-entered by every middleware)
+    entry_point = max(stats, key=lambda function: stats[function][3])
+    roots = [function for function, function_stats in stats.items() if len(function_stats[4]) == 0 or function == entry_point]
+    min_seconds = stats[entry_point][3] * 1e-4  # keeps the number of stacks bounded
+    stacks = Counter()
+
+    def walk(function, seconds, stack):
+        stack = stack + [_frame_label(*function)]
+        children = []
+        if len(stack) < MAX_STACK_DEPTH:
+            # a function called from several places: its callees' time is split in proportion to this call site's share
+            share = seconds / stats[function][3] if stats[function][3] > 0 else 0
+            children = [(callee, callee_seconds * share) for callee, callee_seconds in callees.get(function, []) if callee_seconds * share >= min_seconds]
+            children_seconds = sum(callee_seconds for _, callee_seconds in children)
+            if children_seconds > seconds:  # recursive call sites are counted more than once, stacks may not outgrow their parent
+                children = [(callee, callee_seconds * seconds / children_seconds) for callee, callee_seconds in children]
+        for callee, callee_seconds in children:
+            walk(callee, callee_seconds, stack)
+        self_microseconds = int((seconds - sum(callee_seconds for _, callee_seconds in children)) * 1e6)
+        if self_microseconds > 0:
+            stacks[';'.join(stack)] += self_microseconds
+
+    for root in roots:
+        walk(root, stats[root][3], [])
+    return stacks
+# endregion
+
+
+def should_profile(request):
+    """
+    :return 'header' for a staff user's request carrying the profiling header, 'sample' for a randomly sampled one, None otherwise
+    """
+    if HEADER in request.headers and request.user.is_active and request.user.is_staff:
+        return 'header'
+    if SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE:
+        return 'sample'
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in request profiler (off unless PROFILING_SAMPLE_RATE > 0 or a staff user sends the PROFILING_HEADER header).
+    Needs request.user, so it goes after AuthenticationMiddleware. Streamed responses are profiled until the response is returned only.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = should_profile(request)
+        if trigger is None or not _profiling_lock.acquire(blocking=False):
+            return self.get_response(request)
+
+        try:
+            sampler = None
+            if STACK_SAMPLER_INTERVAL:
+                sampler = StackSampler(threading.get_ident(), STACK_SAMPLER_INTERVAL)
+                sampler.start()
+            profiler = cProfile.Profile()
+            started_at = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+                duration_ms = (time.perf_counter() - started_at) * 1000
+                if sampler is not None:
+                    sampler.stop()
+            try:
+                profile_id = save_profile(profiler, sampler, {
+                    'timestamp': time.time(),
+                    'method': request.method,
+                    'path': request.path,
+                    'view': request.resolver_match.view_name if request.resolver_match is not None else None,
+                    'status_code': response.status_code,
+                    'duration_ms': round(duration_ms, 2),
+                    'trigger': trigger,
+                })
+            except OSError:  # e.g. a full disk, the response goes out unprofiled
+                logger.exception('saving the profile of %s failed', request.path)
+                profile_id = None
+        finally:
+            _profiling_lock.release()
+
+        if trigger == 'header' and profile_id is not None:
+            response['X-Profile-Id'] = profile_id
+        return response
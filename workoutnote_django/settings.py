@@ -55,11 +55,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'workoutnote_django.metrics.MetricsMiddleware',  # first, so that time spent in the other middleware is included
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'workoutnote_django.profiling.ProfilingMiddleware',  # after authentication, the profiling header is for staff only
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -165,3 +167,34 @@ if os.getcwd() == '/app':
     SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
     SECURE_SSL_REDIRECT = True
     DEBUG = False
+
+# API sessionKey -> user resolution cache (see api/sessions.py)
+API_SESSION_CACHE_SIZE = 4096
+API_SESSION_CACHE_TTL = 60  # seconds
+# revoked tokens (logout, password change) are rejected by other worker processes only once their cached entry expires,
+# i.e. up to API_SESSION_CACHE_TTL later, unless this names a CACHES alias shared between workers (e.g. redis / memcached)
+API_SESSION_CACHE_ALIAS = None
+
+# signed API tokens (see api/tokens.py), None means tokens never expire (revocation only)
+API_TOKEN_MAX_AGE = 30 * 24 * 3600  # seconds
+API_PASSWORD_RESET_TOKEN_MAX_AGE = 3600  # seconds, reset links are single use as well
+
+# delta sync (see api/sync.py), overlap between consecutive syncs to cover in-flight transactions
+API_SYNC_TOKEN_LAG_SECONDS = 10
+API_SYNC_TOKEN_MAX_AGE_DAYS = 30  # older sync tokens get a full sync, tombstones are purged after this (manage.py purge_tombstones)
+
+# exercise catalog version is kept in the database, workers re-read it at most this often (see api/catalog.py)
+API_CATALOG_VERSION_CHECK_INTERVAL = 5  # seconds
+
+# in-process sorted 1RM scores for the report page are rebuilt at least this often (see workoutnote_django/percentiles.py)
+PERCENTILE_INDEX_REBUILD_INTERVAL_SECONDS = 300
+
+# per view latency / SQL / response size metrics at /metrics (see workoutnote_django/metrics.py), readable by staff users or with this bearer token
+METRICS_SCRAPE_TOKEN = None
+
+# sampled request profiling (see workoutnote_django/profiling.py), off by default, staff users can also profile a request by sending the header
+PROFILING_SAMPLE_RATE = 0.0  # ratio of requests profiled, e.g. 0.001
+PROFILING_HEADER = 'X-Profile'
+PROFILING_STACK_SAMPLER_INTERVAL = None  # seconds between wall-clock stack samples (e.g. 0.005), None for cProfile only
+PROFILING_DIRECTORY = BASE_DIR / 'profiles'
+PROFILING_MAX_PROFILES = 200  # oldest profiles are removed beyond this
@@ -0,0 +1,169 @@
+from django.db.models.signals import pre_save, pre_delete
+from django.dispatch import receiver
+from django.db.models import Q
+from django.db import transaction
+from django.utils import timezone
+from workoutnote_django import models
+from utils.tools import Tools
+from utils import ranking
+from datetime import timedelta
+from array import array
+
+STREAM_CHUNK_SIZE = 2000
+
+
+def _best_lifts(exercise_ids, lifter_filter=None):
+    """
+    Streams the best one rep max (personal record) of every lifter (with body weight and date of birth set) per exercise.
+    :param exercise_ids (list) - exercises to compute for
+    :param lifter_filter (Q) - optional filter on the personal records (e.g. to limit to some cohorts)
+    """
+    personal_records = models.PersonalRecord.objects.filter(
+        exercise_id__in=exercise_ids,
+        user__preferences__body_weight__isnull=False,
+        user__preferences__date_of_birth__isnull=False,
+    )
+    if lifter_filter is not None:
+        personal_records = personal_records.filter(lifter_filter)
+    return personal_records.values(
+        'exercise_id',
+        'best_one_rep_max',
+        'user__preferences__gender',
+        'user__preferences__body_weight',
+        'user__preferences__date_of_birth',
+    ).order_by().iterator(chunk_size=STREAM_CHUNK_SIZE)
+
+
+def _cohorts_of_users(user_ids, today):
+    cohorts = set()
+    for gender, body_weight, date_of_birth in models.Preferences.objects.filter(user_id__in=user_ids).values_list('gender', 'body_weight', 'date_of_birth'):
+        cohort = models.StrengthStandard.get_cohort(gender, body_weight, date_of_birth, today=today)
+        if cohort is not None:
+            cohorts.add(cohort)
+    return cohorts
+
+
+def _years_before(day, years):
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:  # february 29th
+        return day.replace(year=day.year - years, day=28)
+
+
+def _cohorts_of_users_changing_age_range(since, today):
+    """
+    :return cohorts left and entered by lifters who turned the first age of a range (or aged out of the last one) between both days
+    """
+    boundary_ages = {age for low, high in Tools.AGE_RANGES.values() for age in [low, high + 1]}
+    birthday_filter = Q()
+    for age in boundary_ages:  # a day of margin on both sides, the cohorts are compared exactly below
+        birthday_filter |= Q(date_of_birth__gte=_years_before(since, age) - timedelta(days=1), date_of_birth__lte=_years_before(today, age) + timedelta(days=1))
+    cohorts = set()
+    for gender, body_weight, date_of_birth in models.Preferences.objects.filter(birthday_filter, body_weight__isnull=False).values_list('gender', 'body_weight', 'date_of_birth'):
+        previous_cohort = models.StrengthStandard.get_cohort(gender, body_weight, date_of_birth, today=since)
+        cohort = models.StrengthStandard.get_cohort(gender, body_weight, date_of_birth, today=today)
+        if previous_cohort != cohort:
+            cohorts |= {previous_cohort, cohort} - {None}
+    return cohorts
+
+
+def compute_standards(changed_since=None):
+    """
+    Recomputes strength standards of POWERLIFTING_EXERCISE_NAMES from lift data in one streaming pass.
+    :param changed_since (datetime) - recompute only cohorts whose lifters' personal records or preferences changed, or who changed age range since then (None for all cohorts)
+    :return number of (exercise, cohort) standards written
+    """
+    started_at = timezone.now()
+    today = started_at.date()
+    exercise_ids = list(models.Exercise.objects.filter(name__in=Tools.POWERLIFTING_EXERCISE_NAMES).values_list('id', flat=True))
+    stale_cohorts = models.StaleStrengthCohort.objects.filter(marked_at__lt=started_at)
+
+    # 1. cohorts to recompute (None = all)
+    cohorts = None
+    lifter_filter = None
+    if changed_since is not None:
+        changed_user_ids = set(models.PersonalRecord.objects.filter(exercise_id__in=exercise_ids, updated_at__gte=changed_since).values_list('user_id', flat=True).distinct())
+        changed_user_ids |= set(models.Tombstone.objects.filter(model_name=models.Lift.__name__, deleted_at__gte=changed_since).values_list('user_id', flat=True).distinct())  # records removed with their last lift
+        changed_user_ids |= set(models.Preferences.objects.filter(modified_at__gte=changed_since).values_list('user_id', flat=True))
+        cohorts = _cohorts_of_users(changed_user_ids, today)
+        cohorts |= _cohorts_of_users_changing_age_range(changed_since.date(), today)
+        cohorts |= set(stale_cohorts.values_list('gender', 'body_weight_bucket', 'age_range').distinct())
+        if len(cohorts) == 0:
+            return 0
+        lifter_filter = Q()
+        for gender, body_weight_bucket, _ in cohorts:
+            lifter_filter |= Q(
+                user__preferences__gender=gender,
+                user__preferences__body_weight__gte=body_weight_bucket,
+                user__preferences__body_weight__lt=body_weight_bucket + models.StrengthStandard.BODY_WEIGHT_BUCKET_SIZE,
+            )
+
+    # 2. single streaming pass, grouping best lifts into compact per-cohort arrays
+    values_by_key = {}
+    for row in _best_lifts(exercise_ids, lifter_filter):
+        cohort = models.StrengthStandard.get_cohort(
+            row['user__preferences__gender'],
+            row['user__preferences__body_weight'],
+            row['user__preferences__date_of_birth'],
+            today=today,
+        )
+        if cohort is None or (cohorts is not None and cohort not in cohorts):
+            continue
+        values_by_key.setdefault((row['exercise_id'],) + cohort, array('d')).append(row['best_one_rep_max'])
+
+    # 3. level boundaries per cohort
+    standards = []
+    for (exercise_id, gender, body_weight_bucket, age_range), values in values_by_key.items():
+        cohort = ranking.Cohort(values)
+        boundaries = list(cohort.get_level_boundaries().values())
+        standards += [models.StrengthStandard(
+            exercise_id=exercise_id,
+            gender=gender,
+            body_weight_bucket=body_weight_bucket,
+            age_range=age_range,
+            sample_size=len(cohort),
+            beginner=boundaries[0],
+            novice=boundaries[1],
+            intermediate=boundaries[2],
+            advanced=boundaries[3],
+            elite=boundaries[4],
+            computed_at=started_at,
+        )]
+
+    # 4. replace the recomputed standards
+    with transaction.atomic():
+        if cohorts is None:
+            models.StrengthStandard.objects.all().delete()
+        else:
+            stale_filter = Q()
+            for gender, body_weight_bucket, age_range in cohorts:
+                stale_filter |= Q(gender=gender, body_weight_bucket=body_weight_bucket, age_range=age_range)
+            models.StrengthStandard.objects.filter(stale_filter).delete()
+        models.StrengthStandard.objects.bulk_create(standards)
+        stale_cohorts.delete()  # cohorts marked during the computation are kept for the next refresh
+    return len(standards)
+
+
+# region cohorts left by lifters
+def _mark_stale(gender, body_weight, date_of_birth):
+    cohort = models.StrengthStandard.get_cohort(gender, body_weight, date_of_birth)
+    if cohort is not None:
+        gender, body_weight_bucket, age_range = cohort
+        models.StaleStrengthCohort.objects.create(gender=gender, body_weight_bucket=body_weight_bucket, age_range=age_range)
+
+
+@receiver(pre_save, sender=models.Preferences)
+def _on_preferences_saving(sender, instance, raw=False, **kwargs):
+    # the new cohort is found through Preferences.modified_at, the one the lifter leaves is only known before the update
+    if raw or instance._state.adding:
+        return
+    previous = models.Preferences.objects.filter(user_id=instance.user_id).values_list('gender', 'body_weight', 'date_of_birth').first()
+    date_of_birth = models.Preferences._meta.get_field('date_of_birth').to_python(instance.date_of_birth)  # views may assign a string or a datetime
+    if previous is not None and models.StrengthStandard.get_cohort(*previous) != models.StrengthStandard.get_cohort(instance.gender, instance.body_weight, date_of_birth):
+        _mark_stale(*previous)
+
+
+@receiver(pre_delete, sender=models.Preferences)
+def _on_preferences_deleting(sender, instance, **kwargs):
+    _mark_stale(instance.gender, instance.body_weight, instance.date_of_birth)
+# endregion
@@ -4,11 +4,34 @@ from workoutnote_django import models
 register = template.Library()
 
 
-@register.simple_tag
-def is_favorite_exercise(user, exercise):
-    return models.FavoriteExercise.objects.filter(user=user, exercise=exercise).exists()
+def get_favorite_ids(context, user, model, field_name):
+    """
+    Loads ids of user's favorites once per request (or per rendering if there is no request in context).
+    :param model - FavoriteExercise or FavoriteWorkout
+    :param field_name (str) - id field of the favorite object i.e. 'exercise_id' or 'workout_session_id'
+    """
+    request = context.get('request')
+    if request is None:
+        favorite_ids_cache = context.render_context.setdefault('favorite_ids_cache', {})
+    else:
+        if not hasattr(request, 'favorite_ids_cache'):
+            request.favorite_ids_cache = {}
+        favorite_ids_cache = request.favorite_ids_cache
+    key = (user.id, model.__name__)
+    if key not in favorite_ids_cache:
+        favorite_ids_cache[key] = frozenset(model.objects.filter(user=user).values_list(field_name, flat=True))
+    return favorite_ids_cache[key]
 
 
-@register.simple_tag
-def is_favorite_workout(user, workout_session):
-    return models.FavoriteWorkout.objects.filter(user=user, workout_session=workout_session).exists()
+@register.simple_tag(takes_context=True)
+def is_favorite_exercise(context, user, exercise):
+    if not user.is_authenticated:
+        return False
+    return exercise.id in get_favorite_ids(context, user, models.FavoriteExercise, 'exercise_id')
+
+
+@register.simple_tag(takes_context=True)
+def is_favorite_workout(context, user, workout_session):
+    if not user.is_authenticated:
+        return False
+    return workout_session.id in get_favorite_ids(context, user, models.FavoriteWorkout, 'workout_session_id')
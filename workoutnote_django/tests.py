@@ -0,0 +1,304 @@
+from django.contrib.auth.models import User as django_User
+from django.test import TestCase
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from workoutnote_django import models as wn_models, aggregates, metrics, percentiles, profiling, standards, timeline
+from unittest import mock
+from datetime import date, timedelta
+import threading
+import tempfile
+import io
+import os
+from api import sessions, tokens
+
+
+class PageTestCase(TestCase):
+    """
+    A logged in user (with preferences) and a small exercise catalog.
+    """
+
+    def setUp(self):
+        sessions.clear()
+        self.user = django_User.objects.create_user(username='lifter@workoutnote.com', password='password')
+        wn_models.Preferences.objects.create(user=self.user, name='lifter', body_weight=80)
+        body_part = wn_models.BodyPart.objects.create(name='chest')
+        category = wn_models.Category.objects.create(name='barbell')
+        self.exercises = [wn_models.Exercise.objects.create(name=f'exercise {i}', body_part=body_part, category=category) for i in range(5)]
+        self.client.force_login(self.user)
+
+
+class PageTokenTest(PageTestCase):
+    def test_page_token_is_reused(self):
+        session_key = self.client.get('/calculators/').context['sessionKey']
+        self.assertEqual(sessions.resolve_user(session_key).id, self.user.id)
+        self.assertEqual(self.client.get('/calendar/').context['sessionKey'], session_key)
+
+    def test_page_token_is_reissued_once_revoked(self):
+        session_key = self.client.get('/calculators/').context['sessionKey']
+        tokens.revoke_tokens(self.user)
+        new_session_key = self.client.get('/calculators/').context['sessionKey']
+        self.assertNotEqual(new_session_key, session_key)
+        self.assertEqual(sessions.resolve_user(new_session_key).id, self.user.id)
+
+
+class TimelineTest(PageTestCase):
+    def create_favorite_workouts(self, days):
+        today = timezone.now().date()
+        for day in range(days):
+            workout_session = wn_models.WorkoutSession.objects.create(user=self.user, title=f'day {day}', local_date=today - timedelta(days=day))
+            wn_models.Lift.bulk_insert(workout_session, [(self.exercises[0], 100, 5), (self.exercises[1], 60, 8)])
+            wn_models.FavoriteWorkout.objects.create(user=self.user, workout_session=workout_session)
+
+    def test_favorites_page_shows_recent_days_and_older_ones_are_fetched(self):
+        self.create_favorite_workouts(timeline.TIMELINE_DAYS + 5)
+        response = self.client.get('/favorite-workouts/')
+        self.assertEqual(len(response.context['workouts_by_days']), timeline.TIMELINE_DAYS)
+        self.assertIsNotNone(response.context['timeline_before'])
+
+        session_key = response.context['sessionKey']
+        older = self.client.post('/api/fetch_timeline/', {'sessionKey': session_key, 'beforeDate': response.context['timeline_before'].isoformat(), 'favoritesOnly': 'true'}).json()
+        self.assertEqual(len(older['days']), 5)
+        self.assertIsNone(older['nextBeforeDate'])
+        shown_titles = {workout.title for _, workouts in response.context['workouts_by_days'] for workout, _ in workouts}
+        fetched_titles = {workout['title'] for day in older['days'] for workout in day['workouts']}
+        self.assertEqual(shown_titles | fetched_titles, {f'day {day}' for day in range(timeline.TIMELINE_DAYS + 5)})
+        self.assertFalse(shown_titles & fetched_titles)
+
+    def test_timeline_is_read_only_and_prefetched(self):
+        self.create_favorite_workouts(3)
+        with self.assertNumQueries(3):  # days window, workout sessions, lifts with exercises and body parts
+            workouts_by_days, _ = timeline.build_timeline(wn_models.WorkoutSession.objects.filter(user=self.user))
+            body_parts = [lift.exercise.body_part.name for workouts in workouts_by_days.values() for lifts in workouts.values() for lift in lifts]
+        self.assertEqual(len(body_parts), 6)
+
+
+class PagesTest(PageTestCase):
+    def test_pages_render(self):
+        for path in ['/', '/calendar/', '/favorite-workouts/', '/calculators/', '/settings/']:
+            for lang in ['en', 'kr']:
+                self.client.cookies['lang'] = lang
+                self.assertEqual(self.client.get(path).status_code, 200, f'{path} ({lang})')
+
+
+class PageQueryCountTest(PageTestCase):
+    PAGE_QUERIES = {
+        '/': 4,  # session, user, preferences, favorite exercises
+        '/calendar/': 3,  # session, user, favorite exercises
+        '/favorite-workouts/': 6,  # session, user, timeline days, workouts, lifts, favorite exercises
+    }
+
+    def add_favorites(self, count):
+        body_part, category = self.exercises[0].body_part, self.exercises[0].category
+        exercises = [wn_models.Exercise.objects.create(name=f'favorite exercise {wn_models.Exercise.objects.count()}', body_part=body_part, category=category) for _ in range(count)]
+        for exercise in exercises:
+            wn_models.FavoriteExercise.objects.create(user=self.user, exercise=exercise)
+            workout_session = wn_models.WorkoutSession.objects.create(user=self.user, title=exercise.name)
+            wn_models.Lift.bulk_insert(workout_session, [(exercise, 100, 5)])
+            wn_models.FavoriteWorkout.objects.create(user=self.user, workout_session=workout_session)
+
+    def assert_page_queries(self):
+        for path, queries in self.PAGE_QUERIES.items():
+            self.client.get(path)  # warm catalog, page token and session caches
+            self.client.get(path)
+            with self.assertNumQueries(queries):
+                self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_page_query_count_does_not_grow_with_favorites(self):
+        self.add_favorites(2)
+        self.assert_page_queries()
+        self.add_favorites(20)
+        self.assert_page_queries()
+
+
+class PercentileIndexTest(PageTestCase):
+    def setUp(self):
+        super().setUp()
+        percentiles.invalidate()
+        for score in [10, 20, 30, 40]:
+            self.create_result(score)
+
+    def tearDown(self):
+        percentiles.invalidate()
+
+    def create_result(self, score):
+        with self.captureOnCommitCallbacks(execute=True):
+            return wn_models.OneRepMaxResults.objects.create(user=self.user, name='lifter', gender=wn_models.OneRepMaxResults.Gender.MALE, age=30, height=180, weight=80, shoulder=score, chest=score, back=score, abs=score, legs=score)
+
+    def test_new_results_are_buffered(self):
+        index = percentiles.get_index()
+        result = self.create_result(25)
+        self.assertIs(percentiles.get_index(), index)
+        self.assertEqual(len(index.values_by_body_part['chest']), 4)
+        self.assertEqual(percentiles.get_ratios(result)['chest'], 3 / 5)
+        percentiles.invalidate()
+        self.assertEqual(percentiles.get_ratios(result)['chest'], 3 / 5)
+
+    def test_rolled_back_results_are_not_buffered(self):
+        index = percentiles.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    wn_models.OneRepMaxResults.objects.create(user=self.user, name='lifter', gender=wn_models.OneRepMaxResults.Gender.MALE, age=30, height=180, weight=80, shoulder=0, chest=0, back=0, abs=0, legs=0)
+                    raise RuntimeError()
+            except RuntimeError:
+                pass
+        self.assertEqual(index.pending_by_body_part['chest'], [])
+
+    def test_readers_use_the_expired_index_while_it_is_rebuilt(self):
+        index = percentiles.get_index()
+        index.built_at -= percentiles.REBUILD_INTERVAL_SECONDS + 1
+        loading, release = threading.Event(), threading.Event()
+        loaded = percentiles.PercentileIndex.load()  # in this thread, the test's transaction is not visible to others
+
+        def slow_load():
+            loading.set()
+            release.wait(5)
+            return loaded
+
+        with mock.patch.object(percentiles.PercentileIndex, 'load', side_effect=slow_load):
+            rebuild = threading.Thread(target=percentiles.get_index)
+            rebuild.start()
+            self.assertTrue(loading.wait(5))
+            self.assertIs(percentiles.get_index(), index)  # does not wait for the rebuild
+            result = self.create_result(50)  # created during the rebuild
+            release.set()
+            rebuild.join()
+        new_index = percentiles.get_index()
+        self.assertIsNot(new_index, index)
+        self.assertIs(new_index, loaded)
+        self.assertEqual(new_index.pending_by_body_part['legs'], [50])  # created while loading
+        self.assertEqual(percentiles.get_ratios(result)['legs'], 1.0)
+
+
+class StrengthStandardTest(PageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.squat = wn_models.Exercise.objects.create(name='스쿼트', body_part=self.exercises[0].body_part, category=self.exercises[0].category)  # default (korean) catalog name
+        self.user.preferences.date_of_birth = date(1990, 1, 1)
+        self.user.preferences.save()
+        wn_models.Lift.bulk_insert(wn_models.WorkoutSession.objects.create(user=self.user), [(self.squat, 100, 5)])
+
+    def get_cohorts(self):
+        return set(wn_models.StrengthStandard.objects.filter(exercise=self.squat).values_list('gender', 'body_weight_bucket', 'age_range'))
+
+    def test_korean_catalog_exercises_have_standards(self):
+        self.assertEqual(standards.compute_standards(), 1)
+        self.assertEqual(self.get_cohorts(), {(wn_models.Preferences.Gender.MALE, 80, '24-39')})
+
+    def test_changed_preferences_move_the_lifter_to_another_cohort(self):
+        standards.compute_standards()
+        changed_since = timezone.now()
+        self.user.preferences.body_weight = 92
+        self.user.preferences.date_of_birth = '1990-01-01'  # as assigned by the settings API
+        self.user.preferences.save()
+        self.assertEqual(standards.compute_standards(changed_since=changed_since), 1)
+        self.assertEqual(self.get_cohorts(), {(wn_models.Preferences.Gender.MALE, 90, '24-39')})
+        self.assertFalse(wn_models.StaleStrengthCohort.objects.exists())
+
+    def test_deleted_lifter_leaves_the_cohort(self):
+        standards.compute_standards()
+        changed_since = timezone.now()
+        self.user.delete()
+        self.assertEqual(standards.compute_standards(changed_since=changed_since), 0)
+        self.assertEqual(self.get_cohorts(), set())
+
+    def test_lifters_ageing_into_a_new_range_are_picked_up(self):
+        today = timezone.now().date()
+        wn_models.Preferences.objects.filter(user=self.user).update(date_of_birth=standards._years_before(today, 18), modified_at=timezone.now() - timedelta(days=3))
+        wn_models.PersonalRecord.objects.filter(user=self.user).update(updated_at=timezone.now() - timedelta(days=3))
+        standards.compute_standards()
+        wn_models.StrengthStandard.objects.update(age_range='14-17')  # as computed before the birthday
+        self.assertEqual(standards.compute_standards(changed_since=timezone.now() - timedelta(days=2)), 1)
+        self.assertEqual(self.get_cohorts(), {(wn_models.Preferences.Gender.MALE, 80, '18-23')})
+
+
+class TrainingVolumeTest(PageTestCase):
+    def create_workouts(self, days):
+        for day in range(days):
+            workout_session = wn_models.WorkoutSession.objects.create(user=self.user, timestamp=timezone.now() - timedelta(days=day))
+            wn_models.Lift.bulk_insert(workout_session, [(exercise, 50 + i, 5) for i, exercise in enumerate(self.exercises)])
+
+    def get_rollups(self):
+        return set(wn_models.TrainingVolume.objects.values_list('user_id', 'period', 'start_date', 'body_part_id', 'volume', 'set_count'))
+
+    def test_backfill_replaces_the_rollups(self):
+        self.create_workouts(10)
+        rollups = self.get_rollups()
+        wn_models.TrainingVolume.objects.update(volume=0)
+        call_command('backfill_training_volume', chunk_size=7, stdout=io.StringIO())
+        self.assertEqual(self.get_rollups(), rollups)
+
+    def test_rows_are_updated_in_batches(self):
+        self.create_workouts(10)
+        rows = [(self.user.id, workout_session.local_date, self.exercises[0].body_part_id, 10, 1) for workout_session in wn_models.WorkoutSession.objects.filter(user=self.user)]
+        with self.assertNumQueries(2):  # existing rows, one update
+            aggregates.apply_training_volume(rows)
+
+    def test_rows_without_body_part_are_unique(self):
+        wn_models.TrainingVolume.objects.create(user=self.user, period=wn_models.TrainingVolume.Period.DAY, start_date=timezone.now().date(), body_part=None)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            wn_models.TrainingVolume.objects.create(user=self.user, period=wn_models.TrainingVolume.Period.DAY, start_date=timezone.now().date(), body_part=None)
+        aggregates.apply_training_volume([(self.user.id, timezone.now().date(), None, 10, 1)])  # added to the existing row
+        self.assertEqual(wn_models.TrainingVolume.objects.get(period=wn_models.TrainingVolume.Period.DAY, body_part=None).set_count, 1)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def record_in_threads(self, count):
+        threads = [threading.Thread(target=metrics.record, args=('view', 0.01, 3, 0.001, 1000)) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_shards_of_exited_threads_are_retired(self):
+        metrics.record('view', 0.01, 3, 0.001, 1000)
+        self.record_in_threads(20)
+        self.assertEqual(sum(metrics.snapshot()['view'].latency.counts), 21)
+        self.assertEqual(len(metrics._shards), 1)  # this thread's
+        self.record_in_threads(5)
+        self.assertEqual(sum(metrics.snapshot()['view'].latency.counts), 26)
+        self.assertEqual(len(metrics._shards), 1)
+
+    def test_reset_clears_retired_shards(self):
+        self.record_in_threads(3)
+        metrics.snapshot()
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), {})
+
+
+class ProfilingTest(PageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def get_profiled(self, path='/calculators/'):
+        return self.client.get(path, HTTP_X_PROFILE='1')
+
+    def test_profiles_are_saved_listed_and_pruned(self):
+        with mock.patch.object(profiling, 'DIRECTORY', self.directory.name), mock.patch.object(profiling, 'MAX_PROFILES', 2):
+            with mock.patch.object(profiling, 'prune_profiles'):  # the background pruning
+                profile_ids = [self.get_profiled()['X-Profile-Id'] for _ in range(3)]
+            self.assertEqual(profiling.get_profile_ids(), profile_ids[::-1])  # not pruned by the request
+            profiling.prune_profiles()
+            self.assertEqual(profiling.get_profile_ids(), profile_ids[:0:-1])
+            response = self.client.get('/admin/profiles/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(timezone.is_aware(response.context['profiles'][0]['recorded_at']))
+
+    def test_failed_save_still_returns_the_response(self):
+        unwritable = os.path.join(self.directory.name, 'file')
+        open(unwritable, 'w').close()
+        with mock.patch.object(profiling, 'DIRECTORY', os.path.join(unwritable, 'profiles')), self.assertLogs(profiling.logger, 'ERROR'):
+            response = self.get_profiled()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
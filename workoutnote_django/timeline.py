@@ -0,0 +1,34 @@
+from workoutnote_django import models
+from django.db.models import Prefetch
+
+TIMELINE_DAYS = 14
+
+
+def build_timeline(workout_sessions, days=TIMELINE_DAYS, before=None):
+    """
+    Groups workout sessions (with their lifts) by local day, most recent day & workout first. Read-only, local dates are stored when workouts are saved.
+    :param workout_sessions (QuerySet) - workout sessions to show
+    :param days (int) - number of most recent days to include, None for all of them
+    :param before (date) - only include days before this local date (for lazy-loading older days)
+    :return (workouts_by_days, next_before) tuple, where workouts_by_days maps day_str -> {workout_session: [lifts]},
+    and next_before is the local date to continue from (None if there are no older days)
+    """
+    workout_sessions = workout_sessions.filter(lift__isnull=False)
+    if before is not None:
+        workout_sessions = workout_sessions.filter(local_date__lt=before)
+
+    # 1. pick window of the most recent days
+    next_before = None
+    if days is not None:
+        local_dates = list(workout_sessions.order_by('-local_date').values_list('local_date', flat=True).distinct()[:days + 1])
+        if len(local_dates) > days:
+            next_before = local_dates[days - 1]
+        if len(local_dates) > 0:
+            workout_sessions = workout_sessions.filter(local_date__gte=local_dates[:days][-1])
+
+    # 2. load workouts and lifts of these days, group by day in a single pass
+    workouts_by_days = {}
+    lifts_prefetch = Prefetch('lift_set', queryset=models.Lift.objects.select_related('exercise__body_part').order_by('id'))
+    for workout_session in workout_sessions.distinct().order_by('-local_date', '-timestamp').prefetch_related(lifts_prefetch):
+        workouts_by_days.setdefault(workout_session.get_local_day_str(), {})[workout_session] = list(workout_session.lift_set.all())
+    return workouts_by_days, next_before
@@ -8,11 +8,13 @@ urlpatterns = [
     path('policy/', views.handle_privacy_policy, name='policy'),
 
     path('', views.handle_index, name='index'),
+    path('admin/profiles/', views.handle_profiles, name='profiles'),  # before admin/, which would catch them
+    path('admin/profiles/<str:profile_id>/<str:output_format>', views.handle_profile, name='profile'),
     path('admin/', admin.site.urls, name='admin'),
     path('api/', include('api.urls')),
+    path('metrics', views.handle_metrics, name='metrics'),
 
     path('init-configs/', views.handle_init_configs),
-    path('generate-dummy-data/', views.handle_generate_dummy_data),
 
     path('calculators/', views.handle_calculators, name='calculators'),
     path('calculators/<str:session_key>/<str:calculator>/<str:language>', views.handle_param_calculators, name='param calculators'),
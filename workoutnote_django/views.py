@@ -1,23 +1,23 @@
 import json
 import random
 import re
-import time
 from datetime import datetime
-import numpy as np
 
 from django.conf import settings
 from django.contrib.auth import login, logout, authenticate
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User as django_User
 from django.core.mail import EmailMessage
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden, FileResponse, Http404
 from django.shortcuts import render, redirect
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
-from utils.tools import Tools
-from workoutnote_django import models
-from api import models as api_models
+from workoutnote_django import models, percentiles, timeline, metrics, profiling
+from api import catalog as api_catalog, sessions as api_sessions, tokens as api_tokens
 
 LIMIT_OF_ACCEPTABLE_DATA_AMOUNT = 5
 
@@ -31,13 +31,6 @@ def handle_init_configs(request):
     return redirect(to='index')
 
 
-@login_required
-def handle_generate_dummy_data(request):
-    if request.user.is_superuser:
-        Tools.generate_dummy_data()
-    return redirect(to='index')
-
-
 # region authentication
 @csrf_exempt
 @require_http_methods(['GET', 'POST'])
@@ -130,52 +123,65 @@ def handle_privacy_policy(request):
     return render(request=request, template_name='privacy policy.html')
 
 
+@require_http_methods(['GET'])
+def handle_metrics(request):
+    if not metrics.is_scrape_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.export(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# region profiles
+@staff_member_required
+@require_http_methods(['GET'])
+def handle_profiles(request):
+    profiles = [profiling.get_metadata(profile_id) for profile_id in profiling.get_profile_ids()]
+    profiles = [dict(profile, recorded_at=datetime.fromtimestamp(profile['timestamp'], tz=timezone.utc)) for profile in profiles if profile is not None]
+    return render(request=request, template_name='admin/profiles.html', context={
+        'title': 'Request profiles',
+        'profiles': profiles,
+        'sample_rate': profiling.SAMPLE_RATE,
+        'header': profiling.HEADER,
+        'max_profiles': profiling.MAX_PROFILES,
+    })
+
+
+@staff_member_required
+@require_http_methods(['GET'])
+def handle_profile(request, profile_id, output_format):
+    """
+    :param profile_id (str) - id of a stored profile
+    :param output_format (str) - 'pstats' (binary, for pstats / snakeviz), 'collapsed' (flamegraph input) or 'text' (report sorted by cumulative time)
+    """
+    if profiling.get_metadata(profile_id) is None or output_format not in ['pstats', 'collapsed', 'text']:
+        raise Http404()
+
+    if output_format == 'pstats':
+        return FileResponse(open(profiling.get_pstats_path(profile_id), 'rb'), as_attachment=True, filename=f'{profile_id}.prof')
+    elif output_format == 'collapsed':
+        return HttpResponse(profiling.get_collapsed_stacks(profile_id), content_type='text/plain; charset=utf-8')
+    else:
+        return HttpResponse(profiling.get_text_report(profile_id), content_type='text/plain; charset=utf-8')
+# endregion
+
+
 @login_required
 def handle_index(request):
     name = models.Preferences.objects.get(user=request.user).name
-    db_workout_sessions = models.WorkoutSession.objects.filter(user=request.user).order_by('-timestamp')
-    workouts_by_days = {}
-    for db_workout_session in db_workout_sessions:
-        db_lifts = models.Lift.objects.filter(workout_session=db_workout_session).order_by('id')
-        day_str = db_workout_session.get_day_str()
-        for db_lift in db_lifts:
-            if day_str in workouts_by_days:
-                if db_workout_session in workouts_by_days[day_str]:
-                    workouts_by_days[day_str][db_workout_session] += [db_lift]
-                else:
-                    workouts_by_days[day_str][db_workout_session] = [db_lift]
-            else:
-                workouts_by_days[day_str] = {db_workout_session: [db_lift]}
-    if not api_models.SessionKey.objects.filter(user=request.user).exists():
-        session_key = api_models.SessionKey.generate_key(email=request.user.email)
-        while api_models.SessionKey.objects.filter(key=session_key).exists():
-            time.sleep(0.001)
-            session_key = api_models.SessionKey.generate_key(email=request.user.email)
-        api_models.SessionKey.objects.create(user=request.user, key=session_key)
-    else:
-        session_key = api_models.SessionKey.objects.get(user=request.user).key
+    session_key = api_sessions.get_page_token(request)
     lang = request.COOKIES.get('lang')
     return render(request=request, template_name='home_kr.html' if lang is not None and lang == 'kr' else 'home_en.html', context={
         'name': name if name else request.user.username,
         'at_home': True,
-        'exercises': models.Exercise.objects.all(),
-        'body_parts': models.BodyPart.objects.all(),
+        'exercises': api_catalog.get_registry().exercises,
+        'body_parts': api_catalog.get_registry().body_parts,
         'sessionKey': session_key,
-        'workouts_by_days': workouts_by_days
     })
 
 
 @login_required
 def handle_calculators(request):
     lang = request.COOKIES.get('lang')
-    if not api_models.SessionKey.objects.filter(user=request.user).exists():
-        session_key = api_models.SessionKey.generate_key(email=request.user.email)
-        while api_models.SessionKey.objects.filter(key=session_key).exists():
-            time.sleep(0.001)
-            session_key = api_models.SessionKey.generate_key(email=request.user.email)
-        api_models.SessionKey.objects.create(user=request.user, key=session_key)
-    else:
-        session_key = api_models.SessionKey.objects.get(user=request.user).key
+    session_key = api_sessions.get_page_token(request)
     return render(request=request, template_name='calculators_kr.html' if lang is not None and lang == 'kr' else 'calculators_en.html', context={'at_calculators': True, 'sessionKey': session_key})
 
 
@@ -186,12 +192,13 @@ def handle_param_calculators(request, session_key, calculator, language):
     :param language (str) - possible options are 'en' or 'kr' (lowercase)
     :param request - django default i.e. provided by default
     """
-    if not api_models.SessionKey.objects.filter(key=session_key).exists():
+    user = api_sessions.resolve_user(session_key)
+    if user is None:
         return redirect(to='login')
     if language not in ['en', 'kr'] or calculator not in ['deltoid_test', 'deltoid_result']:
         return redirect(to='login')
 
-    login(request=request, user=api_models.SessionKey.objects.get(key=session_key).user)
+    login(request=request, user=user)
     res = render(request=request, template_name='calculators_kr.html' if language is not None and language == 'kr' else 'calculators_en.html', context={
         'at_calculators': True,
         'sessionKey': session_key,
@@ -230,6 +237,7 @@ def handle_settings(request):
             if request.user.check_password(raw_password=request.POST['oldpassword']):
                 request.user.set_password(request.POST['newpassword'])
                 request.user.save()
+                api_tokens.revoke_tokens(request.user)
         preferences.save()
 
     if lang is None:
@@ -259,8 +267,8 @@ def handle_password_reset(request):
             return redirect(to='login')
         else:
             session_key = request.GET['k']
-        # session_key check
-        if not api_models.SessionKey.objects.filter(key=session_key).exists():
+        # session_key check (a password reset token)
+        if api_sessions.resolve_password_reset_token(session_key) is None:
             return redirect(to='login')
         # render reset password html
         lang = request.COOKIES.get('lang')
@@ -275,17 +283,17 @@ def handle_password_reset(request):
         else:
             session_key = request.POST['sessionKey']
             new_password = request.POST['new_password']
-        # session_key check
-        if not api_models.SessionKey.objects.filter(key=session_key).exists():
+        # session_key check (a password reset token)
+        user = api_sessions.resolve_password_reset_token(session_key)
+        if user is None:
             return redirect(to='login')
-        else:
-            user = api_models.SessionKey.objects.get(key=session_key).user
         # check password length
         if len(new_password) < 4:
             return redirect(to='login')
-        # update password
+        # update password (and revoke previously issued session keys)
         user.set_password(new_password)
         user.save()
+        api_tokens.revoke_tokens(user)
         authenticate(request, username=user.username, password=new_password)
         login(request=request, user=user)
         return redirect(to='login')
@@ -296,30 +304,21 @@ def handle_password_reset(request):
 def handle_add_workout(request):
     try:
         claimed_exercises = json.loads(request.POST['exercises'])
-        exercises = []
+        exercise_registry = api_catalog.get_registry()
+        sets = []
         for exercise in claimed_exercises:
-            if models.Exercise.objects.filter(name=exercise['exerciseName']).exists():
-                exercises += [exercise]
-        if len(exercises) == 0:
+            db_exercise = exercise_registry.get_exercise_by_name(exercise['exerciseName'])
+            if db_exercise is not None:
+                sets += [(db_exercise, float(exercise['liftMass']), int(float(exercise['repetitions'])))]
+        if len(sets) == 0:
             return JsonResponse(data={'success': False, 'error': 'empty or invalid exercises provided'})
     except json.JSONDecodeError or TypeError as e:
         return JsonResponse(data={'success': False, 'error': str(e)})
 
-    # create workout session
-    db_workout = models.WorkoutSession.objects.create(user=request.user, title=request.POST['title'], duration=int(request.POST['duration']))
-    db_workout.save()
-    # create lifts
-    for exercise in exercises:
-        db_exercise = models.Exercise.objects.get(name=exercise['exerciseName'])
-        lift_mass = float(exercise['liftMass'])
-        repetitions = int(float(exercise['repetitions']))
-        models.Lift.objects.create(
-            exercise=db_exercise,
-            workout_session=db_workout,
-            lift_mass=lift_mass,
-            repetitions=repetitions,
-            one_rep_max=Tools.calculate_one_rep_max(lift_mass, repetitions)
-        )
+    # create workout session and its lifts
+    with transaction.atomic():
+        db_workout = models.WorkoutSession.objects.create(user=request.user, title=request.POST['title'], duration=int(request.POST['duration']))
+        models.Lift.bulk_insert(workout_session=db_workout, sets=sets)
 
     return JsonResponse(data={'success': True})
 
@@ -327,76 +326,30 @@ def handle_add_workout(request):
 @login_required
 @require_http_methods(['GET'])
 def handle_calendar(request):
-    if not api_models.SessionKey.objects.filter(user=request.user).exists():
-        session_key = api_models.SessionKey.generate_key(email=request.user.email)
-        while api_models.SessionKey.objects.filter(key=session_key).exists():
-            time.sleep(0.001)
-            session_key = api_models.SessionKey.generate_key(email=request.user.email)
-        api_models.SessionKey.objects.create(user=request.user, key=session_key)
-    else:
-        session_key = api_models.SessionKey.objects.get(user=request.user).key
-    workouts_by_days = {}
-    for db_workout_session in models.WorkoutSession.objects.filter(user=request.user).order_by('-timestamp'):
-        db_lifts = models.Lift.objects.filter(workout_session=db_workout_session).order_by('id')
-        day_str = db_workout_session.get_day_str()
-        for db_lift in db_lifts:
-            if day_str in workouts_by_days:
-                if db_workout_session in workouts_by_days[day_str]:
-                    workouts_by_days[day_str][db_workout_session] += [db_lift]
-                else:
-                    workouts_by_days[day_str][db_workout_session] = [db_lift]
-            else:
-                workouts_by_days[day_str] = {db_workout_session: [db_lift]}
+    session_key = api_sessions.get_page_token(request)
     lang = request.COOKIES.get('lang')
     return render(request=request, template_name='calendar_kr.html' if lang is not None and lang == 'kr' else 'calendar_en.html', context={
         'at_calendar': True,
         'sessionKey': session_key,
-        'exercises': models.Exercise.objects.all(),
-        'workouts_by_days': workouts_by_days
+        'exercises': api_catalog.get_registry().exercises,
     })
 
 
 @login_required
 @require_http_methods(['GET'])
 def handle_favorite_workouts(request):
-    favorite_workout_sessions = models.FavoriteWorkout.objects.filter(user=request.user)
-    # map day->workout->lift
-    temp = {}
-    for favorite_workout in favorite_workout_sessions:
-        db_lifts = models.Lift.objects.filter(workout_session=favorite_workout.workout_session).order_by('id')
-        day_str = favorite_workout.workout_session.get_day_str()
-        for db_lift in db_lifts:
-            if day_str in temp:
-                if favorite_workout.workout_session in temp[day_str]:
-                    temp[day_str][favorite_workout.workout_session] += [db_lift]
-                else:
-                    temp[day_str][favorite_workout.workout_session] = [db_lift]
-            else:
-                temp[day_str] = {favorite_workout.workout_session: [db_lift]}
-    # copy & sort by recency
-    workouts_by_days = []
-    for day_str in temp:
-        workout_sessions = []
-        for workout_session in temp[day_str]:
-            workout_sessions += [(workout_session, temp[day_str][workout_session])]
-        workout_sessions.sort(key=lambda x: x[0].timestamp, reverse=True)
-        workouts_by_days += [(day_str, workout_sessions)]
-    workouts_by_days.sort(key=lambda x: x[0], reverse=True)
-
-    if not api_models.SessionKey.objects.filter(user=request.user).exists():
-        session_key = api_models.SessionKey.generate_key(email=request.user.email)
-        while api_models.SessionKey.objects.filter(key=session_key).exists():
-            time.sleep(0.001)
-            session_key = api_models.SessionKey.generate_key(email=request.user.email)
-        api_models.SessionKey.objects.create(user=request.user, key=session_key)
-    else:
-        session_key = api_models.SessionKey.objects.get(user=request.user).key
+    favorite_workout_sessions = models.WorkoutSession.objects.filter(user=request.user, favoriteworkout__user=request.user)
+    timeline_by_days, timeline_before = timeline.build_timeline(favorite_workout_sessions)
+    workouts_by_days = [(day_str, list(workout_sessions.items())) for day_str, workout_sessions in timeline_by_days.items()]
+
+    session_key = api_sessions.get_page_token(request)
     lang = request.COOKIES.get('lang')
     return render(request=request, template_name='favoriteWorkouts_kr.html' if lang is not None and lang == 'kr' else 'favoriteWorkouts_en.html', context={
         'at_home': True,
         'sessionKey': session_key,
-        'exercises': models.Exercise.objects.all(),
+        'exercises': api_catalog.get_registry().exercises,
         'workouts_by_days': workouts_by_days,
+        'timeline_before': timeline_before,
     })
 
 
@@ -408,34 +361,20 @@ def handle_report(request):
         return redirect(to='calculators')
 
     # allowed percentage range [10%, 90%] region
-    def get_percentile(arr, threshold):
-        arr = np.array(arr)
-        return 10 + (sum(arr <= threshold) / len(arr)) * 72
+    def get_percentile(ratio):
+        return 10 + ratio * 72
 
     def float2str(number):
         return f'{number:.1f}'.replace('.0', '')
 
-    # region load all values
-    shoulder_values = []
-    chest_values = []
-    back_values = []
-    abs_values = []
-    legs_values = []
-    for item in models.OneRepMaxResults.objects.all():
-        shoulder_values += [item.shoulder]
-        chest_values += [item.chest]
-        back_values += [item.back]
-        abs_values += [item.abs]
-        legs_values += [item.legs]
-    # endregion
-
-    # region compute percentiles
+    # region compute percentiles (binary search over the cached sorted scores)
     last_res = results.order_by('-timestamp').first()
-    shoulder_percentile = get_percentile(shoulder_values, last_res.shoulder)
-    chest_percentile = get_percentile(chest_values, last_res.chest)
-    back_percentile = get_percentile(back_values, last_res.back)
-    abs_percentile = get_percentile(abs_values, last_res.abs)
-    legs_percentile = get_percentile(legs_values, last_res.legs)
+    ratios = percentiles.get_ratios(last_res)
+    shoulder_percentile = get_percentile(ratios['shoulder'])
+    chest_percentile = get_percentile(ratios['chest'])
+    back_percentile = get_percentile(ratios['back'])
+    abs_percentile = get_percentile(ratios['abs'])
+    legs_percentile = get_percentile(ratios['legs'])
     # endregion
 
     # region gather score history
@@ -523,11 +462,11 @@ def handle_workout_photo_card(request, session_key, workout_id, language):
     :param language (str) - possible options are 'en' or 'kr' (lowercase)
     :param request - django default i.e. provided by default
     """
-    if not api_models.SessionKey.objects.filter(key=session_key).exists():
+    user = api_sessions.resolve_user(session_key)
+    if user is None:
         return redirect(to='login')
     if language not in ['en', 'kr']:
         return redirect(to='login')
-    user = api_models.SessionKey.objects.get(key=session_key).user
     login(request=request, user=user)
     if not models.WorkoutSession.objects.filter(user=user, id=workout_id):
         return redirect(to='index')